@@ -1,26 +1,163 @@
 import os
 import secrets
-from unittest import result
-from flask import Flask, render_template, request, flash, redirect, url_for, session, send_file
+from flask import Flask, render_template, request, flash, redirect, url_for, session, send_file, abort, Response, stream_with_context, jsonify, g
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_
-from models import db, StockItem, StockInventory, ScaleEntry, RasanRecord
-import pandas as pd
 from io import BytesIO
-from export import ReportExporter
+from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
+from models import db, StockItem, StockInventory, ScaleEntry, RasanRecord, DailyBalance, PeriodAggregate
+from export import ReportExporter, AllItemsReportExporter, ExcelLedgerWriter, stream_csv, stream_ndjson, stream_rollup_csv
+from ledger import build_daily_ledger, build_stock_matrix, DAY_NAMES
+from balances import refresh_daily_balances, refresh_all_daily_balances, backfill_daily_balances
+from scale_index import invalidate_scale_index
+from migrations import upgrade_database
+from sqlite_profile import engine_options, apply_profile, write_transaction
+from pagination import KeysetPage, decode_cursor, cached_count
+from instrumentation import RequestMetrics, install_instrumentation, query_budget
+from data_versions import bump_versions, get_versions, report_scopes, report_version
+from conditional import conditional, code_version
+from compression import install_compression
+from facilities import FACILITY_ENVIRON_KEY, FacilityPrefix, check_facility_names, current_facility, parse_facilities, use_facility
+from district import DistrictReports, facility_movement, facility_rollups, facility_stock, merge_movement, merge_rollups, merge_stock
+from report_cache import ReportCache
+from export_jobs import ExportJobQueue, JOB_FORMATS
+from dashboard import current_stock
+from rollups import PERIODS, load_rollups, invalidate_rollups, period_bounds, period_label, period_start
+from forecast import StockForecast, FORECAST_METHODS, DEFAULT_HORIZON, DEFAULT_HISTORY_DAYS
+from importer import ImportResult, read_upload, import_head_counts, import_stock_receipts, upsert_head_counts, upsert_stock_movements, HEAD_COUNT_FIELDS, MAX_UPSERT_RECORDS
 
 # Initialize Flask application
 app = Flask(__name__)
 
 # Configure application settings
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')  # Secret key for session management
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rasan.db'  # Database URI
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///rasan.db')  # Database URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Disable modification tracking
+app.config['DATABASE_PROFILE'] = os.getenv('DATABASE_PROFILE', 'production')  # WAL + pragmas; 'default' to disable
+app.config['FACILITIES'] = parse_facilities(os.getenv('FACILITIES'), app.instance_path)  # {name: database URI}; empty = one database
+app.config['DISTRICT_WORKERS'] = int(os.getenv('DISTRICT_WORKERS', os.cpu_count() or 1))  # Processes computing district reports
+# Facility mode: the first facility is the default database, the others are binds named after them
+if app.config['FACILITIES']:
+    os.makedirs(app.instance_path, exist_ok=True)
+    facility_uris = list(app.config['FACILITIES'].values())
+    app.config['SQLALCHEMY_DATABASE_URI'] = facility_uris[0]
+    app.config['SQLALCHEMY_BINDS'] = {
+        name: dict(engine_options(app.config['DATABASE_PROFILE'], uri), url=uri)
+        for name, uri in list(app.config['FACILITIES'].items())[1:]
+    }
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['DATABASE_PROFILE'], app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['REPORT_CACHE_MAX_ENTRIES'] = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', 128))  # Cached reports kept per worker
+app.config['REPORT_CACHE_MAX_BYTES'] = int(os.getenv('REPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # Cache size bound
+app.config['REPORT_CACHE_PATH'] = os.getenv('REPORT_CACHE_PATH')  # Optional SQLite file shared by workers
+app.config['EXPORT_JOB_WORKERS'] = int(os.getenv('EXPORT_JOB_WORKERS', 2))  # Background exports run at once
+app.config['EXPORT_JOB_MAX_AGE'] = int(os.getenv('EXPORT_JOB_MAX_AGE', 24 * 3600))  # Seconds artifacts are kept
+app.config['LIST_PER_PAGE'] = int(os.getenv('LIST_PER_PAGE', 10))  # Rows per list page
+app.config['LIST_TOTAL_COUNTS'] = os.getenv('LIST_TOTAL_COUNTS', '1') == '1'  # Show cached row totals on list pages
+app.config['LOW_STOCK_DAYS'] = float(os.getenv('LOW_STOCK_DAYS', 7))  # Days of cover below which an item is flagged low
+app.config['QUERY_BUDGET_STRICT'] = os.getenv('QUERY_BUDGET_STRICT') == '1'  # Raise instead of log when a view overruns
+app.config['INSTRUMENTATION_SAMPLE_RATE'] = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 0.01))  # Share of requests timed in detail
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 100))  # Sampled statements slower than this are logged
+app.config['ETAG_SALT'] = os.getenv('ETAG_SALT') or code_version(app.root_path)  # Part of every ETag; changes on deploy
+app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', 1024))  # Smaller text responses are sent as is
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))  # gzip level, 1 (fast) to 9 (small)
+app.config['REPORT_INLINE_DAYS'] = int(os.getenv('REPORT_INLINE_DAYS', 92))  # Longer reports load their rows as JSON
+app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))  # Reverse proxies in front of the app (nginx = 1)
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # Bearer token for /metrics from anywhere; unset = local only
 db.init_app(app)  # Initialize SQLAlchemy with Flask app
 
+# Computed reports keyed by (item, range, format, data version)
+report_cache = ReportCache(
+    max_entries=app.config['REPORT_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['REPORT_CACHE_MAX_BYTES'],
+    path=app.config['REPORT_CACHE_PATH'],
+    namespace=current_facility  # Item ids and versions repeat across facility databases
+)
+
+# Request counts and latencies for /metrics, per worker process
+request_metrics = RequestMetrics()
+
+# Large exports run in the background; artifacts are kept under instance/exports
+export_jobs = ExportJobQueue(
+    app,
+    os.path.join(app.instance_path, 'exports'),
+    max_workers=app.config['EXPORT_JOB_WORKERS'],
+    max_age=app.config['EXPORT_JOB_MAX_AGE']
+)
+
+# (facility, engine) pairs; a single (None, engine) pair without FACILITIES
+def facility_engines():
+    return [(name, db.engines.get(name, db.engine)) for name in app.config['FACILITIES'] or [None]]
+
 # Create database tables if they don't exist
 with app.app_context():
-    db.create_all()
+    for _, engine in facility_engines():
+        apply_profile(engine, app.config['DATABASE_PROFILE'])  # Before the first connection is made
+    install_instrumentation(app, [engine for _, engine in facility_engines()], request_metrics)
+    install_compression(app)
+    for facility, engine in facility_engines():
+        with use_facility(facility):
+            db.metadata.create_all(engine)
+            upgrade_database(db, engine)  # Apply schema changes create_all can't make to an existing file
+            backfill_daily_balances()
+    # District reports run across every facility database on a process pool
+    district = DistrictReports(
+        {name: engine.url.render_as_string(hide_password=False) for name, engine in facility_engines()},
+        app.config['DATABASE_PROFILE'],
+        app.config['DISTRICT_WORKERS']
+    ) if app.config['FACILITIES'] else None
+
+# Each facility is served under /<name>/; unprefixed paths belong to the first one
+if app.config['FACILITIES']:
+    app.wsgi_app = FacilityPrefix(app.wsgi_app, app.config['FACILITIES'])
+
+# Behind trusted proxies the client address comes from X-Forwarded-For
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+@app.before_request
+def select_facility():
+    g.facility = request.environ.get(FACILITY_ENVIRON_KEY, next(iter(app.config['FACILITIES']), None))
+
+@app.context_processor
+def facility_context():
+    # Links to other facilities are made from the root the facility prefix was added to
+    root = request.script_root
+    if FACILITY_ENVIRON_KEY in request.environ:
+        root = root[:-len(request.environ[FACILITY_ENVIRON_KEY]) - 1]
+    return {'facilities': list(app.config['FACILITIES']), 'facility': current_facility(), 'facility_root': root}
+
+# Keep derived ledger data in step with writes (call before commit)
+def ledger_changed(table, from_date, item_ids=None):
+    if item_ids is None:
+        refresh_all_daily_balances(from_date)
+    else:
+        refresh_daily_balances(set(item_ids), from_date)
+    invalidate_rollups(from_date, item_ids)
+    bump_versions(table, item_ids)
+
+def report_key(item_id, start_date, end_date, fmt):
+    return (item_id, start_date.isoformat(), end_date.isoformat(), fmt, report_version(item_id))
+
+def cached_export(fmt, item_id, start_date, end_date, build):
+    """Serve an export from the report cache, building and caching it on a miss"""
+    key = report_key(item_id, start_date, end_date, fmt)
+    hit = report_cache.get(key)
+    if hit is not None:
+        filename, data = hit
+        return BytesIO(data), filename
+    
+    output, filename = build()
+    # Small files are cached; large ones keep streaming from their temp file
+    size = output.seek(0, 2)
+    output.seek(0)
+    if not report_cache.accepts(size):
+        return output, filename
+    data = output.read()
+    output.close()
+    report_cache.set(key, (filename, data))
+    return BytesIO(data), filename
 
 # Helper function to apply date filters to queries (not implemented in this snippet)
 def get_date_filters(query):
@@ -28,8 +165,17 @@ def get_date_filters(query):
 
 # Route for the home page
 @app.route('/')
+@query_budget(2)
+@conditional(['ledger'], daily=True)
 def index():
-    return render_template('index.html')
+    today = datetime.now().date()
+    # Recomputed only after a write that can change some balance
+    version = get_versions(['ledger'])['ledger']
+    stock = report_cache.get_or_compute(
+        ('dashboard', today.isoformat(), app.config['LOW_STOCK_DAYS'], version),
+        lambda: current_stock(today, app.config['LOW_STOCK_DAYS'])
+    )
+    return render_template('index.html', stock=stock, today=today, low_stock_days=app.config['LOW_STOCK_DAYS'])
 
 # Routes for KEDI (Kitchen and Dining) management
 def get_date_filters(query):
@@ -44,19 +190,66 @@ def get_date_filters(query):
     
     return query
 
+# Keyset page of a list, newest first, with the cached total when enabled
+def list_page(query, model, table, filters):
+    pagination = KeysetPage(
+        query, model.date, model.id,
+        per_page=app.config['LIST_PER_PAGE'],
+        after=decode_cursor(request.args.get('after')),
+        before=decode_cursor(request.args.get('before'))
+    )
+    if app.config['LIST_TOTAL_COUNTS']:
+        pagination.total = cached_count(report_cache, table, filters, query)
+    return pagination
+
 @app.route('/kedi')
+@query_budget(3)
+@conditional(['rasan_record'])
 def kedi():
-    page = request.args.get('page', 1, type=int)
-    # Create a query object first, then apply order_by
-    query = RasanRecord.query.order_by(RasanRecord.date.desc())
-    # Apply date filters if you have any (assuming get_date_filters modifies a query)
-    query = get_date_filters(query)
-    pagination = query.paginate(page=page, per_page=10)
+    # Apply date filters, then page on (date, id)
+    query = get_date_filters(RasanRecord.query)
+    filters = (request.args.get('start_date'), request.args.get('end_date'))
+    pagination = list_page(query, RasanRecord, 'rasan_record', filters)
     return render_template('kedi/list.html',
                          records=pagination.items,
                          pagination=pagination)
 
+# Bulk imports: validate and insert uploaded rows in batches, then refresh the ledger once
+def bulk_import(run_import, table, title, columns, back_endpoint, all_items=False):
+    result = None
+    if request.method == 'POST':
+        result = ImportResult()
+        try:
+            run_import(read_upload(request.files['file']), result=result)
+        except Exception as e:
+            db.session.rollback()
+            result.error = str(e)
+        # Batches are committed as they go, so rows stored before an error need the ledger refresh too
+        if result.imported:
+            ledger_changed(table, result.first_date, None if all_items else result.item_ids)
+            db.session.commit()
+        if result.error is not None:
+            flash(f'Import failed: {result.error}. {result.imported} rows were imported before the error.',
+                  'danger')
+        else:
+            flash(f'Imported {result.imported} rows, {result.failed} rejected.',
+                  'success' if not result.failed else 'warning')
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(result.to_dict())
+    return render_template('import.html',
+                         title=title,
+                         columns=columns,
+                         back_url=url_for(back_endpoint),
+                         result=result.to_dict() if result else None)
+
+@app.route('/kedi/import', methods=['GET', 'POST'])
+@write_transaction(db)
+def import_kedi():
+    return bulk_import(import_head_counts, 'rasan_record', 'Import Rasan Records',
+                       ['date'] + HEAD_COUNT_FIELDS, 'kedi', all_items=True)
+
 @app.route('/kedi/add', methods=['GET', 'POST'])
+@write_transaction(db)
 def add_kedi():
     if request.method == 'POST':
         try:
@@ -64,12 +257,7 @@ def add_kedi():
             date_str = request.form['date']
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
             
-            # Check for duplicate records for the same date
-            if RasanRecord.query.filter_by(date=date).first():
-                flash('A record for this date already exists!', 'danger')
-                return redirect(url_for('add_kedi'))
-            
-            # Create new KEDI record
+            # Create new KEDI record; the unique date constraint rejects duplicates
             record = RasanRecord(
                 date=date,
                 kedi_m=int(request.form['kedi_m']),  # Male prisoners in KEDI
@@ -81,15 +269,21 @@ def add_kedi():
             )
             
             db.session.add(record)
+            ledger_changed('rasan_record', date)
             db.session.commit()
             flash('Record added successfully!', 'success')
             return redirect(url_for('kedi'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('A record for this date already exists!', 'danger')
+            return redirect(url_for('add_kedi'))
         except ValueError:
             flash('Invalid date or number format!', 'danger')
     
     return render_template('kedi/add.html')
 
 @app.route('/kedi/edit/<int:id>', methods=['GET', 'POST'])
+@write_transaction(db)
 def edit_kedi(id):
     # Get record by ID or return 404 if not found
     record = RasanRecord.query.get_or_404(id)
@@ -104,6 +298,7 @@ def edit_kedi(id):
             record.medical_m = int(request.form['medical_m'])
             record.medical_f = int(request.form['medical_f'])
             
+            ledger_changed('rasan_record', record.date)
             db.session.commit()
             flash('Record updated successfully!', 'success')
             return redirect(url_for('kedi'))
@@ -113,22 +308,27 @@ def edit_kedi(id):
     return render_template('kedi/edit.html', record=record)
 
 @app.route('/kedi/delete/<int:id>')
+@write_transaction(db, methods=('GET',))
 def delete_kedi(id):
     # Delete record by ID
     record = RasanRecord.query.get_or_404(id)
     db.session.delete(record)
+    ledger_changed('rasan_record', record.date)
     db.session.commit()
     flash('Record deleted successfully!', 'success')
     return redirect(url_for('kedi'))
 
 # Routes for Stock Items management
 @app.route('/stock_items')
+@query_budget(2)
+@conditional(['stock_item'])
 def stock_items():
     # List all stock items ordered by name
     items = StockItem.query.order_by(StockItem.item_name).all()
     return render_template('stock_items/list.html', items=items)
 
 @app.route('/stock_items/add', methods=['GET', 'POST'])
+@write_transaction(db)
 def add_stock_item():
     if request.method == 'POST':
         try:
@@ -139,6 +339,8 @@ def add_stock_item():
                 unit=request.form['unit']  # Measurement unit (kg, liter, etc.)
             )
             db.session.add(item)
+            db.session.flush()
+            bump_versions('stock_item', [item.id])
             db.session.commit()
             flash('Stock item added successfully!', 'success')
             return redirect(url_for('stock_items'))
@@ -148,6 +350,7 @@ def add_stock_item():
     return render_template('stock_items/add.html')
 
 @app.route('/stock_items/edit/<int:id>', methods=['GET', 'POST'])
+@write_transaction(db)
 def edit_stock_item(id):
     # Get stock item by ID
     item = StockItem.query.get_or_404(id)
@@ -157,6 +360,7 @@ def edit_stock_item(id):
             item.item_name = request.form['item_name']
             item.description = request.form.get('description', '')
             item.unit = request.form['unit']
+            bump_versions('stock_item', [item.id])
             db.session.commit()
             flash('Stock item updated successfully!', 'success')
             return redirect(url_for('stock_items'))
@@ -166,24 +370,33 @@ def edit_stock_item(id):
     return render_template('stock_items/edit.html', item=item)
 
 @app.route('/stock_items/delete/<int:id>')
+@write_transaction(db, methods=('GET',))
 def delete_stock_item(id):
     # Delete stock item by ID
     item = StockItem.query.get_or_404(id)
+    DailyBalance.query.filter_by(stock_item_id=id).delete(synchronize_session=False)
+    PeriodAggregate.query.filter_by(stock_item_id=id).delete(synchronize_session=False)
+    invalidate_scale_index(id)
     db.session.delete(item)
+    bump_versions('stock_item', [id])
     db.session.commit()
     flash('Stock item deleted successfully!', 'success')
     return redirect(url_for('stock_items'))
 
 # Routes for Stock Inventory management
 @app.route('/stock_inventory')
+@query_budget(5)
+@conditional(['stock_inventory', 'stock_item'])
 def stock_inventory():
     # List inventory with pagination and filtering options
-    page = request.args.get('page', 1, type=int)
     item_id = request.args.get('item_id', type=int)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = StockInventory.query.order_by(StockInventory.date.desc())
+    # Rows carry their item's name and unit from the same query
+    query = StockInventory.query.options(
+        joinedload(StockInventory.stock_item).load_only(StockItem.item_name, StockItem.unit)
+    )
     
     # Apply filters if provided
     if item_id:
@@ -197,7 +410,7 @@ def stock_inventory():
     if end_date:
         query = query.filter(StockInventory.date <= end_date)
     
-    pagination = query.paginate(page=page, per_page=10)
+    pagination = list_page(query, StockInventory, 'stock_inventory', (item_id, start_date, end_date))
     all_items = StockItem.query.order_by(StockItem.item_name).all()
     
     return render_template('stock_inventory/list.html',
@@ -207,6 +420,7 @@ def stock_inventory():
                          selected_item=selected_item)
 
 @app.route('/stock_inventory/add', methods=['GET', 'POST'])
+@write_transaction(db)
 def add_stock_inventory():
     # Get all stock items for dropdown
     stock_items = StockItem.query.order_by(StockItem.item_name).all()
@@ -221,6 +435,7 @@ def add_stock_inventory():
                 notes=request.form.get('notes', '')  # Optional notes
             )
             db.session.add(entry)
+            ledger_changed('stock_inventory', entry.date, [entry.stock_item_id])
             db.session.commit()
             flash('Stock entry added successfully!', 'success')
             return redirect(url_for('stock_inventory'))
@@ -230,6 +445,7 @@ def add_stock_inventory():
     return render_template('stock_inventory/add.html', stock_items=stock_items)
 
 @app.route('/stock_inventory/edit/<int:id>', methods=['GET', 'POST'])
+@write_transaction(db)
 def edit_stock_inventory(id):
     # Get inventory entry by ID
     entry = StockInventory.query.get_or_404(id)
@@ -237,11 +453,15 @@ def edit_stock_inventory(id):
     
     if request.method == 'POST':
         try:
+            # Remember where the entry was so both old and new days get rebalanced
+            old_item_id, old_date = entry.stock_item_id, entry.date
+            
             # Update entry fields
             entry.stock_item_id = int(request.form['stock_item'])
             entry.quantity = float(request.form['quantity'])
             entry.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
             entry.notes = request.form.get('notes', '')
+            ledger_changed('stock_inventory', min(old_date, entry.date), [old_item_id, entry.stock_item_id])
             db.session.commit()
             flash('Stock entry updated successfully!', 'success')
             return redirect(url_for('stock_inventory'))
@@ -251,33 +471,49 @@ def edit_stock_inventory(id):
     return render_template('stock_inventory/edit.html', entry=entry, stock_items=stock_items)
 
 @app.route('/stock_inventory/delete/<int:id>')
+@write_transaction(db, methods=('GET',))
 def delete_stock_inventory(id):
     # Delete inventory entry by ID
     entry = StockInventory.query.get_or_404(id)
     db.session.delete(entry)
+    ledger_changed('stock_inventory', entry.date, [entry.stock_item_id])
     db.session.commit()
     flash('Stock entry deleted successfully!', 'success')
     return redirect(url_for('stock_inventory'))
 
 @app.route('/stock_inventory/item/<int:item_id>')
+@query_budget(3)
+@conditional(lambda item_id: [f'item:{item_id}'])
 def stock_inventory_by_item(item_id):
-    # Show inventory entries for a specific item
+    # Show inventory entries for a specific item (the template only needs these columns)
     item = StockItem.query.get_or_404(item_id)
     inventory = StockInventory.query.filter_by(stock_item_id=item_id)\
+                   .options(load_only(StockInventory.date, StockInventory.quantity, StockInventory.notes))\
                    .order_by(StockInventory.date.desc())\
                    .all()
     return render_template('stock_inventory/list_by_item.html', 
                          inventory=inventory, 
                          item=item)
 
+@app.route('/stock_inventory/import', methods=['GET', 'POST'])
+@write_transaction(db)
+def import_stock_inventory():
+    return bulk_import(import_stock_receipts, 'stock_inventory', 'Import Stock Receipts',
+                       ['item', 'quantity', 'date', 'notes', 'ref'], 'stock_inventory')
+
 # Routes for Scale management (daily ration scales)
 @app.route('/scale')
+@query_budget(2)
+@conditional(['scale_entry', 'stock_item'])
 def scale_list():
-    # List all scale entries
-    entries = ScaleEntry.query.all()
+    # List all scale entries with their item's name and unit in one query
+    entries = ScaleEntry.query.options(
+        joinedload(ScaleEntry.stock_item).load_only(StockItem.item_name, StockItem.unit)
+    ).all()
     return render_template('scale/scale_list.html', entries=entries)
 
 @app.route('/scale/add', methods=['GET', 'POST'])
+@write_transaction(db)
 def add_scale():
     # Get all stock items for dropdown
     stock_items = StockItem.query.all()
@@ -314,6 +550,8 @@ def add_scale():
             )
             
             db.session.add(entry)
+            invalidate_scale_index(stock_item_id)
+            ledger_changed('scale_entry', start_date, [stock_item_id])
             db.session.commit()
             flash('Scale entry added successfully!', 'success')
             return redirect(url_for('scale_list'))
@@ -324,6 +562,7 @@ def add_scale():
     return render_template('scale/add_scale.html', stock_items=stock_items)
 
 @app.route('/scale/edit/<int:id>', methods=['GET', 'POST'])
+@write_transaction(db)
 def edit_scale(id):
     # Get scale entry by ID
     entry = ScaleEntry.query.get_or_404(id)
@@ -347,6 +586,7 @@ def edit_scale(id):
                 return redirect(url_for('edit_scale', id=id))
             
             # Update scale entry fields
+            old_start_date = entry.start_date
             entry.start_date = start_date
             entry.end_date = end_date
             entry.monday = float(request.form['monday'])
@@ -357,6 +597,8 @@ def edit_scale(id):
             entry.saturday = float(request.form['saturday'])
             entry.sunday = float(request.form['sunday'])
             
+            invalidate_scale_index(entry.stock_item_id)
+            ledger_changed('scale_entry', min(old_start_date, start_date), [entry.stock_item_id])
             db.session.commit()
             flash('Scale entry updated successfully!', 'success')
             return redirect(url_for('scale_list'))
@@ -367,118 +609,79 @@ def edit_scale(id):
     return render_template('scale/edit_scale.html', entry=entry, stock_items=stock_items)
 
 @app.route('/scale/delete/<int:id>')
+@write_transaction(db, methods=('GET',))
 def delete_scale(id):
     # Delete scale entry by ID
     entry = ScaleEntry.query.get_or_404(id)
     db.session.delete(entry)
+    invalidate_scale_index(entry.stock_item_id)
+    ledger_changed('scale_entry', entry.start_date, [entry.stock_item_id])
     db.session.commit()
     flash('Scale entry deleted successfully!', 'success')
     return redirect(url_for('scale_list'))
+# Reports and exports depend on the selected item's ledger and on the item names
+def report_page_scopes():
+    return report_scopes(request.values.get('item_id', 'all')) + ['stock_item']
+
 # Add new routes after existing ones
 @app.route('/daily_stock_movement', methods=['GET', 'POST'])
+@query_budget(7)
+@conditional(report_page_scopes)
 def daily_stock_movement():
-    if request.method == 'POST':
+    # Reports are plain GET links so terminals can refresh them; POST is kept for old forms
+    if 'start_date' in request.values:
         try:
             # Get form inputs
-            start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
-            end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
-            item_id = int(request.form['item_id'])
-            
-            # Get the selected item
-            item = StockItem.query.get_or_404(item_id)
-            
-            # Initialize results dictionary
-            results = []
-            
-            # Get scale entries that cover our date range - properly ordered
-            scale_entries = ScaleEntry.query.filter(
-                ScaleEntry.stock_item_id == item_id,
-                ScaleEntry.start_date <= end_date,
-                ScaleEntry.end_date >= start_date
-            ).order_by(ScaleEntry.start_date).all()
+            start_date = datetime.strptime(request.values['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.values['end_date'], '%Y-%m-%d').date()
             
-            # Get all inventory transactions for the item - properly ordered
-            inventory_transactions = StockInventory.query.filter(
-                StockInventory.stock_item_id == item_id,
-                StockInventory.date.between(start_date, end_date)
-            ).order_by(StockInventory.date).all()
+            # Get all items for dropdown
+            all_items = StockItem.query.order_by(StockItem.item_name).all()
             
-            # Get all prisoner records for the date range - properly ordered
-            prisoner_records = RasanRecord.query.filter(
-                RasanRecord.date.between(start_date, end_date)
-            ).order_by(RasanRecord.date).all()
+            # All items mode - one items x days matrix, rendered as a summary
+            if request.values['item_id'] == 'all':
+                def compute_summary():
+                    matrix = build_stock_matrix(all_items, start_date, end_date)
+                    # Cache plain rows; ORM items are re-attached below
+                    return [dict(row, item=row['item'].id) for row in matrix.summaries()]
+                
+                rows = report_cache.get_or_compute(report_key('all', start_date, end_date, 'html'), compute_summary)
+                items_by_id = {item.id: item for item in all_items}
+                summary = [dict(row, item=items_by_id[row['item']]) for row in rows if row['item'] in items_by_id]
+                return render_template('daily_stock_movement/report.html',
+                                   summary=summary,
+                                   all_items=all_items,
+                                   all_selected=True,
+                                   start_date=start_date.strftime('%Y-%m-%d'),
+                                   end_date=end_date.strftime('%Y-%m-%d'))
             
-            # Create a date range
-            date_range = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_range.append(current_date)
-                current_date += timedelta(days=1)
+            # Get the selected item
+            item = StockItem.query.get_or_404(int(request.values['item_id']))
             
-            # Calculate opening balance from transactions before start date
-            opening_balance_query = db.session.query(
-                func.sum(StockInventory.quantity).label('total')
-            ).filter(
-                StockInventory.stock_item_id == item_id,
-                StockInventory.date < start_date
-            )
+            # Long ranges: the page carries the totals and the browser fetches and draws the rows
+            if (end_date - start_date).days + 1 > app.config['REPORT_INLINE_DAYS']:
+                data = ledger_data(item, start_date, end_date)
+                return render_template('daily_stock_movement/report.html',
+                                   totals=data['totals'],
+                                   day_count=data['days'],
+                                   day_names=DAY_NAMES,
+                                   data_url=url_for('api_daily_stock_movement', item_id=item.id,
+                                                    start_date=start_date.isoformat(), end_date=end_date.isoformat()),
+                                   all_items=all_items,
+                                   selected_item=item,
+                                   start_date=start_date.strftime('%Y-%m-%d'),
+                                   end_date=end_date.strftime('%Y-%m-%d'))
             
-            opening_balance_result = opening_balance_query.first()
-            opening_balance = opening_balance_result[0] if opening_balance_result[0] else 0.0
-            
-            for day_date in date_range:
-                # Initialize daily record
-                day_record = {
-                    'date': day_date,
-                    'day_name': day_date.strftime('%A'),
-                    'opening_balance': opening_balance,
-                    'incoming_stock': 0.0,
-                    'total_stock': opening_balance,
-                    'kedi_total': 0,
-                    'scale_value': 0.0,
-                    'consumption': 0.0,
-                    'closing_balance': opening_balance
-                }
-                
-                # Add incoming stock for this date
-                for transaction in inventory_transactions:
-                    if transaction.date == day_date:
-                        day_record['incoming_stock'] += transaction.quantity
-                
-                # Calculate total available stock
-                day_record['total_stock'] = day_record['opening_balance'] + day_record['incoming_stock']
-                
-                # Get prisoner count for this date
-                prisoner_record = next((r for r in prisoner_records if r.date == day_date), None)
-                if prisoner_record:
-                    # Calculate total prisoners (KEDI - (Tifin + Medical))
-                    day_record['kedi_total'] = (prisoner_record.kedi_m + prisoner_record.kedi_f) - \
-                                             (prisoner_record.tifin_m + prisoner_record.tifin_f + 
-                                              prisoner_record.medical_m + prisoner_record.medical_f)
-                
-                # Get scale value for this day of week
-                for scale in scale_entries:
-                    if scale.start_date <= day_date <= scale.end_date:
-                        day_record['scale_value'] = getattr(scale, day_record['day_name'].lower(), 0.0)
-                        break
-                
-                # Calculate consumption
-                day_record['consumption'] = day_record['kedi_total'] * day_record['scale_value']
-                
-                # Calculate closing balance
-                day_record['closing_balance'] = day_record['total_stock'] - day_record['consumption']
-                
-                # Add to results
-                results.append(day_record)
-                
-                # Set opening balance for next day
-                opening_balance = day_record['closing_balance']
-            
-            # Get all items for dropdown
-            all_items = StockItem.query.order_by(StockItem.item_name).all()
+            # Compute the day-by-day ledger, or reuse it if nothing changed since
+            def compute_ledger():
+                ledger = build_daily_ledger(item, start_date, end_date)
+                return {'results': list(ledger.records()), 'totals': ledger.totals()}
             
+            report = report_cache.get_or_compute(report_key(item.id, start_date, end_date, 'html'), compute_ledger)
             return render_template('daily_stock_movement/report.html',
-                               results=results,
+                               results=report['results'],
+                               totals=report['totals'],
+                               day_count=len(report['results']),
                                all_items=all_items,
                                selected_item=item,
                                start_date=start_date.strftime('%Y-%m-%d'),
@@ -493,132 +696,70 @@ def daily_stock_movement():
     return render_template('daily_stock_movement/report.html',
                          all_items=all_items)
 
-@app.route('/export_daily_stock_movement', methods=['POST'])
-def export_daily_stock_movement():
-    try:
-        # Get form inputs
-        start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
-        end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
-        item_id = int(request.form['item_id'])
-        
-        # Get the selected item
-        item = StockItem.query.get_or_404(item_id)
-        
-        # Get all required data
-        scale_entries = ScaleEntry.query.filter(
-            ScaleEntry.stock_item_id == item_id,
-            ScaleEntry.start_date <= end_date,
-            ScaleEntry.end_date >= start_date
-        ).order_by(ScaleEntry.start_date).all()
-
-        inventory_transactions = StockInventory.query.filter(
-            StockInventory.stock_item_id == item_id,
-            StockInventory.date.between(start_date, end_date)
-        ).order_by(StockInventory.date).all()
-
-        prisoner_records = RasanRecord.query.filter(
-            RasanRecord.date.between(start_date, end_date)
-        ).order_by(RasanRecord.date).all()
-
-        # Calculate opening balance
-        opening_balance = db.session.query(
-            func.sum(StockInventory.quantity).label('total')
-        ).filter(
-            StockInventory.stock_item_id == item_id,
-            StockInventory.date < start_date
-        ).scalar() or 0.0
-
-        # Process daily records
-        records = []
-        current_date = start_date
-        while current_date <= end_date:
-            day_record = {
-                'date': current_date,
-                'day_name': current_date.strftime('%A'),
-                'opening_balance': float(opening_balance),
-                'incoming_stock': 0.0,
-                'total_stock': float(opening_balance),
-                'kedi_total': 0,
-                'scale_value': 0.0,
-                'consumption': 0.0,
-                'closing_balance': float(opening_balance)
-            }
-
-            # Calculate incoming stock
-            for transaction in inventory_transactions:
-                if transaction.date == current_date:
-                    day_record['incoming_stock'] += float(transaction.quantity)
-
-            day_record['total_stock'] = day_record['opening_balance'] + day_record['incoming_stock']
-
-            # Calculate prisoner count
-            prisoner_record = next((r for r in prisoner_records if r.date == current_date), None)
-            if prisoner_record:
-                day_record['kedi_total'] = (prisoner_record.kedi_m + prisoner_record.kedi_f) - \
-                                         (prisoner_record.tifin_m + prisoner_record.tifin_f + 
-                                          prisoner_record.medical_m + prisoner_record.medical_f)
-
-            # Get scale value
-            for scale in scale_entries:
-                if scale.start_date <= current_date <= scale.end_date:
-                    day_record['scale_value'] = float(getattr(scale, day_record['day_name'].lower(), 0.0))
-                    break
-
-            day_record['consumption'] = day_record['kedi_total'] * day_record['scale_value']
-            day_record['closing_balance'] = day_record['total_stock'] - day_record['consumption']
-
-            records.append(day_record)
-            opening_balance = day_record['closing_balance']
-            current_date += timedelta(days=1)
-
-        # Create DataFrame
-        df = pd.DataFrame.from_records(records)
-        
-        # Add totals row (excluding date and day_name columns)
-        totals = pd.DataFrame({
-            'date': ['Total'],
-            'day_name': [''],
-            'opening_balance': [df['opening_balance'].iloc[0]],  # First day's opening
-            'incoming_stock': [df['incoming_stock'].sum()],
-            'total_stock': [''],
-            'kedi_total': [df['kedi_total'].sum()],
-            'scale_value': [''],
-            'consumption': [df['consumption'].sum()],
-            'closing_balance': [df['closing_balance'].iloc[-1]]  # Last day's closing
-        })
-        df = pd.concat([df, totals], ignore_index=True)
-
-        # Format and rename columns
-        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
-        column_mapping = {
-            'date': 'Date',
-            'day_name': 'Day',
-            'opening_balance': 'Opening Balance',
-            'incoming_stock': 'Incoming Stock',
-            'total_stock': 'Total Stock',
-            'kedi_total': 'Prisoners Count',
-            'scale_value': 'Scale Value',
-            'consumption': 'Daily Consumption',
-            'closing_balance': 'Closing Balance'
+# The report as JSON: one list per daily column for an item, or one summary row per item
+def ledger_data(item, start_date, end_date):
+    def compute():
+        ledger = build_daily_ledger(item, start_date, end_date)
+        return {
+            'item': {'id': item.id, 'item_name': item.item_name, 'unit': item.unit},
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'days': len(ledger),
+            'columns': ledger.columns(),
+            'totals': ledger.totals()
         }
-        df = df.rename(columns=column_mapping)
+    return report_cache.get_or_compute(report_key(item.id, start_date, end_date, 'json'), compute)
 
-    except Exception as e:
-        flash(f'Error exporting report: {str(e)}', 'danger')
-        return redirect(url_for('daily_stock_movement'))
+@app.route('/api/daily_stock_movement')
+@query_budget(7)
+@conditional(report_page_scopes)
+def api_daily_stock_movement():
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+        item_id = request.args.get('item_id', 'all')
+        item_id = item_id if item_id == 'all' else int(item_id)
+    except (KeyError, ValueError):
+        abort(400, 'start_date and end_date (YYYY-MM-DD) are required; item_id must be an id or "all"')
+    if item_id != 'all':
+        return jsonify(ledger_data(StockItem.query.get_or_404(item_id), start_date, end_date))
+    
+    def compute_summary():
+        items = StockItem.query.order_by(StockItem.item_name).all()
+        return [
+            dict({key: value for key, value in row.items() if key != 'item'}, item_id=row['item'].id,
+                 item_name=row['item'].item_name, unit=row['item'].unit, lowest_date=row['lowest_date'].isoformat())
+            for row in build_stock_matrix(items, start_date, end_date).summaries()
+        ]
+    rows = report_cache.get_or_compute(report_key('all', start_date, end_date, 'json'), compute_summary)
+    return jsonify({'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(), 'items': rows})
 
+@app.route('/export_daily_stock_movement', methods=['POST'])
+def export_daily_stock_movement():
+    # Kept for old bookmarks and forms; the Excel export shares the same ledger
+    return export_daily_stock_excel()
 
-@app.route('/export_daily_stock/excel', methods=['POST'])
+
+@app.route('/export_daily_stock/excel', methods=['GET', 'POST'])
+@conditional(report_page_scopes)
 def export_daily_stock_excel():
     try:
-        start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
-        end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
-        item_id = int(request.form['item_id'])
-        
-        exporter = ReportExporter(item_id, start_date, end_date)
-        excel_file = exporter.export_excel()
+        start_date = datetime.strptime(request.values['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.values['end_date'], '%Y-%m-%d').date()
         
-        filename = f"daily_stock_{exporter.item.item_name}_{start_date}_{end_date}.xlsx"
+        # Workbooks are built row by row in a temp file and streamed from disk
+        if request.values['item_id'] == 'all':
+            item_id = 'all'
+            def build():
+                filename = f"daily_stock_all_items_{start_date}_{end_date}.xlsx"
+                return AllItemsReportExporter(start_date, end_date).export_excel(), filename
+        else:
+            item_id = int(request.values['item_id'])
+            def build():
+                exporter = ReportExporter(item_id, start_date, end_date)
+                filename = f"daily_stock_{exporter.item.item_name}_{start_date}_{end_date}.xlsx"
+                return exporter.export_excel(), filename
+        excel_file, filename = cached_export('xlsx', item_id, start_date, end_date, build)
         return send_file(
             excel_file,
             as_attachment=True,
@@ -629,17 +770,55 @@ def export_daily_stock_excel():
         flash(f'Error exporting Excel: {str(e)}', 'danger')
         return redirect(url_for('daily_stock_movement'))
 
-@app.route('/export_daily_stock/pdf', methods=['POST'])
+# Machine-readable ledger exports for scripts; rows stream as they are computed
+def streamed_ledger_export(stream, extension, mimetype):
+    try:
+        start_date = datetime.strptime(request.values['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.values['end_date'], '%Y-%m-%d').date()
+        item_id = request.values.get('item_id', 'all')
+        if item_id == 'all':
+            items = StockItem.query.order_by(StockItem.item_name).all()
+        else:
+            items = [StockItem.query.get_or_404(int(item_id))]
+    except (KeyError, ValueError):
+        abort(400, 'start_date and end_date (YYYY-MM-DD) are required; item_id must be an id or "all"')
+    
+    filename = f"daily_stock_{item_id if item_id == 'all' else items[0].id}_{start_date}_{end_date}.{extension}"
+    return Response(
+        stream_with_context(stream(items, start_date, end_date)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/export_daily_stock/csv', methods=['GET', 'POST'])
+@conditional(report_page_scopes)
+def export_daily_stock_csv():
+    return streamed_ledger_export(stream_csv, 'csv', 'text/csv')
+
+@app.route('/export_daily_stock/ndjson', methods=['GET', 'POST'])
+@conditional(report_page_scopes)
+def export_daily_stock_ndjson():
+    return streamed_ledger_export(stream_ndjson, 'ndjson', 'application/x-ndjson')
+
+@app.route('/export_daily_stock/pdf', methods=['GET', 'POST'])
+@conditional(report_page_scopes)
 def export_daily_stock_pdf():
     try:
-        start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
-        end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
-        item_id = int(request.form['item_id'])
+        start_date = datetime.strptime(request.values['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.values['end_date'], '%Y-%m-%d').date()
         
-        exporter = ReportExporter(item_id, start_date, end_date)
-        pdf_file = exporter.export_pdf()
-        
-        filename = f"daily_stock_{exporter.item.item_name}_{start_date}_{end_date}.pdf"
+        if request.values['item_id'] == 'all':
+            item_id = 'all'
+            def build():
+                filename = f"daily_stock_all_items_{start_date}_{end_date}.pdf"
+                return AllItemsReportExporter(start_date, end_date).export_pdf(), filename
+        else:
+            item_id = int(request.values['item_id'])
+            def build():
+                exporter = ReportExporter(item_id, start_date, end_date)
+                filename = f"daily_stock_{exporter.item.item_name}_{start_date}_{end_date}.pdf"
+                return exporter.export_pdf(), filename
+        pdf_file, filename = cached_export('pdf', item_id, start_date, end_date, build)
         return send_file(
             pdf_file,
             as_attachment=True,
@@ -649,6 +828,339 @@ def export_daily_stock_pdf():
     except Exception as e:
         flash(f'Error exporting PDF: {str(e)}', 'danger')
         return redirect(url_for('daily_stock_movement'))
+
+# Background exports: submit, poll for progress, download when done
+@app.route('/export_jobs', methods=['POST'])
+def submit_export_job():
+    values = request.get_json() if request.is_json else request.values
+    try:
+        start_date = datetime.strptime(values['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(values['end_date'], '%Y-%m-%d').date()
+        fmt = values.get('format', 'xlsx')
+        if fmt not in JOB_FORMATS:
+            raise ValueError(fmt)
+        # item_ids may be a JSON list, repeated form fields, 'all' or a single item_id
+        if request.is_json:
+            item_ids = values.get('item_ids', values.get('item_id', 'all'))
+        else:
+            item_ids = values.getlist('item_ids') or values.get('item_id', 'all')
+        if item_ids != 'all':
+            item_ids = [int(i) for i in (item_ids if isinstance(item_ids, list) else [item_ids])]
+    except (KeyError, ValueError, TypeError):
+        abort(400, 'start_date and end_date (YYYY-MM-DD) are required; format must be one of '
+                   f'{", ".join(JOB_FORMATS)}; item_ids must be ids or "all"')
+    
+    job = export_jobs.submit(None if item_ids == 'all' else item_ids, start_date, end_date, fmt)
+    return jsonify(dict(job.to_dict(), status_url=url_for('export_job_status', job_id=job.id),
+                        download_url=url_for('download_export_job', job_id=job.id))), 202
+
+@app.route('/export_jobs/<job_id>')
+def export_job_status(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+@app.route('/export_jobs/<job_id>/download')
+def download_export_job(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 409
+    return send_file(
+        job.path,
+        as_attachment=True,
+        download_name=job.filename,
+        mimetype=JOB_FORMATS[job.format][1]
+    )
+
+# JSON batch API: each call is applied with single-statement upserts in one transaction
+def json_upsert(upsert, table, all_items=False):
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        abort(400, 'Send a JSON array of records, or an object with a "records" array')
+    if len(records) > MAX_UPSERT_RECORDS:
+        abort(413, f'At most {MAX_UPSERT_RECORDS} records per call')
+    
+    try:
+        result = upsert(records)
+        if result.first_date is not None:
+            ledger_changed(table, result.first_date, None if all_items else result.item_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return jsonify(result.to_dict())
+
+@app.route('/api/head_counts', methods=['POST'])
+@write_transaction(db)
+def api_head_counts():
+    return json_upsert(upsert_head_counts, 'rasan_record', all_items=True)
+
+@app.route('/api/stock_movements', methods=['POST'])
+@write_transaction(db)
+def api_stock_movements():
+    return json_upsert(upsert_stock_movements, 'stock_inventory')
+
+# Stock-out forecast: every item's projected stock over the coming days, as a page and JSON
+def forecast_params(values, default_horizon=DEFAULT_HORIZON):
+    try:
+        horizon = int(values.get('horizon', default_horizon))
+        history_days = int(values.get('history_days', DEFAULT_HISTORY_DAYS))
+        method = values.get('method', 'average')
+        # An expected head count, when given, replaces the projection
+        head_count = values.get('head_count')
+        head_count = int(head_count) if head_count else None
+        if not (1 <= horizon <= 366 and 1 <= history_days <= 366 and method in FORECAST_METHODS):
+            raise ValueError
+        if head_count is not None and head_count < 0:
+            raise ValueError
+    except ValueError:
+        abort(400, 'horizon and history_days must be 1-366 days; method must be one of '
+                   f'{", ".join(FORECAST_METHODS)}; head_count must be a whole number')
+    return horizon, history_days, method, head_count
+
+def cached_forecast(horizon, history_days, method, head_count=None):
+    today = datetime.now().date()
+    version = get_versions(['ledger'])['ledger']
+    def compute_forecast():
+        items = StockItem.query.order_by(StockItem.item_name).all()
+        return StockForecast(items, today, horizon, history_days, method, head_count).to_dict()
+    return report_cache.get_or_compute(
+        ('forecast', today.isoformat(), horizon, history_days, method, head_count, version), compute_forecast)
+
+@app.route('/forecast')
+@query_budget(7)
+@conditional(['ledger'], daily=True)
+def forecast():
+    result = cached_forecast(*forecast_params(request.args))
+    rows = [dict(row, stockout_date=row['stockout_date'] and datetime.strptime(row['stockout_date'], '%Y-%m-%d'))
+            for row in result['items']]
+    return render_template('forecast.html',
+                         forecast=result,
+                         rows=rows,
+                         methods=FORECAST_METHODS)
+
+@app.route('/api/forecast')
+@query_budget(7)
+@conditional(['ledger'], daily=True)
+def api_forecast():
+    return jsonify(cached_forecast(*forecast_params(request.args)))
+
+# Ration planner: what every item needs for the coming days and how much to order
+PLANNER_DEFAULT_HORIZON = 30
+
+@app.route('/planner')
+@query_budget(7)
+@conditional(['ledger'], daily=True)
+def planner():
+    result = cached_forecast(*forecast_params(request.args, PLANNER_DEFAULT_HORIZON))
+    # Shortfall list first, largest first; then the items already covered
+    rows = sorted(result['items'], key=lambda row: (-row['shortfall'], row['item_name']))
+    return render_template('planner.html',
+                         plan=result,
+                         rows=rows,
+                         short_count=sum(1 for row in rows if row['shortfall'] > 0),
+                         head_count=request.args.get('head_count', ''),
+                         methods=FORECAST_METHODS)
+
+@app.route('/api/planner')
+@query_budget(7)
+@conditional(['ledger'], daily=True)
+def api_planner():
+    result = cached_forecast(*forecast_params(request.args, PLANNER_DEFAULT_HORIZON))
+    plan = {key: value for key, value in result.items() if key != 'items'}
+    plan['shortfalls'] = sorted((row for row in result['items'] if row['shortfall'] > 0),
+                                key=lambda row: (-row['shortfall'], row['item_name']))
+    return jsonify(plan)
+
+@app.route('/planner/export')
+@conditional(['ledger'], daily=True)
+def export_planner():
+    horizon, history_days, method, head_count = forecast_params(request.args, PLANNER_DEFAULT_HORIZON)
+    items = StockItem.query.order_by(StockItem.item_name).all()
+    plan = StockForecast(items, datetime.now().date(), horizon, history_days, method, head_count)
+    writer = ExcelLedgerWriter()
+    writer.add_plan_sheets(plan)
+    return send_file(
+        writer.close(),
+        as_attachment=True,
+        download_name=f'ration_plan_{plan.start_date}_{plan.end_date}.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+# Consumption rollups per week, month or financial year across all items
+def rollup_params():
+    today = datetime.now().date()
+    try:
+        period = request.args.get('period', 'month')
+        if period not in PERIODS:
+            raise ValueError(period)
+        # Default to the financial year so far
+        start_date = request.args.get('start_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else period_start(today, 'fy')
+        end_date = request.args.get('end_date')
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+        if start_date > end_date:
+            raise ValueError(start_date)
+    except ValueError:
+        abort(400, f'period must be one of {", ".join(PERIODS)}; start_date and end_date are YYYY-MM-DD, start first')
+    return period, start_date, end_date, today
+
+def rollup_rows(period, start_date, end_date, today):
+    items = StockItem.query.order_by(StockItem.item_name).all()
+    # Names before loading: storing new aggregates commits and expires the items
+    names = {item.id: {'item_name': item.item_name, 'unit': item.unit} for item in items}
+    labels = {start: period_label(period, start) for start, _ in period_bounds(period, start_date, end_date)}
+    rows = load_rollups(items, period, start_date, end_date, today)
+    for row in rows:
+        row.update(names[row['stock_item_id']], period_label=labels[row['period_start']])
+    return rows
+
+@app.route('/rollups')
+@query_budget(10)
+@conditional(['ledger'], daily=True)
+def rollups():
+    period, start_date, end_date, today = rollup_params()
+    measure = request.args.get('measure', 'consumption')
+    if measure not in ('consumption', 'incoming_stock', 'closing_balance'):
+        abort(400, 'measure must be consumption, incoming_stock or closing_balance')
+    rows = rollup_rows(period, start_date, end_date, today)
+    # One table row per item, one column per period
+    table = {}
+    for row in rows:
+        table.setdefault(row['stock_item_id'], {'item_name': row['item_name'], 'unit': row['unit'], 'values': []})
+        table[row['stock_item_id']]['values'].append(row[measure])
+    periods = [(period_label(period, start), end >= today) for start, end in period_bounds(period, start_date, end_date)]
+    return render_template('rollups.html',
+                         table=list(table.values()),
+                         periods=periods,
+                         period=period,
+                         periods_available=PERIODS,
+                         measure=measure,
+                         start_date=start_date.strftime('%Y-%m-%d'),
+                         end_date=end_date.strftime('%Y-%m-%d'))
+
+@app.route('/rollups/export/<fmt>')
+@conditional(['ledger'], daily=True)
+def export_rollups(fmt):
+    if fmt not in ('csv', 'xlsx'):
+        abort(404)
+    period, start_date, end_date, today = rollup_params()
+    rows = rollup_rows(period, start_date, end_date, today)
+    filename = f'{period}_rollup_{start_date}_{end_date}'
+    if fmt == 'csv':
+        return Response(
+            stream_rollup_csv(rows),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'}
+        )
+    writer = ExcelLedgerWriter()
+    writer.add_rollup_sheet(PERIODS[period], start_date, end_date, rows)
+    return send_file(
+        writer.close(),
+        as_attachment=True,
+        download_name=f'{filename}.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+# District reports: every facility's database, computed side by side on the district pool
+def district_reports():
+    if district is None:
+        abort(404)
+    return district
+
+def district_stock_rows(today):
+    reports = district_reports()
+    low_stock_days = app.config['LOW_STOCK_DAYS']
+    return report_cache.get_or_compute(
+        ('district-stock', today.isoformat(), low_stock_days, reports.versions()),
+        lambda: merge_stock(reports.run(facility_stock, today, low_stock_days), low_stock_days)
+    )
+
+@app.route('/district')
+def district_stock():
+    today = datetime.now().date()
+    return render_template('district.html',
+                         stock=district_stock_rows(today),
+                         today=today,
+                         low_stock_days=app.config['LOW_STOCK_DAYS'])
+
+@app.route('/api/district/stock')
+def api_district_stock():
+    today = datetime.now().date()
+    rows = district_stock_rows(today)
+    return jsonify({
+        'as_of': today.isoformat(),
+        'facilities': list(app.config['FACILITIES']),
+        'items': [dict(row, as_of=row['as_of'] and row['as_of'].isoformat()) for row in rows]
+    })
+
+@app.route('/api/district/daily_stock_movement')
+def api_district_movement():
+    reports = district_reports()
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+        if start_date > end_date:
+            raise ValueError(start_date)
+    except ValueError:
+        abort(400, 'start_date and end_date are required as YYYY-MM-DD, start first')
+    rows = report_cache.get_or_compute(
+        ('district-movement', start_date.isoformat(), end_date.isoformat(), reports.versions()),
+        lambda: merge_movement(reports.run(facility_movement, start_date, end_date), start_date)
+    )
+    return jsonify({
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'items': [dict(row, lowest_date=row['lowest_date'].isoformat()) for row in rows]
+    })
+
+@app.route('/api/district/rollups')
+def api_district_rollups():
+    reports = district_reports()
+    period, start_date, end_date, today = rollup_params()
+    rows = report_cache.get_or_compute(
+        ('district-rollups', period, start_date.isoformat(), end_date.isoformat(), today.isoformat(), reports.versions()),
+        lambda: merge_rollups(reports.run(facility_rollups, period, start_date, end_date, today))
+    )
+    return jsonify({
+        'period': period,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'items': [dict(row, period_label=period_label(period, row['period_start']),
+                       period_start=row['period_start'].isoformat(), period_end=row['period_end'].isoformat())
+                  for row in rows]
+    })
+
+# Operational endpoints answer the metrics token if one is set, else local requests only
+def require_operator_request():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(404)
+        return
+    # A proxy nobody configured makes every client look local; what it forwarded is not
+    forwarded = not app.config['TRUSTED_PROXIES'] and any(
+        header in request.headers for header in ('Forwarded', 'X-Forwarded-For', 'X-Real-IP'))
+    if forwarded or request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(404)
+
+@app.route('/metrics')
+def metrics():
+    # The numbers describe this worker process
+    require_operator_request()
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/report_cache/stats')
+def report_cache_stats():
+    require_operator_request()
+    return jsonify(report_cache.stats())
+
+# Facility prefixes must not shadow the default facility's routes
+check_facility_names(app.config['FACILITIES'], app.url_map)
     
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from sqlalchemy import func, insert
+from models import db, StockItem, StockInventory, ScaleEntry, RasanRecord, DailyBalance
+from ledger import build_stock_matrix
+
+
+def _ledger_bounds(item_ids):
+    """First and last day on which each item's balance can change"""
+    receipts = dict((item_id, (first, last)) for item_id, first, last in db.session.query(
+        StockInventory.stock_item_id,
+        func.min(StockInventory.date),
+        func.max(StockInventory.date)
+    ).filter(StockInventory.stock_item_id.in_(item_ids)).group_by(StockInventory.stock_item_id))
+    scales = dict((item_id, (first, last)) for item_id, first, last in db.session.query(
+        ScaleEntry.stock_item_id,
+        func.min(ScaleEntry.start_date),
+        func.max(ScaleEntry.end_date)
+    ).filter(ScaleEntry.stock_item_id.in_(item_ids)).group_by(ScaleEntry.stock_item_id))
+    first_count, last_count = db.session.query(func.min(RasanRecord.date), func.max(RasanRecord.date)).one()
+
+    bounds = {}
+    for item_id in item_ids:
+        starts, ends = [], []
+        if item_id in receipts:
+            starts.append(receipts[item_id][0])
+            ends.append(receipts[item_id][1])
+        # Consumption needs both a scale and a head count on the same day
+        if item_id in scales and first_count:
+            first_use = max(scales[item_id][0], first_count)
+            last_use = min(scales[item_id][1], last_count)
+            if first_use <= last_use:
+                starts.append(first_use)
+                ends.append(last_use)
+        if starts:
+            bounds[item_id] = (min(starts), max(ends))
+    return bounds
+
+
+def refresh_daily_balances(item_ids, from_date):
+    """Recompute the items' materialized balances from from_date forward"""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    DailyBalance.query.filter(
+        DailyBalance.stock_item_id.in_(item_ids),
+        DailyBalance.date >= from_date
+    ).delete(synchronize_session=False)
+
+    # Writes dated after an item's last snapshot also fill the days in between
+    last_snapshots = dict(db.session.query(
+        DailyBalance.stock_item_id,
+        func.max(DailyBalance.date)
+    ).filter(DailyBalance.stock_item_id.in_(item_ids)).group_by(DailyBalance.stock_item_id))
+    bounds = {}
+    for item_id, (first, last) in _ledger_bounds(item_ids).items():
+        start = from_date
+        if item_id in last_snapshots:
+            start = min(start, last_snapshots[item_id] + timedelta(days=1))
+        first = max(first, start)
+        if first <= last:
+            bounds[item_id] = (first, last)
+    if not bounds:
+        return
+
+    # Nothing moves between from_date and an item's first day, so one matrix
+    # opened at from_date serves every item; each keeps only its own window
+    items = StockItem.query.filter(StockItem.id.in_(bounds)).all()
+    start_date = min(first for first, _ in bounds.values())
+    end_date = max(last for _, last in bounds.values())
+    matrix = build_stock_matrix(items, start_date, end_date)
+
+    rows = []
+    for index, item in enumerate(items):
+        first, last = bounds[item.id]
+        lo, hi = (first - start_date).days, (last - start_date).days + 1
+        columns = zip(
+            matrix.opening_balance[index, lo:hi].tolist(),
+            matrix.incoming_stock[index, lo:hi].tolist(),
+            matrix.consumption[index, lo:hi].tolist(),
+            matrix.closing_balance[index, lo:hi].tolist()
+        )
+        rows.extend({
+            'stock_item_id': item.id,
+            'date': first + timedelta(days=i),
+            'opening_balance': opening,
+            'incoming_stock': incoming,
+            'consumption': used,
+            'closing_balance': closing
+        } for i, (opening, incoming, used, closing) in enumerate(columns))
+    if rows:
+        db.session.execute(insert(DailyBalance), rows)
+
+
+def refresh_all_daily_balances(from_date):
+    """Recompute every item's balances from from_date forward (head counts changed)"""
+    refresh_daily_balances([item_id for (item_id,) in db.session.query(StockItem.id)], from_date)
+
+
+def backfill_daily_balances():
+    """Materialize balances for items that have ledger data but no snapshots yet"""
+    has_snapshots = db.session.query(DailyBalance.id).filter(
+        DailyBalance.stock_item_id == StockItem.id
+    ).exists()
+    has_data = db.session.query(StockInventory.id).filter(
+        StockInventory.stock_item_id == StockItem.id
+    ).exists() | db.session.query(ScaleEntry.id).filter(
+        ScaleEntry.stock_item_id == StockItem.id
+    ).exists()
+    missing = [item_id for (item_id,) in db.session.query(StockItem.id).filter(has_data, ~has_snapshots)]
+    bounds = _ledger_bounds(missing) if missing else {}
+    if bounds:
+        refresh_daily_balances(bounds, min(first for first, _ in bounds.values()))
+        db.session.commit()
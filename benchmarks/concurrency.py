@@ -0,0 +1,149 @@
+"""Readers and writers against one SQLite file, per database profile.
+
+Starts reader processes that keep running the all-items report, slow readers
+that keep a read statement open (a report streaming to a slow client), and
+writer processes that post stock movements through the JSON API. Each is a
+separate copy of the app, as under several gunicorn workers. Reports
+completed requests, failures and latency for each profile.
+
+    python -m benchmarks.concurrency --readers 2 --slow-readers 2 --writers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import create_engine
+from models import db
+from benchmarks.synthetic import populate
+
+
+def hold_read(app, seconds):
+    """Keep a read statement pending for seconds, as a slowly consumed report does"""
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT id FROM stock_inventory')
+            cursor.fetchone()
+            time.sleep(seconds)
+            cursor.close()
+        finally:
+            connection.close()
+    return True
+
+
+def worker(role, index, database_url, profile, seconds, report_days, hold_ms, results):
+    """Run one reader, slow reader or writer against its own app instance until the deadline"""
+    os.environ.update(DATABASE_URL=database_url, DATABASE_PROFILE=profile, REPORT_CACHE_MAX_ENTRIES='0')
+    from app import app
+    app.logger.disabled = True
+    client = app.test_client()
+    end_date = results['last_day']
+    start_date = end_date - timedelta(days=report_days - 1)
+    latencies, failures = [], 0
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        if role == 'reader':
+            response = client.post('/daily_stock_movement', data={
+                'item_id': 'all', 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()
+            })
+            ok = response.status_code == 200 and b'Error generating report' not in response.data
+        elif role == 'slow_reader':
+            ok = hold_read(app, hold_ms / 1000)
+        else:
+            response = client.post('/api/stock_movements', json=[{
+                'item': 1 + (index + n) % 10, 'quantity': 1.0,
+                'date': (end_date - timedelta(days=n % report_days)).isoformat(),
+                'notes': f'bench {role} {index}'
+            }])
+            ok = response.status_code == 200
+        n += 1
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures += 1
+    results[(role, index)] = (latencies, failures)
+
+
+def run_profile(profile, database_path, args):
+    manager = multiprocessing.Manager()
+    results = manager.dict(last_day=args.last_day)
+    database_url = 'sqlite:///' + database_path
+    ctx = multiprocessing.get_context('spawn')
+    # Let the first process apply migrations and backfill before the timed run
+    warmup = ctx.Process(target=worker, args=('reader', 0, database_url, profile, 0,
+                                              args.report_days, args.hold_ms, results))
+    warmup.start()
+    warmup.join()
+
+    roles = [('reader', args.readers), ('slow_reader', args.slow_readers), ('writer', args.writers)]
+    processes = [ctx.Process(target=worker, args=(role, i, database_url, profile, args.seconds,
+                                                  args.report_days, args.hold_ms, results))
+                 for role, count in roles for i in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role, count in roles:
+        if not count:
+            continue
+        latencies, failures = [], 0
+        for key, value in results.items():
+            if isinstance(key, tuple) and key[0] == role:
+                latencies.extend(value[0])
+                failures += value[1]
+        latencies.sort()
+        summary[role] = {
+            'ok': len(latencies),
+            'failed': failures,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--slow-readers', type=int, default=2)
+    parser.add_argument('--hold-ms', type=int, default=2000, help='how long a slow reader keeps its statement open')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--report-days', type=int, default=180)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        template = os.path.join(workdir, 'template.db')
+        engine = create_engine('sqlite:///' + template)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            _, args.last_day = populate(connection, args.items, args.years)
+        engine.dispose()
+
+        print(f'{args.items} items x {args.years} years, {args.readers} readers, {args.slow_readers} slow readers, '
+              f'{args.writers} writers, {args.seconds:.0f}s per profile\n')
+        print(f'{"profile":<12}{"role":<13}{"ok":>7}{"failed":>8}{"p50 ms":>9}{"p95 ms":>9}{"max ms":>9}')
+        for profile in args.profiles:
+            # Every profile starts from the same data in rollback-journal mode
+            database_path = os.path.join(workdir, f'{profile}.db')
+            shutil.copyfile(template, database_path)
+            summary = run_profile(profile, database_path, args)
+            for role, stats in summary.items():
+                print(f'{profile:<12}{role:<13}{stats["ok"]:>7}{stats["failed"]:>8}'
+                      f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["max_ms"]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""District report timings over several facility databases, by worker count.
+
+Fills one throwaway database per facility, starts the app with FACILITIES
+naming them all, and times each district view with the reports computed
+in the web process (1 worker) and on process pools of increasing size.
+The report cache is off, so every request recomputes every facility.
+
+    python -m benchmarks.district --facilities 4 --items 200 --years 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from models import db
+from benchmarks.synthetic import populate
+
+DISTRICT_REQUESTS = [
+    ('stock', '/api/district/stock'),
+    ('movement, one year', '/api/district/daily_stock_movement?start_date={year}&end_date={last}'),
+    ('movement, all years', '/api/district/daily_stock_movement?start_date={first}&end_date={last}'),
+    ('monthly rollups', '/api/district/rollups?period=month&start_date={first}&end_date={last}'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--facilities', type=int, default=4)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', help='worker counts to compare (default 1 and --facilities)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        facilities = []
+        for number in range(args.facilities):
+            name = f'jail{number + 1}'
+            url = 'sqlite:///' + os.path.join(workdir, f'{name}.db')
+            engine = create_engine(url)
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                first_day, last_day = populate(connection, args.items, args.years, seed=number)
+            engine.dispose()
+            facilities.append(f'{name}={url}')
+
+        os.environ.update(FACILITIES=','.join(facilities), REPORT_CACHE_MAX_ENTRIES='0')
+        import app as app_module
+        client = app_module.app.test_client()
+        urls = [(label, template.format(first=first_day.isoformat(), last=last_day.isoformat(),
+                                        year=last_day.replace(day=1, month=1).isoformat()))
+                for label, template in DISTRICT_REQUESTS]
+
+        print(f'{args.facilities} facilities x {args.items} items x {args.years} years, '
+              f'{os.cpu_count()} CPUs\n')
+        worker_counts = args.workers or [1, args.facilities]
+        print(f'{"request":<24}' + ''.join(f'{f"{workers} worker(s)":>14}' for workers in worker_counts))
+        timings = {label: [] for label, _ in urls}
+        for workers in worker_counts:
+            app_module.district.shutdown()
+            app_module.district.workers = workers
+            for label, url in urls:
+                client.get(url)  # Starts the pool and opens each worker's engines
+                best = float('inf')
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    best = min(best, time.perf_counter() - started)
+                    assert response.status_code == 200, (url, response.status_code)
+                timings[label].append(best * 1000)
+        app_module.district.shutdown()
+        for label, values in timings.items():
+            print(f'{label:<24}' + ''.join(f'{value:>11.1f} ms' for value in values))
+
+
+if __name__ == '__main__':
+    main()
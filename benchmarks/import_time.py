@@ -0,0 +1,98 @@
+"""Cold-start import time and memory of the web app.
+
+Imports the app in fresh interpreters with -X importtime against a throwaway
+database, reports the slowest top-level packages and the peak RSS, and exits
+non-zero when a budget is exceeded or an export-only dependency is loaded at
+startup.
+
+    python -m benchmarks.import_time --max-ms 1500 --max-rss-mb 120
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+# Loaded on first export or import only; none may appear in a cold start
+DEFERRED_MODULES = ['fpdf', 'xlsxwriter', 'openpyxl', 'pandas', 'PIL', 'fontTools']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Printed by the child after import, to check what actually got loaded
+CHILD = (
+    'import sys, resource, {module}; '
+    'print(",".join(sorted(m for m in sys.modules if "." not in m))); '
+    'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+)
+
+
+def parse_importtime(stderr):
+    """Return {module: (self us, cumulative us)} from -X importtime output"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative))
+    return timings
+
+
+def cold_start(module, database_url):
+    """Import module in a fresh interpreter; returns (timings, loaded modules, peak RSS in MB)"""
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    loaded, maxrss = proc.stdout.strip().splitlines()[-2:]
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss_mb = int(maxrss) / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return parse_importtime(proc.stderr), set(loaded.split(',')), rss_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, help='fail if the best cold import is slower')
+    parser.add_argument('--max-rss-mb', type=float, help='fail if peak RSS after import is larger')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        # The first run creates the schema; only warm-database starts are timed
+        cold_start(args.module, database_url)
+        runs = [cold_start(args.module, database_url) for _ in range(args.repeat)]
+
+    best_timings, loaded, _ = min(runs, key=lambda run: run[0][args.module][1])
+    total_ms = best_timings[args.module][1] / 1000
+    rss_mb = max(run[2] for run in runs)
+    print(f'import {args.module}: {total_ms:.0f} ms (best of {args.repeat}), peak RSS {rss_mb:.1f} MB\n')
+
+    # Top-level packages by cumulative time, as imported from anywhere
+    packages = {}
+    for name, (_, cumulative) in best_timings.items():
+        top = name.split('.')[0]
+        packages[top] = max(packages.get(top, 0), cumulative)
+    packages.pop(args.module, None)
+    print(f'{"package":<24}{"cumulative ms":>14}')
+    for name, cumulative in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+        print(f'{name:<24}{cumulative / 1000:>14.1f}')
+
+    failures = []
+    eager = sorted(set(DEFERRED_MODULES) & loaded)
+    if eager:
+        failures.append(f'export-only modules loaded at startup: {", ".join(eager)}')
+    if args.max_ms is not None and total_ms > args.max_ms:
+        failures.append(f'import took {total_ms:.0f} ms, budget {args.max_ms:.0f} ms')
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f'peak RSS {rss_mb:.1f} MB, budget {args.max_rss_mb:.1f} MB')
+    for failure in failures:
+        print('FAIL: ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Per-view SQL statement counts checked against their query budgets.
+
+Fills a throwaway database, requests every list view (first, filtered and
+deep pages) with QUERY_BUDGET_STRICT on, and exits non-zero when a view
+runs more statements than its @query_budget allows, or has no budget.
+Each request is then repeated with the ETag it returned and must come back
+304 Not Modified after a single version lookup.
+
+tests/test_query_budget.py makes the same checks on every test run; this
+script is for trying larger --items and --years by hand.
+
+    python -m benchmarks.query_budget --items 50 --years 1
+"""
+import argparse
+import os
+import sys
+import tempfile
+from sqlalchemy import create_engine
+from models import db
+from benchmarks.synthetic import populate
+
+# List views that must declare a budget, and the requests that exercise them
+LIST_REQUESTS = [
+    ('kedi', '/kedi'),
+    ('kedi', '/kedi?start_date={mid}&end_date={last}'),
+    ('kedi', '/kedi?after={mid}.1000000'),
+    ('stock_items', '/stock_items'),
+    ('stock_inventory', '/stock_inventory'),
+    ('stock_inventory', '/stock_inventory?item_id=2&start_date={mid}'),
+    ('stock_inventory', '/stock_inventory?after={mid}.1000000'),
+    ('stock_inventory_by_item', '/stock_inventory/item/2'),
+    ('scale_list', '/scale'),
+    ('index', '/'),
+    ('forecast', '/forecast'),
+    ('forecast', '/forecast?method=trend&horizon=180'),
+    ('api_forecast', '/api/forecast'),
+    ('planner', '/planner'),
+    ('planner', '/planner?horizon=90&head_count=500'),
+    ('api_planner', '/api/planner?horizon=90'),
+    ('rollups', '/rollups?period=month&start_date={mid}&end_date={last}'),
+    ('rollups', '/rollups?period=week&start_date={mid}&end_date={last}'),
+    ('daily_stock_movement', '/daily_stock_movement?item_id=all&start_date={mid}&end_date={last}'),
+    ('api_daily_stock_movement', '/api/daily_stock_movement?item_id=2&start_date={mid}&end_date={last}'),
+    ('api_daily_stock_movement', '/api/daily_stock_movement?item_id=all&start_date={mid}&end_date={last}'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--years', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        engine = create_engine(database_url)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            first_day, last_day = populate(connection, args.items, args.years)
+        engine.dispose()
+
+        os.environ.update(DATABASE_URL=database_url, QUERY_BUDGET_STRICT='1')
+        from app import app
+        from instrumentation import QueryBudgetExceeded
+        app.testing = True
+        client = app.test_client()
+        mid = first_day + (last_day - first_day) / 2
+
+        failures = []
+        print(f'{args.items} items x {args.years} years\n')
+        print(f'{"request":<58}{"queries":>8}{"budget":>8}{"304":>6}')
+        for endpoint, template in LIST_REQUESTS:
+            url = template.format(mid=mid.isoformat(), last=last_day.isoformat())
+            budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+            # Second request: caches are warm, as for most page views
+            for attempt in ('cold', 'warm'):
+                try:
+                    response = client.get(url)
+                except QueryBudgetExceeded as e:
+                    failures.append(f'{url} ({attempt}): {e}')
+                    continue
+                if attempt == 'warm':
+                    revalidated = client.get(url, headers={'If-None-Match': response.headers.get('ETag', '')})
+                    if revalidated.status_code != 304 or revalidated.headers['X-Query-Count'] != '1':
+                        failures.append(f'{url}: repeat with ETag returned {revalidated.status_code}, '
+                                        f'{revalidated.headers["X-Query-Count"]} queries')
+                    print(f'{url:<58}{response.headers["X-Query-Count"]:>8}{str(budget):>8}'
+                          f'{revalidated.headers["X-Query-Count"]:>6}')
+            if budget is None:
+                failures.append(f'{endpoint} has no @query_budget')
+
+    for failure in failures:
+        print('FAIL: ' + failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Before/after query plans and timings for the report queries.
+
+Builds a throwaway multi-year SQLite database with the pre-migration schema,
+times the hot report queries, applies migrations.upgrade() and times them again.
+
+    python -m benchmarks.query_plans --items 200 --years 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import create_engine, text
+from models import db
+import migrations
+from benchmarks.synthetic import populate
+
+# Hot query shapes issued by ledger.py, balances.py and the scale routes
+QUERIES = {
+    'incoming by (item, date)': (
+        'SELECT stock_item_id, date, sum(quantity) FROM stock_inventory '
+        'WHERE stock_item_id IN (:item_id) AND date BETWEEN :start AND :end '
+        'GROUP BY stock_item_id, date'
+    ),
+    'legacy opening SUM(quantity)': (
+        'SELECT sum(quantity) FROM stock_inventory WHERE stock_item_id = :item_id AND date < :start'
+    ),
+    'scale overlap for item': (
+        'SELECT id FROM scale_entry WHERE stock_item_id = :item_id '
+        'AND start_date <= :end AND end_date >= :start'
+    ),
+    'head counts for range': (
+        'SELECT date, (kedi_m + kedi_f) - (tifin_m + tifin_f + medical_m + medical_f) '
+        'FROM rasan_record WHERE date BETWEEN :start AND :end'
+    ),
+}
+
+NEW_INDEXES = ['ix_stock_inventory_item_date', 'ix_scale_entry_item_range', 'ix_rasan_record_date_counts']
+
+
+def measure(connection, params, repeat):
+    """Return {query name: (plan lines, best time in ms)}"""
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql), params)]
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            connection.execute(text(sql), params).fetchall()
+            best = min(best, time.perf_counter() - started)
+        results[name] = (plan, best * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_engine('sqlite:///' + os.path.join(workdir, 'bench.db'))
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            # Recreate the schema as it was before the indexes were declared
+            for index in NEW_INDEXES:
+                connection.execute(text(f'DROP INDEX IF EXISTS {index}'))
+            connection.execute(text('PRAGMA user_version = 0'))
+            first_day, last_day = populate(connection, args.items, args.years)
+
+        # A one-year report for one item in the middle of the ledger
+        params = {'item_id': args.items // 2, 'start': last_day - timedelta(days=364), 'end': last_day}
+        with engine.connect() as connection:
+            before = measure(connection, params, args.repeat)
+        with engine.begin() as connection:
+            applied = migrations.upgrade(connection)
+        with engine.connect() as connection:
+            after = measure(connection, params, args.repeat)
+
+    print(f'{args.items} items x {args.years} years, migrations applied: {applied}\n')
+    for name in QUERIES:
+        (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+        print(f'{name}: {ms_before:.2f} ms -> {ms_after:.2f} ms ({ms_before / max(ms_after, 1e-6):.1f}x)')
+        print('  before: ' + ' | '.join(plan_before))
+        print('  after:  ' + ' | '.join(plan_after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Timings of the report, export, list and balance paths against recorded baselines.
+
+Fills a throwaway database from benchmarks.synthetic, starts the app on it
+with the report cache off (every request recomputes) and times each case.
+--save records the medians as the baseline for that data scale; later runs
+print the change against it and, with --check, exit non-zero when a case is
+more than --tolerance slower.
+
+    python -m benchmarks.suite --items 200 --years 5 --save
+    python -m benchmarks.suite --items 200 --years 5 --check
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+from sqlalchemy import create_engine
+from models import db, StockItem
+from ledger import opening_balances
+from benchmarks.synthetic import populate
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+
+def cases(first_day, last_day, item_id):
+    """(name, kind, target, form) for each timed case; kind is 'get', 'post' or 'call'"""
+    year = {'start_date': (last_day - timedelta(days=364)).isoformat(), 'end_date': last_day.isoformat()}
+    quarter = {'start_date': (last_day - timedelta(days=89)).isoformat(), 'end_date': last_day.isoformat()}
+    everything = {'start_date': first_day.isoformat(), 'end_date': last_day.isoformat()}
+    mid = first_day + (last_day - first_day) / 2
+    return [
+        ('report: one item, 1 year', 'post', '/daily_stock_movement', dict(year, item_id=item_id)),
+        ('report: all items, 1 year', 'post', '/daily_stock_movement', dict(year, item_id='all')),
+        ('report page: one item, all years', 'get', '/daily_stock_movement?' + urlencode(dict(everything, item_id=item_id)), None),
+        ('report json: one item, all years', 'get', '/api/daily_stock_movement?' + urlencode(dict(everything, item_id=item_id)), None),
+        ('excel: one item, 1 year', 'post', '/export_daily_stock/excel', dict(year, item_id=item_id)),
+        ('excel: all items, 90 days', 'post', '/export_daily_stock/excel', dict(quarter, item_id='all')),
+        ('pdf: one item, 1 year', 'post', '/export_daily_stock/pdf', dict(year, item_id=item_id)),
+        ('pdf: all items, 90 days', 'post', '/export_daily_stock/pdf', dict(quarter, item_id='all')),
+        ('csv: all items, 90 days', 'post', '/export_daily_stock/csv', dict(quarter, item_id='all')),
+        ('list: kedi', 'get', '/kedi', None),
+        ('list: stock inventory', 'get', '/stock_inventory', None),
+        ('list: stock inventory, deep page', 'get', f'/stock_inventory?after={mid.isoformat()}.1000000', None),
+        ('list: inventory by item', 'get', f'/stock_inventory/item/{item_id}', None),
+        ('list: scales', 'get', '/scale', None),
+        ('dashboard', 'get', '/', None),
+        ('forecast: 90 days', 'get', '/forecast', None),
+        ('planner excel: 90 days', 'get', '/planner/export?horizon=90&head_count=500', None),
+        ('rollup: monthly, 1 year', 'get', '/rollups?period=month&' + urlencode(year), None),
+        ('rollup excel: weekly, 1 year', 'get', '/rollups/export/xlsx?period=week&' + urlencode(year), None),
+        ('opening balances: all items', 'call', 'opening_balances', mid),
+    ]
+
+
+def time_case(app, client, kind, target, form, repeat):
+    """Median and best wall time in ms over repeat runs, after one warm-up"""
+    timings = []
+    for attempt in range(repeat + 1):
+        started = time.perf_counter()
+        if kind == 'call':
+            with app.app_context():
+                opening_balances([item.id for item in StockItem.query.all()], form)
+        else:
+            response = client.post(target, data=form) if kind == 'post' else client.get(target)
+            # Export errors redirect back to the report form
+            if response.status_code != 200:
+                raise RuntimeError(f'{target} returned {response.status_code}')
+            response.get_data()
+        if attempt:
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES):
+        return {}
+    with open(BASELINES) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='run only cases whose name contains this text')
+    parser.add_argument('--save', action='store_true', help='record the results as the baseline for this scale')
+    parser.add_argument('--check', action='store_true', help='exit non-zero on a regression past --tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    args = parser.parse_args()
+
+    scale = f'{args.items}x{args.years}'
+    baseline = load_baselines().get(scale, {}).get('results', {})
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        engine = create_engine(database_url)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            first_day, last_day = populate(connection, args.items, args.years)
+        engine.dispose()
+
+        os.environ.update(DATABASE_URL=database_url, REPORT_CACHE_MAX_ENTRIES='0')
+        # Startup migrates and backfills the daily balances of the fresh file
+        started = time.perf_counter()
+        from app import app
+        results['startup: import, migrate, backfill'] = {'median_ms': round((time.perf_counter() - started) * 1000, 2)}
+        app.logger.disabled = True
+        client = app.test_client()
+
+        print(f'{args.items} items x {args.years} years, median of {args.repeat}\n')
+        print(f'{"case":<40}{"median ms":>11}{"best ms":>10}{"baseline":>10}{"change":>9}')
+        regressions = []
+        for name, kind, target, form in cases(first_day, last_day, args.items // 2):
+            if args.only and args.only not in name:
+                continue
+            median, best = time_case(app, client, kind, target, form, args.repeat)
+            results[name] = {'median_ms': round(median, 2), 'best_ms': round(best, 2)}
+        for name, result in results.items():
+            before = baseline.get(name, {}).get('median_ms')
+            change = ''
+            if before:
+                ratio = result['median_ms'] / before - 1
+                change = f'{ratio:+.0%}'
+                if ratio > args.tolerance:
+                    regressions.append(f'{name}: {before:.1f} ms -> {result["median_ms"]:.1f} ms')
+            print(f'{name:<40}{result["median_ms"]:>11.1f}{result.get("best_ms", result["median_ms"]):>10.1f}'
+                  f'{f"{before:.1f}" if before else "-":>10}{change:>9}')
+
+    if args.save:
+        baselines = load_baselines()
+        baselines[scale] = {
+            'python': platform.python_version(),
+            'machine': f'{platform.system()} {platform.machine()}, {os.cpu_count()} CPU',
+            'repeat': args.repeat,
+            'results': dict(baselines.get(scale, {}).get('results', {}), **results)
+        }
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nBaseline for {scale} saved to {BASELINES}')
+    for regression in regressions:
+        print('SLOWER: ' + regression)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
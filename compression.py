@@ -0,0 +1,81 @@
+import gzip
+import zlib
+from flask import request
+
+# Brotli is optional; without it every client that asks gets gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Text responses worth compressing; workbooks and PDFs are compressed already
+COMPRESSIBLE_TYPES = {'text/html', 'text/csv', 'text/plain', 'text/css', 'application/json',
+                      'application/x-ndjson', 'application/javascript'}
+
+# Brotli quality for dynamic responses: near level 11 ratios on text at a fraction of the time
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding the client accepts: br, then gzip, else None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress a streamed body chunk by chunk, so large exports keep streaming"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        compress, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # Lets stream_with_context release the request context
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def install_compression(app):
+    """Compress text responses of at least COMPRESS_MIN_BYTES for clients that accept it.
+
+    Brotli is used when installed and accepted, gzip otherwise. Streamed
+    responses (the CSV and NDJSON exports) are compressed as they stream,
+    whatever their size. Files sent with send_file, error pages and 304s
+    are left alone. Install after install_instrumentation so request timing
+    includes the compression.
+    """
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES or request.method == 'HEAD'):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        level = app.config['COMPRESS_LEVEL']
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_BYTES']:
+                return response
+            if encoding == 'br':
+                response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+            else:
+                response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,66 @@
+import hashlib
+import os
+from datetime import datetime, time, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+from data_versions import get_version_stamps
+
+
+def code_version(root):
+    """Latest change to the app's modules and templates, so a deploy changes every ETag"""
+    latest = 0.0
+    for folder, folders, files in os.walk(root):
+        # Skip data, caches and virtualenvs
+        folders[:] = [name for name in folders if not name.startswith(('.', '_')) and name not in ('instance', 'venv')]
+        for name in files:
+            if name.endswith(('.py', '.html')):
+                latest = max(latest, os.path.getmtime(os.path.join(folder, name)))
+    return str(int(latest))
+
+
+def conditional(scopes, daily=False):
+    """Answer a repeat GET with 304 Not Modified while the data behind the view is unchanged.
+
+    scopes lists the data_versions scopes the response is built from, or is
+    a function of the view's arguments returning them. Their versions make
+    the ETag and their latest change the Last-Modified date; daily views
+    (whose content also moves on at midnight) add today's date. Checking
+    costs one DataVersion lookup, which the view reuses; a 304 runs no other
+    query and renders nothing. While flash messages are pending the page is
+    rendered and left untagged: the messages belong to that one response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            names = scopes(**kwargs) if callable(scopes) else scopes
+            stamps = get_version_stamps(names)
+            tag = [current_app.config['ETAG_SALT'], request.script_root, request.full_path] + [stamps[name][0] for name in names]
+            changes = [stamp[1] for stamp in stamps.values() if stamp[1] is not None]
+            if daily:
+                today = datetime.now().date()
+                tag.append(today.isoformat())
+                # Local midnight, in UTC like DataVersion.updated_at
+                changes.append(datetime.combine(today, time()).astimezone(timezone.utc).replace(tzinfo=None))
+            etag = hashlib.sha1(repr(tag).encode()).hexdigest()[:20]
+            last_modified = max(changes).replace(tzinfo=timezone.utc) if changes else None
+
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(view(*args, **kwargs))
+                # Error pages and redirects are not tagged
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+            # Weak: the tag stands for the data, whatever the encoding (see compression.py)
+            response.set_etag(etag, weak=True)
+            # Scopes never bumped have no date; None would stamp the current time
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Browsers keep the copy but revalidate it on every load
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+from datetime import timedelta
+from sqlalchemy import func
+from models import db, StockItem, DailyBalance
+
+# Days of consumption averaged for the days-of-cover estimate
+COVER_WINDOW_DAYS = 14
+
+
+def current_stock(today, low_stock_days, window_days=COVER_WINDOW_DAYS):
+    """Balance on hand and days of cover for every item as of today.
+
+    The balance is the item's latest materialized closing balance on or
+    before today (received to date minus consumed to date); nothing changes
+    on days without receipts or head counts. Both figures come from one
+    query whose per-item lookups are seeks on DailyBalance's (item, date)
+    index, so the cost follows the item count, not the history length.
+    """
+    since = today - timedelta(days=window_days)
+    latest = db.session.query(DailyBalance).filter(
+        DailyBalance.stock_item_id == StockItem.id,
+        DailyBalance.date <= today
+    ).order_by(DailyBalance.date.desc()).limit(1)
+    used = db.session.query(func.sum(DailyBalance.consumption)).filter(
+        DailyBalance.stock_item_id == StockItem.id,
+        DailyBalance.date > since,
+        DailyBalance.date <= today
+    )
+    rows = db.session.query(
+        StockItem.id,
+        StockItem.item_name,
+        StockItem.unit,
+        latest.with_entities(DailyBalance.date).scalar_subquery(),
+        latest.with_entities(DailyBalance.closing_balance).scalar_subquery(),
+        used.scalar_subquery()
+    ).order_by(StockItem.item_name).all()
+
+    stock = []
+    for item_id, item_name, unit, as_of, balance, used in rows:
+        balance = balance or 0.0
+        daily_use = (used or 0.0) / window_days
+        days_of_cover, status = stock_status(balance, daily_use, low_stock_days)
+        stock.append({
+            'item_id': item_id,
+            'item_name': item_name,
+            'unit': unit,
+            'balance': balance,
+            'as_of': as_of,
+            'daily_use': daily_use,
+            'days_of_cover': days_of_cover,
+            'status': status
+        })
+    return stock
+
+
+def stock_status(balance, daily_use, low_stock_days):
+    """(days of cover, 'out' / 'low' / 'ok') for a balance and average daily use"""
+    days_of_cover = max(balance, 0.0) / daily_use if daily_use > 0 else None
+    if balance <= 0:
+        return days_of_cover, 'out'
+    if days_of_cover is not None and days_of_cover < low_stock_days:
+        return days_of_cover, 'low'
+    return days_of_cover, 'ok'
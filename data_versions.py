@@ -0,0 +1,63 @@
+from datetime import datetime
+from flask import g, has_request_context
+from sqlalchemy.dialects.sqlite import insert
+from models import db, DataVersion
+from facilities import current_facility
+
+# Scopes:
+#   '<table>'     - any change to that table (rasan_record, stock_inventory, scale_entry, stock_item)
+#   'item:<id>'   - any change that affects the item's ledger or its name/unit
+#   'ledger'      - any change that can affect some report
+
+
+def bump_versions(table, item_ids=None):
+    """Record a change to table and, where known, to the given items (call before commit)"""
+    scopes = [table, 'ledger'] + [f'item:{item_id}' for item_id in sorted(set(item_ids or ()))]
+    now = datetime.utcnow()
+    # Versions read earlier in this request are stale now
+    if has_request_context():
+        g.pop('data_versions', None)
+    statement = insert(DataVersion).values([
+        {'scope': scope, 'version': 1, 'updated_at': now} for scope in scopes
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['scope'],
+        set_={'version': DataVersion.version + 1, 'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def get_versions(scopes):
+    """Return {scope: version} for the given scopes, 0 for scopes never bumped"""
+    return {scope: version for scope, (version, _) in get_version_stamps(scopes).items()}
+
+
+def get_version_stamps(scopes):
+    """Return {scope: (version, updated_at)}, (0, None) for scopes never bumped.
+
+    Within a request, scopes already read (see conditional.py) are not read
+    again; kept per facility, as district views read several databases.
+    """
+    memo = g.setdefault('data_versions', {}) if has_request_context() else {}
+    known = memo.get(current_facility(), {})
+    stamps = {scope: known.get(scope) for scope in scopes}
+    missing = [scope for scope, stamp in stamps.items() if stamp is None]
+    if missing:
+        stamps.update(dict.fromkeys(missing, (0, None)))
+        stamps.update((scope, (version, updated_at)) for scope, version, updated_at in db.session.query(
+            DataVersion.scope, DataVersion.version, DataVersion.updated_at
+        ).filter(DataVersion.scope.in_(missing)))
+        memo[current_facility()] = dict(known, **stamps)
+    return stamps
+
+
+def report_scopes(item_id):
+    """Scopes whose change can change the item's report ('all' = any report)"""
+    if item_id == 'all':
+        return ['ledger']
+    # Head counts feed every item, so they are part of each item's version
+    return ['rasan_record', f'item:{item_id}']
+
+
+def report_version(item_id):
+    """Version tuple that changes whenever the item's report ('all' = any report) may change"""
+    return tuple(get_versions(report_scopes(item_id)).values())
@@ -0,0 +1,185 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from flask import Flask, g
+from models import db, StockItem
+from dashboard import current_stock, stock_status
+from data_versions import get_versions
+from facilities import use_facility
+from ledger import build_stock_matrix
+from rollups import AGGREGATE_FIELDS, load_rollups
+from sqlite_profile import apply_profile, engine_options
+
+# One Flask app (and engine) per facility database, made on first use in each process
+_facility_apps = {}
+_facility_apps_lock = threading.Lock()
+
+
+def _facility_app(url, profile):
+    with _facility_apps_lock:
+        app = _facility_apps.get(url)
+        if app is None:
+            app = Flask(__name__)
+            app.config.update(
+                SQLALCHEMY_DATABASE_URI=url,
+                SQLALCHEMY_ENGINE_OPTIONS=engine_options(profile, url),
+                SQLALCHEMY_TRACK_MODIFICATIONS=False
+            )
+            db.init_app(app)
+            with app.app_context():
+                apply_profile(db.engine, profile)
+            _facility_apps[url] = app
+    return app
+
+
+def run_on_facility(task, facility, url, profile, args):
+    """task(*args) in an app context of its own on the facility's database.
+
+    Used in pool processes and, with one worker, in the web process: item
+    ids repeat across databases, so facilities never share a session.
+    """
+    with _facility_app(url, profile).app_context():
+        g.facility = facility
+        return task(*args)
+
+
+class DistrictReports:
+    """Runs one computation per facility database and returns {facility: result}.
+
+    With more than one worker the facilities are spread over a process pool,
+    so a district report takes about as long as its largest facility, given
+    enough cores, rather than the sum of all of them. Each pool process keeps
+    an engine per facility it has served. With one worker the facilities are
+    computed in turn in the web process. Pool processes import the main
+    module, so scripts that start the app need an if __name__ == '__main__'
+    guard.
+    """
+
+    def __init__(self, databases, profile, workers):
+        self.databases = databases  # {facility: database URL}
+        self.profile = profile
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Workers start from a clean server process, not a copy of this threaded one
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def run(self, task, *args):
+        if self.workers <= 1 or len(self.databases) == 1:
+            return {facility: run_on_facility(task, facility, url, self.profile, args)
+                    for facility, url in self.databases.items()}
+        futures = {facility: self._pool().submit(run_on_facility, task, facility, url, self.profile, args)
+                   for facility, url in self.databases.items()}
+        return {facility: future.result() for facility, future in futures.items()}
+
+    def versions(self):
+        """Ledger version of every facility, for cache keys (read on the app's own engines)"""
+        versions = []
+        for facility in self.databases:
+            with use_facility(facility):
+                versions.append(get_versions(['ledger'])['ledger'])
+        return tuple(versions)
+
+    def shutdown(self):
+        """Stop the pool; the next run() starts a new one"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+# Per-facility computations; module-level so pool processes can import them
+
+def facility_stock(today, low_stock_days):
+    return current_stock(today, low_stock_days)
+
+
+def facility_movement(start_date, end_date):
+    """Range totals and daily closing balances of every item"""
+    items = StockItem.query.order_by(StockItem.item_name).all()
+    matrix = build_stock_matrix(items, start_date, end_date)
+    return {
+        'items': [(item.item_name, item.unit) for item in items],
+        'opening_balance': matrix.opening_balance[:, 0],
+        'incoming_stock': matrix.incoming_stock.sum(axis=1),
+        'consumption': matrix.consumption.sum(axis=1),
+        'closing_balance': matrix.closing_balance
+    }
+
+
+def facility_rollups(period, start_date, end_date, today):
+    items = StockItem.query.order_by(StockItem.item_name).all()
+    # Names before loading: storing new aggregates commits and expires the items
+    names = {item.id: (item.item_name, item.unit) for item in items}
+    return [dict(row, item=names[row['stock_item_id']])
+            for row in load_rollups(items, period, start_date, end_date, today)]
+
+
+# Merging: items are matched across facilities by name and unit, as ids differ per database
+
+def merge_stock(results, low_stock_days):
+    """District stock per item, with each facility's balance and status"""
+    merged = {}
+    for facility, rows in results.items():
+        for row in rows:
+            entry = merged.setdefault((row['item_name'], row['unit']), {
+                'item_name': row['item_name'], 'unit': row['unit'], 'balance': 0.0, 'daily_use': 0.0,
+                'as_of': None, 'facilities': {}
+            })
+            entry['balance'] += row['balance']
+            entry['daily_use'] += row['daily_use']
+            entry['facilities'][facility] = {'balance': row['balance'], 'status': row['status']}
+            if row['as_of'] is not None and (entry['as_of'] is None or row['as_of'] > entry['as_of']):
+                entry['as_of'] = row['as_of']
+    rows = []
+    for key in sorted(merged):
+        entry = merged[key]
+        entry['days_of_cover'], entry['status'] = stock_status(entry['balance'], entry['daily_use'], low_stock_days)
+        rows.append(entry)
+    return rows
+
+
+def merge_movement(results, start_date):
+    """District summary per item for the range, shaped like StockMatrix.summaries()"""
+    merged = {}
+    for facility, result in results.items():
+        for row, key in enumerate(result['items']):
+            entry = merged.setdefault(key, {'facilities': [], 'opening_balance': 0.0, 'incoming_stock': 0.0,
+                                            'consumption': 0.0, 'closing': 0.0})
+            entry['facilities'].append(facility)
+            entry['opening_balance'] += float(result['opening_balance'][row])
+            entry['incoming_stock'] += float(result['incoming_stock'][row])
+            entry['consumption'] += float(result['consumption'][row])
+            # The district's lowest day needs the summed daily balances
+            entry['closing'] = entry['closing'] + result['closing_balance'][row]
+    rows = []
+    for (item_name, unit), entry in sorted(merged.items()):
+        closing = entry.pop('closing')
+        lowest = int(closing.argmin())
+        rows.append(dict(entry, item_name=item_name, unit=unit, closing_balance=float(closing[-1]),
+                         lowest_balance=float(closing[lowest]), lowest_date=start_date + timedelta(days=lowest)))
+    return rows
+
+
+def merge_rollups(results):
+    """District rollup rows per item and period, each aggregate summed over facilities"""
+    merged = {}
+    for rows in results.values():
+        for row in rows:
+            key = (row['item'], row['period_start'])
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = dict({field: row[field] for field in AGGREGATE_FIELDS}, item_name=row['item'][0],
+                                   unit=row['item'][1], period_start=row['period_start'], period_end=row['period_end'])
+            else:
+                for field in AGGREGATE_FIELDS:
+                    entry[field] += row[field]
+    return [merged[key] for key in sorted(merged)]
@@ -1,9 +1,74 @@
+import csv
 import io
-from datetime import datetime, timedelta
-import pandas as pd
-from fpdf import FPDF
-from models import db, StockItem, StockInventory, ScaleEntry, RasanRecord
-from sqlalchemy import func
+import json
+import re
+import tempfile
+from datetime import timedelta
+from models import StockItem
+from ledger import build_daily_ledger, build_stock_matrix
+
+# fpdf and xlsxwriter are imported on first export rather than here, so workers
+# serving only CRUD pages never load them (see benchmarks/import_time.py)
+
+# Report columns in display order: (record key, header, kind)
+LEDGER_COLUMNS = [
+    ('date', 'Date', 'date'),
+    ('day_name', 'Day', 'text'),
+    ('opening_balance', 'Opening', 'number'),
+    ('incoming_stock', 'Incoming', 'number'),
+    ('total_stock', 'Total Stock', 'number'),
+    ('kedi_total', 'Prisoners', 'int'),
+    ('scale_value', 'Scale', 'scale'),
+    ('consumption', 'Used', 'number'),
+    ('closing_balance', 'Closing', 'number')
+]
+SUMMARY_COLUMNS = [
+    ('item_name', 'Item', 'text'),
+    ('unit', 'Unit', 'text'),
+    ('opening_balance', 'Opening', 'number'),
+    ('incoming_stock', 'Incoming', 'number'),
+    ('consumption', 'Used', 'number'),
+    ('closing_balance', 'Closing', 'number'),
+    ('lowest_balance', 'Lowest', 'number'),
+    ('lowest_date', 'Lowest On', 'date')
+]
+ROLLUP_COLUMNS = [
+    ('item_name', 'Item', 'text'),
+    ('unit', 'Unit', 'text'),
+    ('period_label', 'Period', 'text'),
+    ('period_start', 'From', 'date'),
+    ('period_end', 'To', 'date'),
+    ('opening_balance', 'Opening', 'number'),
+    ('incoming_stock', 'Incoming', 'number'),
+    ('head_count', 'Prisoner-days', 'int'),
+    ('consumption', 'Used', 'number'),
+    ('closing_balance', 'Closing', 'number')
+]
+PLAN_COLUMNS = [
+    ('item_name', 'Item', 'text'),
+    ('unit', 'Unit', 'text'),
+    ('required', 'Required', 'number'),
+    ('balance', 'In Stock', 'number'),
+    ('incoming_stock', 'Booked', 'number'),
+    ('shortfall', 'To Order', 'number'),
+    ('runs_out', 'Runs Out', 'text')
+]
+
+# Items computed per ledger matrix when exporting every item
+ITEM_CHUNK_SIZE = 25
+
+# Rows in an Excel worksheet; longer all-items exports continue on another sheet
+EXCEL_MAX_ROWS = 1048576
+
+# Rows buffered before each chunk of a streamed text export is yielded
+STREAM_BATCH_ROWS = 500
+
+# PDF column widths (mm) for LEDGER_COLUMNS and SUMMARY_COLUMNS
+PDF_PORTRAIT_WIDTHS = [22, 15, 18, 18, 20, 17, 15, 18, 18]
+PDF_LANDSCAPE_WIDTHS = [32, 26, 30, 30, 30, 26, 24, 30, 30]
+PDF_SUMMARY_WIDTHS = [70, 20, 30, 30, 30, 30, 30, 27]
+PDF_ALIGN = {'date': 'C', 'text': 'C', 'number': 'R', 'int': 'R', 'scale': 'R'}
+
 
 class ReportExporter:
     def __init__(self, item_id, start_date, end_date):
@@ -12,124 +77,14 @@ class ReportExporter:
         self.start_date = start_date
         self.end_date = end_date
         self.item = StockItem.query.get_or_404(item_id)
-        self.scale_entries = self._get_scale_entries()
-        self.inventory_transactions = self._get_inventory_transactions()
-        self.prisoner_records = self._get_prisoner_records()
-        self.opening_balance = self._calculate_opening_balance()
-        self.records = self._generate_records()
-
-    def _get_scale_entries(self):
-        """Get all scale entries for the item within date range"""
-        return ScaleEntry.query.filter(
-            ScaleEntry.stock_item_id == self.item_id,
-            ScaleEntry.start_date <= self.end_date,
-            ScaleEntry.end_date >= self.start_date
-        ).order_by(ScaleEntry.start_date).all()
-
-    def _get_inventory_transactions(self):
-        """Get all inventory transactions for the item within date range"""
-        return StockInventory.query.filter(
-            StockInventory.stock_item_id == self.item_id,
-            StockInventory.date.between(self.start_date, self.end_date)
-        ).order_by(StockInventory.date).all()
-
-    def _get_prisoner_records(self):
-        """Get all prisoner records within date range"""
-        return RasanRecord.query.filter(
-            RasanRecord.date.between(self.start_date, self.end_date)
-        ).order_by(RasanRecord.date).all()
-
-    def _calculate_opening_balance(self):
-        """Calculate opening balance from transactions before start date"""
-        return db.session.query(
-            func.sum(StockInventory.quantity).label('total')
-        ).filter(
-            StockInventory.stock_item_id == self.item_id,
-            StockInventory.date < self.start_date
-        ).scalar() or 0.0
-
-    def _generate_records(self):
-        """Generate daily stock movement records"""
-        records = []
-        current_date = self.start_date
-        opening_balance = float(self.opening_balance)
-        
-        while current_date <= self.end_date:
-            day_record = self._create_day_record(current_date, opening_balance)
-            records.append(day_record)
-            opening_balance = day_record['closing_balance']
-            current_date += timedelta(days=1)
-        
-        return records
-
-    def _create_day_record(self, current_date, opening_balance):
-        """Create a record for a single day"""
-        day_record = {
-            'date': current_date,
-            'day_name': current_date.strftime('%A'),
-            'opening_balance': float(opening_balance),
-            'incoming_stock': 0.0,
-            'total_stock': float(opening_balance),
-            'kedi_total': 0,
-            'scale_value': 0.0,
-            'consumption': 0.0,
-            'closing_balance': float(opening_balance)
-        }
-
-        # Calculate incoming stock
-        for transaction in self.inventory_transactions:
-            if transaction.date == current_date:
-                day_record['incoming_stock'] += float(transaction.quantity)
-
-        day_record['total_stock'] = day_record['opening_balance'] + day_record['incoming_stock']
-
-        # Calculate prisoner count
-        prisoner_record = next((r for r in self.prisoner_records if r.date == current_date), None)
-        if prisoner_record:
-            day_record['kedi_total'] = (prisoner_record.kedi_m + prisoner_record.kedi_f) - \
-                                     (prisoner_record.tifin_m + prisoner_record.tifin_f + 
-                                      prisoner_record.medical_m + prisoner_record.medical_f)
-
-        # Get scale value for day of week
-        for scale in self.scale_entries:
-            if scale.start_date <= current_date <= scale.end_date:
-                day_record['scale_value'] = float(getattr(scale, day_record['day_name'].lower(), 0.0))
-                break
-
-        day_record['consumption'] = day_record['kedi_total'] * day_record['scale_value']
-        day_record['closing_balance'] = day_record['total_stock'] - day_record['consumption']
-
-        return day_record
+        self.ledger = build_daily_ledger(self.item, start_date, end_date)
 
     def export_excel(self):
-        """Export the report to Excel format"""
+        """Export the report to Excel format, streamed to a temporary file"""
         try:
-            # Create main DataFrame from records
-            main_df = pd.DataFrame.from_records(self.records)
-            
-            # Create totals row separately
-            totals_row = self._create_totals_row(main_df)
-            
-            # Combine main data and totals row
-            df = pd.concat([main_df, totals_row], ignore_index=True)
-            
-            # Format and rename columns
-            df = self._format_dataframe(df)
-            
-            # Handle date formatting (skip for totals row)
-            df['date'] = df.apply(
-                lambda row: row['date'].strftime('%Y-%m-%d') if row.name < len(self.records) else 'Total',
-                axis=1
-            )
-
-            # Create Excel file in memory
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Daily Stock', index=False)
-                self._format_excel(writer, df)
-            
-            output.seek(0)
-            return output
+            writer = ExcelLedgerWriter()
+            writer.add_ledger_sheet('Daily Stock', self.ledger)
+            return writer.close()
         
         except Exception as e:
             raise Exception(f"Excel export error: {str(e)}")
@@ -137,6 +92,7 @@ class ReportExporter:
     def export_pdf(self):
         """Export the report to PDF format"""
         try:
+            from fpdf import FPDF
             pdf = FPDF()
             pdf.add_page()
             pdf.set_auto_page_break(auto=True, margin=15)
@@ -144,11 +100,13 @@ class ReportExporter:
             # Add header with title and metadata
             self._add_pdf_header(pdf)
             
-            # Create main data table
-            self._add_pdf_table(pdf)
+            # Totals are computed once by the ledger and shared by the table and summary
+            totals = self.ledger.totals()
+            add_pdf_ledger_table(pdf, self.ledger, totals, PDF_PORTRAIT_WIDTHS)
             
             # Add summary section
-            self._add_pdf_summary(pdf)
+            if totals:
+                self._add_pdf_summary(pdf, totals)
             
             # Save to buffer
             output = io.BytesIO()
@@ -159,93 +117,6 @@ class ReportExporter:
         except Exception as e:
             raise Exception(f"PDF export error: {str(e)}")
 
-    def _create_totals_row(self, df):
-        """Create a totals row for the DataFrame"""
-        return pd.DataFrame({
-            'date': ['Total'],  # Explicit string value
-            'day_name': [''],
-            'opening_balance': [df['opening_balance'].iloc[0]],
-            'incoming_stock': [df['incoming_stock'].sum()],
-            'total_stock': [''],
-            'kedi_total': [df['kedi_total'].sum()],
-            'scale_value': [''],
-            'consumption': [df['consumption'].sum()],
-            'closing_balance': [df['closing_balance'].iloc[-1]]
-        })
-
-    def _format_dataframe(self, df):
-        """Format and rename DataFrame columns"""
-        column_mapping = {
-            'date': 'Date',
-            'day_name': 'Day',
-            'opening_balance': 'Opening',
-            'incoming_stock': 'Incoming',
-            'total_stock': 'Total Stock',
-            'kedi_total': 'Prisoners',
-            'scale_value': 'Scale',
-            'consumption': 'Used',
-            'closing_balance': 'Closing'
-        }
-        return df.rename(columns=column_mapping)
-
-    def _format_excel(self, writer, df):
-        """Apply formatting to Excel file"""
-        workbook = writer.book
-        worksheet = writer.sheets['Daily Stock']
-        
-        # Header formatting
-        header_format = workbook.add_format({
-            'bold': True, 
-            'bg_color': '#4472C4', 
-            'font_color': 'white', 
-            'border': 1,
-            'align': 'center'
-        })
-        
-        # Number formatting
-        num_format = workbook.add_format({'num_format': '0.00', 'align': 'right'})
-        int_format = workbook.add_format({'num_format': '0', 'align': 'right'})
-        text_format = workbook.add_format({'align': 'center'})
-        
-        # Apply column formatting
-        for col_num, col_name in enumerate(df.columns):
-            worksheet.write(0, col_num, col_name, header_format)
-            
-            if col_name in ['Opening', 'Incoming', 'Total Stock', 'Scale', 'Used', 'Closing']:
-                worksheet.set_column(col_num, col_num, 12, num_format)
-            elif col_name == 'Prisoners':
-                worksheet.set_column(col_num, col_num, 12, int_format)
-            else:
-                worksheet.set_column(col_num, col_num, 12, text_format)
-        
-        # Total row formatting
-        total_format = workbook.add_format({
-            'bold': True, 
-            'top': 2, 
-            'num_format': '0.00',
-            'align': 'right'
-        })
-        
-        last_row = len(df)
-        for col_num, col_name in enumerate(df.columns):
-            if col_name in ['Opening', 'Incoming', 'Used', 'Closing']:
-                worksheet.write(last_row, col_num, df[col_name].iloc[-1], total_format)
-            elif col_name == 'Prisoners':
-                worksheet.write(last_row, col_num, df[col_name].iloc[-1], 
-                              workbook.add_format({'bold': True, 'top': 2, 'num_format': '0', 'align': 'right'}))
-        
-        # Add title and metadata
-        title_format = workbook.add_format({
-            'bold': True, 
-            'size': 16, 
-            'align': 'center',
-            'valign': 'vcenter'
-        })
-        
-        worksheet.merge_range('A1:I1', f'Daily Stock - {self.item.item_name}', title_format)
-        worksheet.write('A2', f'Period: {self.start_date} to {self.end_date}')
-        worksheet.write('A3', f'Unit: {self.item.unit}')
-
     def _add_pdf_header(self, pdf):
         """Add header to PDF document"""
         pdf.set_font('Arial', 'B', 16)
@@ -255,72 +126,13 @@ class ReportExporter:
         pdf.cell(0, 8, f'Unit: {self.item.unit}', 0, 1, 'C')
         pdf.ln(5)
 
-    def _add_pdf_table(self, pdf):
-        """Add data table to PDF"""
-        # Table header
-        pdf.set_font('Arial', 'B', 10)
-        col_widths = [22, 15, 15, 15, 20, 15, 15, 15, 15]
-        headers = ['Date', 'Day', 'Opening', 'Incoming', 'Total Stock', 
-                 'Prisoners', 'Scale', 'Used', 'Closing']
-        
-        # Draw header row
-        for i, header in enumerate(headers):
-            pdf.cell(col_widths[i], 10, header, 1, 0, 'C')
-        pdf.ln()
-        
-        # Table rows
-        pdf.set_font('Arial', '', 10)
-        for record in self.records:
-            self._add_pdf_table_row(pdf, record, col_widths)
-        
-        # Totals row
-        pdf.set_font('Arial', 'B', 10)
-        totals = self._calculate_pdf_totals()
-        self._add_pdf_table_row(pdf, totals, col_widths, is_total=True)
-
-    def _add_pdf_table_row(self, pdf, record, col_widths, is_total=False):
-        """Add a single row to PDF table"""
-        if is_total:
-            pdf.set_fill_color(230, 230, 230)
-        else:
-            pdf.set_fill_color(255, 255, 255)
-        
-        # Prepare cell values
-        cells = [
-            record['date'].strftime('%Y-%m-%d') if not is_total else 'TOTAL',
-            record['day_name'] if not is_total else '',
-            f"{record['opening_balance']:.2f}",
-            f"{record['incoming_stock']:.2f}" if not is_total else f"{sum(r['incoming_stock'] for r in self.records):.2f}",
-            f"{record['total_stock']:.2f}" if not is_total else '',
-            str(record['kedi_total']) if not is_total else str(sum(r['kedi_total'] for r in self.records)),
-            f"{record['scale_value']:.3f}" if not is_total else '',
-            f"{record['consumption']:.2f}" if not is_total else f"{sum(r['consumption'] for r in self.records):.2f}",
-            f"{record['closing_balance']:.2f}" if not is_total else f"{self.records[-1]['closing_balance']:.2f}"
-        ]
-        
-        # Draw cells
-        for i, cell in enumerate(cells):
-            pdf.cell(col_widths[i], 10, cell, 1, 0, 'C', True)
-        pdf.ln()
-
-    def _calculate_pdf_totals(self):
-        """Calculate totals for PDF report"""
-        return {
-            'opening_balance': self.records[0]['opening_balance'],
-            'incoming_stock': sum(r['incoming_stock'] for r in self.records),
-            'kedi_total': sum(r['kedi_total'] for r in self.records),
-            'consumption': sum(r['consumption'] for r in self.records),
-            'closing_balance': self.records[-1]['closing_balance']
-        }
-
-    def _add_pdf_summary(self, pdf):
+    def _add_pdf_summary(self, pdf, totals):
         """Add summary section to PDF"""
         pdf.ln(10)
         pdf.set_font('Arial', 'B', 12)
         pdf.cell(0, 10, 'Summary', 0, 1)
         pdf.set_font('Arial', '', 10)
         
-        totals = self._calculate_pdf_totals()
         net_change = totals['incoming_stock'] - totals['consumption']
         
         summary_data = [
@@ -331,4 +143,459 @@ class ReportExporter:
         
         for label, value in summary_data:
             pdf.cell(60, 8, label, 0, 0)
-            pdf.cell(0, 8, value, 0, 1)
\ No newline at end of file
+            pdf.cell(0, 8, value, 0, 1)
+
+
+class ExcelLedgerWriter:
+    """Writes report sheets row by row using xlsxwriter's constant_memory mode"""
+
+    def __init__(self):
+        # Rows are flushed to disk as they are written; the zip lands in a temp file
+        self.output = tempfile.TemporaryFile()
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(self.output, {'constant_memory': True})
+        self.sheet_names = set()
+        self.ledger_sheets = 0
+        self.ledger_sheet = None
+        self.title_format = self.workbook.add_format({'bold': True, 'size': 16, 'align': 'center', 'valign': 'vcenter'})
+        self.header_format = self.workbook.add_format({
+            'bold': True,
+            'bg_color': '#4472C4',
+            'font_color': 'white',
+            'border': 1,
+            'align': 'center'
+        })
+        self.section_format = self.workbook.add_format({'bold': True, 'size': 12})
+        self.formats = {
+            'date': self.workbook.add_format({'num_format': 'yyyy-mm-dd', 'align': 'center'}),
+            'text': self.workbook.add_format({'align': 'center'}),
+            'number': self.workbook.add_format({'num_format': '0.00', 'align': 'right'}),
+            'int': self.workbook.add_format({'num_format': '0', 'align': 'right'}),
+            'scale': self.workbook.add_format({'num_format': '0.000', 'align': 'right'})
+        }
+        self.total_formats = {
+            'number': self.workbook.add_format({'bold': True, 'top': 2, 'num_format': '0.00', 'align': 'right'}),
+            'int': self.workbook.add_format({'bold': True, 'top': 2, 'num_format': '0', 'align': 'right'}),
+            'text': self.workbook.add_format({'bold': True, 'top': 2, 'align': 'center'})
+        }
+
+    def _sheet_name(self, name):
+        """Excel sheet names are unique, at most 31 chars and exclude []:*?/\\"""
+        base = re.sub(r'[\[\]:*?/\\]', '-', name)[:31] or 'Sheet'
+        candidate, n = base, 1
+        while candidate.lower() in self.sheet_names:
+            n += 1
+            suffix = f' ({n})'
+            candidate = base[:31 - len(suffix)] + suffix
+        self.sheet_names.add(candidate.lower())
+        return candidate
+
+    def _start_sheet(self, name, title, lines, columns, with_header=True):
+        """Create a sheet with title lines and, unless with_header is False, a header row; returns (sheet, next row)"""
+        sheet = self.workbook.add_worksheet(self._sheet_name(name))
+        sheet.merge_range(0, 0, 0, len(columns) - 1, title, self.title_format)
+        for row, line in enumerate(lines, start=1):
+            sheet.write(row, 0, line)
+        for col, (_, header, kind) in enumerate(columns):
+            sheet.set_column(col, col, 22 if header == 'Item' else 12)
+        row = len(lines) + 2
+        return sheet, self._write_header(sheet, row, columns) if with_header else row
+
+    def _write_header(self, sheet, row, columns):
+        for col, (_, header, kind) in enumerate(columns):
+            sheet.write(row, col, header, self.header_format)
+        return row + 1
+
+    def _write_row(self, sheet, row, columns, values):
+        # Typed writers skip xlsxwriter's per-cell type sniffing
+        for col, (key, _, kind) in enumerate(columns):
+            if kind == 'date':
+                sheet.write_datetime(row, col, values[key], self.formats['date'])
+            elif kind == 'text':
+                sheet.write_string(row, col, values[key], self.formats['text'])
+            else:
+                sheet.write_number(row, col, values[key], self.formats[kind])
+
+    def add_ledger_sheet(self, name, ledger):
+        """Write one item's daily ledger followed by its totals row"""
+        item = ledger.item
+        sheet, row = self._start_sheet(
+            name,
+            f'Daily Stock - {item.item_name}',
+            [f'Period: {ledger.start_date} to {ledger.end_date}', f'Unit: {item.unit}'],
+            LEDGER_COLUMNS
+        )
+        self._write_ledger_rows(sheet, row, ledger)
+
+    def _write_ledger_rows(self, sheet, row, ledger):
+        """Write the daily rows and totals row; returns the next free row"""
+        for record in ledger.records():
+            self._write_row(sheet, row, LEDGER_COLUMNS, record)
+            row += 1
+
+        totals = ledger.totals()
+        if totals:
+            sheet.write(row, 0, 'Total', self.total_formats['text'])
+            for col, (key, _, kind) in enumerate(LEDGER_COLUMNS):
+                if key in totals:
+                    sheet.write(row, col, totals[key], self.total_formats[kind])
+            row += 1
+        return row
+
+    def add_ledger_section(self, ledger, start_date, end_date):
+        """Append one item's daily ledger to the shared 'Daily Stock' sheet
+
+        Every item goes on the same sheet, one titled section each: xlsxwriter
+        keeps a temp file open per constant_memory sheet, so a sheet per item
+        ran out of file descriptors on large item lists. A section that would
+        pass Excel's row limit starts a continuation sheet instead.
+        """
+        # Title, header, one row per day, totals, blank line
+        rows = len(ledger) + 4
+        if self.ledger_sheet is None or self.ledger_row + rows > EXCEL_MAX_ROWS:
+            self.ledger_sheets += 1
+            name = 'Daily Stock' if self.ledger_sheets == 1 else f'Daily Stock ({self.ledger_sheets})'
+            self.ledger_sheet, self.ledger_row = self._start_sheet(
+                name, 'Daily Stock - All Items', [f'Period: {start_date} to {end_date}'], LEDGER_COLUMNS, with_header=False
+            )
+        sheet, row = self.ledger_sheet, self.ledger_row
+        sheet.write_string(row, 0, f'{ledger.item.item_name} ({ledger.item.unit})', self.section_format)
+        row = self._write_header(sheet, row + 1, LEDGER_COLUMNS)
+        self.ledger_row = self._write_ledger_rows(sheet, row, ledger) + 1
+
+    def start_summary_sheet(self, start_date, end_date):
+        """Create the all-items summary sheet; rows are added with add_summary_row"""
+        self.summary_sheet, self.summary_row = self._start_sheet(
+            'Summary',
+            'Daily Stock - All Items',
+            [f'Period: {start_date} to {end_date}'],
+            SUMMARY_COLUMNS
+        )
+
+    def add_summary_row(self, summary):
+        values = dict(summary, item_name=summary['item'].item_name, unit=summary['item'].unit)
+        self._write_row(self.summary_sheet, self.summary_row, SUMMARY_COLUMNS, values)
+        self.summary_row += 1
+
+    def add_rollup_sheet(self, title, start_date, end_date, rows):
+        """Write period rollup rows (see rollups.load_rollups), one per item and period"""
+        sheet, row = self._start_sheet(title, f'{title} Consumption - All Items',
+                                       [f'Period: {start_date} to {end_date}'], ROLLUP_COLUMNS)
+        for values in rows:
+            self._write_row(sheet, row, ROLLUP_COLUMNS, values)
+            row += 1
+
+    def add_plan_sheets(self, plan):
+        """Write a ration plan (forecast.StockForecast): the shortfall list, then each item's daily requirement"""
+        period = f'Period: {plan.start_date} to {plan.end_date}'
+        head_count = f'Head count: {plan.head_counts.mean():.0f} per day ({plan.method})'
+        sheet, row = self._start_sheet('Shortfall', 'Ration Plan - Purchase Shortfall', [period, head_count], PLAN_COLUMNS)
+        for values in sorted(plan.rows(), key=lambda values: (-values['shortfall'], values['item_name'])):
+            runs_out = values['stockout_date'].strftime('%d-%m-%Y') if values['stockout_date'] else ''
+            self._write_row(sheet, row, PLAN_COLUMNS, dict(values, runs_out=runs_out))
+            row += 1
+
+        # Items down, days across; rows are written in order for constant_memory
+        matrix = plan.matrix
+        days = [plan.start_date + timedelta(days=i) for i in range(plan.horizon)]
+        columns = [('item_name', 'Item', 'text'), ('unit', 'Unit', 'text')] + [
+            (None, day.strftime('%d-%m'), 'number') for day in days
+        ]
+        sheet, row = self._start_sheet('Daily Requirement', 'Ration Plan - Daily Requirement', [period, head_count], columns)
+        for item, required in zip(matrix.items, matrix.consumption.tolist()):
+            sheet.write_string(row, 0, item.item_name, self.formats['text'])
+            sheet.write_string(row, 1, item.unit, self.formats['text'])
+            for col, value in enumerate(required, start=2):
+                sheet.write_number(row, col, value, self.formats['scale'])
+            row += 1
+
+    def close(self):
+        """Finish the workbook and return the file positioned for reading"""
+        self.workbook.close()
+        self.output.seek(0)
+        return self.output
+
+
+class AllItemsReportExporter:
+    """Exports the daily stock movement of every item without holding the whole range in memory
+
+    items restricts the export to a subset; progress, if given, is called as
+    progress(done, total) while the export is built.
+    """
+
+    def __init__(self, start_date, end_date, chunk_size=ITEM_CHUNK_SIZE, items=None, progress=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.chunk_size = chunk_size
+        if items is None:
+            items = StockItem.query.order_by(StockItem.item_name).all()
+        self.items = items
+        self.progress = progress
+
+    def _report_progress(self, done, total):
+        if self.progress:
+            self.progress(done, total)
+
+    def matrices(self):
+        """Yield ledger matrices for consecutive chunks of items"""
+        for i in range(0, len(self.items), self.chunk_size):
+            yield build_stock_matrix(self.items[i:i + self.chunk_size], self.start_date, self.end_date)
+
+    def export_pdf(self):
+        """Export a landscape PDF: an all-items summary, then each item's daily table"""
+        try:
+            from fpdf import FPDF
+            pdf = FPDF(orientation='L')
+            pdf.set_auto_page_break(auto=True, margin=12)
+            pdf.add_page()
+            pdf.set_font('Arial', 'B', 16)
+            pdf.cell(0, 10, 'Daily Stock Movement - All Items', 0, 1, 'C')
+            pdf.set_font('Arial', '', 11)
+            pdf.cell(0, 7, f'Period: {self.start_date} to {self.end_date}', 0, 1, 'C')
+            pdf.ln(3)
+
+            # Summary table first; the item sections recompute their chunk so
+            # only one chunk's matrix is held at a time
+            # Progress counts each item twice: once in the summary, once for its section
+            total, done = 2 * len(self.items), 0
+            summary_table = PdfTableWriter(pdf, SUMMARY_COLUMNS, PDF_SUMMARY_WIDTHS)
+            for matrix in self.matrices():
+                summary_table.write_rows(pdf_summary_rows(matrix.summaries()))
+                done += len(matrix.items)
+                self._report_progress(done, total)
+            summary_table.finish()
+
+            for matrix in self.matrices():
+                for index, item in enumerate(matrix.items):
+                    pdf.add_page()
+                    pdf.set_font('Arial', 'B', 13)
+                    pdf.cell(0, 9, f"{item.item_name} ({item.unit})", 0, 1)
+                    ledger = matrix.ledger(index)
+                    add_pdf_ledger_table(pdf, ledger, ledger.totals(), PDF_LANDSCAPE_WIDTHS)
+                    done += 1
+                    self._report_progress(done, total)
+
+            output = io.BytesIO()
+            pdf.output(output)
+            output.seek(0)
+            return output
+        
+        except Exception as e:
+            raise Exception(f"PDF export error: {str(e)}")
+
+    def export_excel(self):
+        """Export a summary sheet plus a daily sheet with one section per item"""
+        try:
+            writer = ExcelLedgerWriter()
+            writer.start_summary_sheet(self.start_date, self.end_date)
+            done = 0
+            for matrix in self.matrices():
+                for index, summary in enumerate(matrix.summaries()):
+                    writer.add_summary_row(summary)
+                    writer.add_ledger_section(matrix.ledger(index), self.start_date, self.end_date)
+                    done += 1
+                    self._report_progress(done, len(self.items))
+            return writer.close()
+        
+        except Exception as e:
+            raise Exception(f"Excel export error: {str(e)}")
+
+
+class PdfTableWriter:
+    """Draws a table in page-sized chunks, repeating the header on every page.
+
+    Row values are placed with pdf.text() rather than a bordered, filled
+    pdf.cell() per value; the borders for a whole chunk of rows are drawn once
+    as a grid when the chunk ends.
+    """
+
+    def __init__(self, pdf, columns, widths, row_height=6, font_size=8):
+        self.pdf = pdf
+        self.headers = [header for _, header, _ in columns]
+        self.aligns = [PDF_ALIGN[kind] for _, _, kind in columns]
+        self.widths = widths
+        self.row_height = row_height
+        self.font_size = font_size
+        self.chunk_top = None
+        self.row_lines = []
+
+    def _write_header(self):
+        pdf = self.pdf
+        pdf.set_font('Arial', 'B', self.font_size)
+        pdf.set_fill_color(220, 220, 220)
+        for header, width in zip(self.headers, self.widths):
+            pdf.cell(width, self.row_height, header, border=1, align='C', fill=True)
+        pdf.ln(self.row_height)
+        pdf.set_font('Arial', '', self.font_size)
+        self.chunk_top = pdf.get_y()
+        self.row_lines = []
+
+    def _close_chunk(self):
+        """Draw the grid for the rows written since the last header"""
+        if self.chunk_top is None:
+            return
+        pdf = self.pdf
+        left, bottom = pdf.l_margin, pdf.get_y()
+        right = left + sum(self.widths)
+        for y in self.row_lines:
+            pdf.line(left, y, right, y)
+        x = left
+        pdf.line(x, self.chunk_top, x, bottom)
+        for width in self.widths:
+            x += width
+            pdf.line(x, self.chunk_top, x, bottom)
+        self.chunk_top = None
+
+    def _next_row(self):
+        """Return the y of the next row, breaking the page and repeating the header if needed"""
+        pdf = self.pdf
+        if self.chunk_top is None or pdf.will_page_break(self.row_height):
+            if self.chunk_top is not None:
+                self._close_chunk()
+                pdf.add_page()
+            self._write_header()
+        return pdf.get_y()
+
+    def _draw_text(self, row, y):
+        pdf = self.pdf
+        x = pdf.l_margin
+        # Same baseline and padding pdf.cell() would use
+        baseline = y + 0.5 * self.row_height + 0.3 * pdf.font_size
+        for text, width, align in zip(row, self.widths, self.aligns):
+            if align == 'R':
+                pdf.text(x + width - pdf.c_margin - pdf.get_string_width(text), baseline, text)
+            elif align == 'C':
+                pdf.text(x + (width - pdf.get_string_width(text)) / 2, baseline, text)
+            else:
+                pdf.text(x + pdf.c_margin, baseline, text)
+            x += width
+        pdf.set_y(y + self.row_height)
+        self.row_lines.append(y + self.row_height)
+
+    def write_rows(self, rows):
+        """Write rows (lists of strings) below the current position"""
+        for row in rows:
+            self._draw_text(row, self._next_row())
+
+    def write_total_row(self, row):
+        """Write a shaded, bold totals row and close the table"""
+        pdf = self.pdf
+        y = self._next_row()
+        pdf.set_fill_color(230, 230, 230)
+        pdf.rect(pdf.l_margin, y, sum(self.widths), self.row_height, style='F')
+        pdf.set_font('Arial', 'B', self.font_size)
+        self._draw_text(row, y)
+        self.finish()
+
+    def finish(self):
+        """Close the table so later content starts below its grid"""
+        self._close_chunk()
+        self.pdf.set_font('Arial', '', self.font_size)
+
+
+def pdf_ledger_rows(ledger):
+    """Yield the ledger's daily rows as PDF cell strings"""
+    for record in ledger.records():
+        yield [
+            record['date'].strftime('%Y-%m-%d'),
+            record['day_name'],
+            f"{record['opening_balance']:.2f}",
+            f"{record['incoming_stock']:.2f}",
+            f"{record['total_stock']:.2f}",
+            str(record['kedi_total']),
+            f"{record['scale_value']:.3f}",
+            f"{record['consumption']:.2f}",
+            f"{record['closing_balance']:.2f}"
+        ]
+
+
+def pdf_summary_rows(summaries):
+    """Yield all-items summary rows as PDF cell strings"""
+    for row in summaries:
+        yield [
+            row['item'].item_name,
+            row['item'].unit,
+            f"{row['opening_balance']:.2f}",
+            f"{row['incoming_stock']:.2f}",
+            f"{row['consumption']:.2f}",
+            f"{row['closing_balance']:.2f}",
+            f"{row['lowest_balance']:.2f}",
+            row['lowest_date'].strftime('%Y-%m-%d')
+        ]
+
+
+def add_pdf_ledger_table(pdf, ledger, totals, widths):
+    """Draw an item's daily ledger table followed by its totals row"""
+    table = PdfTableWriter(pdf, LEDGER_COLUMNS, widths)
+    table.write_rows(pdf_ledger_rows(ledger))
+    if totals:
+        table.write_total_row([
+            'TOTAL',
+            '',
+            f"{totals['opening_balance']:.2f}",
+            f"{totals['incoming_stock']:.2f}",
+            '',
+            str(totals['kedi_total']),
+            '',
+            f"{totals['consumption']:.2f}",
+            f"{totals['closing_balance']:.2f}"
+        ])
+    else:
+        table.finish()
+
+
+def iter_item_records(items, start_date, end_date, chunk_size=ITEM_CHUNK_SIZE, progress=None):
+    """Yield (item, daily record) pairs, computing the ledger one chunk of items at a time"""
+    for i in range(0, len(items), chunk_size):
+        matrix = build_stock_matrix(items[i:i + chunk_size], start_date, end_date)
+        for index, item in enumerate(matrix.items):
+            for record in matrix.ledger(index).records():
+                yield item, record
+            if progress:
+                progress(i + index + 1, len(items))
+
+
+def stream_csv(items, start_date, end_date, progress=None):
+    """Yield the daily ledger of the items as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['item_id', 'item_name', 'unit'] + [key for key, _, _ in LEDGER_COLUMNS])
+    rows = 0
+    for item, record in iter_item_records(items, start_date, end_date, progress=progress):
+        writer.writerow([item.id, item.item_name, item.unit, record['date'].isoformat()] +
+                        [record[key] for key, _, _ in LEDGER_COLUMNS[1:]])
+        rows += 1
+        if rows % STREAM_BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(items, start_date, end_date, progress=None):
+    """Yield the daily ledger of the items as newline-delimited JSON chunks"""
+    lines = []
+    for item, record in iter_item_records(items, start_date, end_date, progress=progress):
+        lines.append(json.dumps(dict(record, date=record['date'].isoformat(), item_id=item.id,
+                                     item_name=item.item_name, unit=item.unit)))
+        if len(lines) == STREAM_BATCH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_rollup_csv(rows):
+    """Yield period rollup rows as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['item_id'] + [key for key, _, _ in ROLLUP_COLUMNS])
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([row['stock_item_id']] + [
+            row[key].isoformat() if kind == 'date' else row[key] for key, _, kind in ROLLUP_COLUMNS
+        ])
+        if count % STREAM_BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from flask import g
+from models import StockItem
+from facilities import current_facility
+from export import ReportExporter, AllItemsReportExporter, stream_csv, stream_ndjson
+
+# Export formats: (file extension, mimetype)
+JOB_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': ('pdf', 'application/pdf'),
+    'csv': ('csv', 'text/csv'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+}
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Seconds between progress writes to a running job's state file
+PROGRESS_SAVE_INTERVAL = 0.5
+
+
+class ExportJob:
+    """One queued export and the state reported to polling clients"""
+
+    def __init__(self, key, item_ids, start_date, end_date, fmt, facility=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.facility = facility
+        self.item_ids = item_ids
+        self.start_date = start_date
+        self.end_date = end_date
+        self.format = fmt
+        self.status = 'queued'
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.path = None
+        self.filename = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def pending(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'format': self.format,
+            'item_ids': 'all' if self.item_ids is None else self.item_ids,
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat(),
+            'progress': round(self.done / self.total, 3) if self.total else (1.0 if self.status == 'done' else 0.0),
+            'done': self.done,
+            'total': self.total,
+            'error': self.error,
+            'filename': self.filename,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+    def state(self):
+        """to_dict() plus what another process needs to serve the job"""
+        return dict(self.to_dict(), facility=self.facility,
+                    artifact=os.path.basename(self.path) if self.path else None)
+
+    @classmethod
+    def from_state(cls, state, directory):
+        item_ids = None if state['item_ids'] == 'all' else state['item_ids']
+        job = cls(None, item_ids, date.fromisoformat(state['start_date']), date.fromisoformat(state['end_date']),
+                  state['format'], state['facility'])
+        job.id = state['id']
+        for field in ('status', 'done', 'total', 'error', 'filename', 'created_at', 'finished_at'):
+            setattr(job, field, state[field])
+        job.path = os.path.join(directory, state['artifact']) if state['artifact'] else None
+        return job
+
+
+class ExportJobQueue:
+    """Runs exports on a bounded thread pool and keeps their artifacts on disk.
+
+    Each job's state is kept in <id>.json next to its artifact in directory,
+    so status polls and downloads can be answered by any worker process, not
+    only the one running the job. A pending job also holds a claim file,
+    <hash of its parameters>.pending, naming it, so an identical export
+    submitted to any worker process joins it instead of starting another.
+    Artifacts, state files and claims are removed once older than max_age
+    seconds. Each job runs inside its own application context, on the
+    database of the facility it was submitted from.
+    """
+
+    def __init__(self, app, directory, max_workers=2, max_age=24 * 3600):
+        self.app = app
+        self.directory = directory
+        self.max_age = max_age
+        self._jobs = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export-job')
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, item_ids, start_date, end_date, fmt):
+        """Queue an export (item_ids None = all items); identical pending jobs are shared between processes"""
+        if fmt not in JOB_FORMATS:
+            raise ValueError(f'Unknown export format: {fmt}')
+        if item_ids is not None:
+            item_ids = sorted(set(item_ids))
+        facility = current_facility()
+        key = (facility, tuple(item_ids) if item_ids is not None else 'all', start_date, end_date, fmt)
+
+        self.cleanup()
+        with self._lock:
+            job = self._pending.get(key)
+            if job is not None and job.pending:
+                return job
+            job = ExportJob(key, item_ids, start_date, end_date, fmt, facility)
+            # The state file goes first, so whoever reads the claim can load the job
+            self._save(job)
+            holder = self._claim(job)
+            if holder is not None:
+                os.remove(self._state_path(job.id))
+                return holder
+            self._jobs[job.id] = job
+            self._pending[key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """The job, if it was submitted from the current facility (by any worker process)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load(job_id)
+        return job if job is not None and job.facility == current_facility() else None
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _claim_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.pending')
+
+    def _claim(self, job):
+        """Claim job's parameters for it; returns the pending job of another process holding them, if any"""
+        path = self._claim_path(job.key)
+        temp = f'{path}.{job.id}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(job.id)
+        try:
+            for _ in range(2):
+                try:
+                    # Linking fails if the claim exists, and a claim never exists without its job id
+                    os.link(temp, path)
+                    return None
+                except FileExistsError:
+                    pass
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        holder_id = f.read()
+                except FileNotFoundError:
+                    continue
+                holder = self._load(holder_id)
+                if holder is not None and holder.pending:
+                    return holder
+                # The holder finished, or its state expired, without releasing the claim
+                self._release(path, holder_id)
+            return None
+        finally:
+            os.remove(temp)
+
+    def _release(self, path, job_id):
+        """Remove a claim file if it still names job_id"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                if f.read() != job_id:
+                    return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _save(self, job):
+        """Write the job's state file; replaced whole, so readers never see half of it"""
+        path = self._state_path(job.id)
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(job.state(), f)
+        os.replace(temp, path)
+
+    def _load(self, job_id):
+        """A job run by another worker process, from its state file"""
+        if not JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                return ExportJob.from_state(json.load(f), self.directory)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _progress(self, job):
+        saved_at = time.monotonic()
+        def update(done, total):
+            nonlocal saved_at
+            job.done, job.total = done, total
+            if time.monotonic() - saved_at >= PROGRESS_SAVE_INTERVAL:
+                saved_at = time.monotonic()
+                self._save(job)
+        return update
+
+    def _run(self, job):
+        job.status = 'running'
+        self._save(job)
+        extension, _ = JOB_FORMATS[job.format]
+        path = os.path.join(self.directory, f'{job.id}.{extension}')
+        try:
+            with self.app.app_context():
+                g.facility = job.facility
+                filename = self._export(job, path)
+            job.path, job.filename = path, filename
+            job.status = 'done'
+        except Exception as e:
+            if os.path.exists(path):
+                os.remove(path)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            self._release(self._claim_path(job.key), job.id)
+            with self._lock:
+                if self._pending.get(job.key) is job:
+                    del self._pending[job.key]
+
+    def _export(self, job, path):
+        """Write the job's artifact to path and return its download name"""
+        extension, _ = JOB_FORMATS[job.format]
+        query = StockItem.query.order_by(StockItem.item_name)
+        if job.item_ids is not None:
+            query = query.filter(StockItem.id.in_(job.item_ids))
+        items = query.all()
+        if not items:
+            raise ValueError('No matching stock items')
+        label = items[0].item_name if len(items) == 1 else ('all_items' if job.item_ids is None else f'{len(items)}_items')
+        filename = f'daily_stock_{label}_{job.start_date}_{job.end_date}.{extension}'
+        progress = self._progress(job)
+
+        if job.format in ('csv', 'ndjson'):
+            stream = stream_csv if job.format == 'csv' else stream_ndjson
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                for chunk in stream(items, job.start_date, job.end_date, progress=progress):
+                    f.write(chunk)
+            return filename
+
+        # Single items keep the portrait single-item layout of the direct exports
+        if len(items) == 1:
+            exporter = ReportExporter(items[0].id, job.start_date, job.end_date)
+            output = exporter.export_excel() if job.format == 'xlsx' else exporter.export_pdf()
+            progress(1, 1)
+        else:
+            exporter = AllItemsReportExporter(job.start_date, job.end_date, items=items, progress=progress)
+            output = exporter.export_excel() if job.format == 'xlsx' else exporter.export_pdf()
+        with output, open(path, 'wb') as f:
+            shutil.copyfileobj(output, f)
+        return filename
+
+    def cleanup(self, max_age=None):
+        """Forget finished jobs and delete artifacts and state files older than max_age seconds.
+
+        Files are aged by their mtime, so jobs finished by other worker
+        processes, or by earlier ones, expire as well; a state file is last
+        written when its job finishes. Claims left by a worker process that
+        died mid-job expire the same way.
+        """
+        cutoff = time.time() - (self.max_age if max_age is None else max_age)
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if not job.pending and job.finished_at is not None and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+            # Jobs still running here keep their files, however old
+            live = {path for job in self._jobs.values() if job.pending
+                    for path in (self._state_path(job.id), self._claim_path(job.key))}
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path in live:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff or any(job.path == path for job in expired):
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,98 @@
+import os
+import re
+from contextlib import contextmanager
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+# Where FacilityPrefix leaves the facility named in the URL
+FACILITY_ENVIRON_KEY = 'rasan.facility'
+
+FACILITY_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
+
+def parse_facilities(spec, instance_path):
+    """{name: database URI} from FACILITIES, in the order given.
+
+    spec is a comma-separated list of name=URI pairs; a bare name gets its
+    own SQLite file, instance/<name>.db. The first facility is the default,
+    served without a URL prefix.
+    """
+    facilities = {}
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, uri = entry.partition('=')
+        name = name.strip().lower()
+        if not FACILITY_NAME.match(name) or name in facilities:
+            raise ValueError(f'Bad or repeated facility name in FACILITIES: {name!r}')
+        facilities[name] = uri.strip() or 'sqlite:///' + os.path.join(instance_path, f'{name}.db')
+    return facilities
+
+
+def check_facility_names(names, url_map):
+    """Reject facility names that are also the first segment of a route.
+
+    /<name>/... would be both that facility's prefix and a route of the
+    default facility. Called once every route is registered.
+    """
+    reserved = {rule.rule.split('/')[1] for rule in url_map.iter_rules()}
+    for name in names:
+        if name in reserved:
+            raise ValueError(f'Facility name in FACILITIES is taken by a route: {name!r}')
+
+
+def current_facility():
+    """Facility the current request or job works on; None outside facility mode"""
+    return g.get('facility') if has_app_context() else None
+
+
+@contextmanager
+def use_facility(name):
+    """Route db.session and the per-facility caches to another facility for a while.
+
+    Ids repeat across facility databases, so rows loaded as entities under
+    one facility must not be queried for under another in the same session
+    (district.py gives each facility a session of its own).
+    """
+    previous = g.get('facility')
+    g.facility = name
+    try:
+        yield
+    finally:
+        g.facility = previous
+
+
+class FacilitySession(Session):
+    """db.session that sends every statement to the current facility's database.
+
+    Facilities other than the default are SQLAlchemy binds named after them;
+    the default facility, and everything outside facility mode, uses the
+    default engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = self._db.engines.get(current_facility())
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class FacilityPrefix:
+    """WSGI middleware serving each facility under /<name>/.
+
+    The prefix moves from PATH_INFO to SCRIPT_NAME, so routes stay as they
+    are and url_for() keeps links inside the facility. Unprefixed paths
+    belong to the default facility.
+    """
+
+    def __init__(self, wsgi_app, names):
+        self.wsgi_app = wsgi_app
+        self.names = set(names)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        name = path.split('/', 2)[1] if path.count('/') else ''
+        if name in self.names:
+            environ[FACILITY_ENVIRON_KEY] = name
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/' + name
+            environ['PATH_INFO'] = path[len(name) + 1:] or '/'
+        return self.wsgi_app(environ, start_response)
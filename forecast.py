@@ -0,0 +1,123 @@
+from datetime import timedelta
+import numpy as np
+from ledger import StockMatrix, load_head_counts, load_incoming_matrix, load_scale_matrix, opening_balances
+
+# Ways of projecting the head count over the horizon
+FORECAST_METHODS = ('average', 'trend')
+DEFAULT_HORIZON = 90
+DEFAULT_HISTORY_DAYS = 28
+
+
+def project_head_counts(history, horizon, method='average'):
+    """Projected prisoners fed per day for the horizon following the history window.
+
+    Days without a RasanRecord load as zero and are left out of the fit.
+    'average' repeats their mean; 'trend' extends a least-squares line,
+    never below zero.
+    """
+    recorded = np.flatnonzero(history)
+    if not len(recorded):
+        return np.zeros(horizon)
+    if method == 'trend' and len(recorded) > 1:
+        slope, intercept = np.polyfit(recorded, history[recorded], 1)
+        days = np.arange(len(history), len(history) + horizon)
+        return np.clip(intercept + slope * days, 0.0, None)
+    return np.full(horizon, float(history[recorded].mean()))
+
+
+class StockForecast:
+    """Projected daily stock of many items after today, as one items x horizon matrix.
+
+    Starts from each item's closing balance today, adds receipts already
+    booked for future dates and consumes the projected head count times the
+    item's scale for each coming day. The same matrix gives the ration
+    requirement and purchase shortfall for the horizon.
+    """
+
+    def __init__(self, items, today, horizon=DEFAULT_HORIZON, history_days=DEFAULT_HISTORY_DAYS, method='average',
+                 head_count=None):
+        self.today = today
+        self.horizon = horizon
+        self.history_days = history_days
+        self.start_date = start_date = today + timedelta(days=1)
+        self.end_date = today + timedelta(days=horizon)
+        item_ids = [item.id for item in items]
+        # An expected head count replaces the projection from RasanRecord history
+        if head_count is not None:
+            self.method = 'fixed'
+            self.head_counts = np.full(horizon, float(head_count))
+        else:
+            self.method = method
+            history = load_head_counts(today - timedelta(days=history_days - 1), history_days)
+            self.head_counts = project_head_counts(history, horizon, method)
+        self.matrix = StockMatrix(
+            items,
+            start_date,
+            self.end_date,
+            opening_balances(item_ids, start_date),
+            load_incoming_matrix(item_ids, start_date, horizon),
+            self.head_counts,
+            load_scale_matrix(item_ids, start_date, horizon)
+        )
+
+    def stockout_days(self):
+        """Days after today until each item's balance reaches zero, -1 if it lasts the horizon"""
+        balances = self.matrix.opening_balance[:, 0]
+        empty = self.matrix.closing_balance <= 0
+        days = np.where(empty.any(axis=1), empty.argmax(axis=1) + 1, -1)
+        # Already out of stock today
+        return np.where(balances <= 0, 0, days)
+
+    def shortfalls(self):
+        """Ration each item needs over the horizon beyond its stock and booked receipts"""
+        # A negative balance is unrecorded use, not stock that has to be made up
+        available = np.maximum(self.matrix.opening_balance[:, 0], 0.0) + self.matrix.incoming_stock.sum(axis=1)
+        return np.maximum(self.matrix.consumption.sum(axis=1) - available, 0.0)
+
+    def rows(self):
+        """Yield one forecast dict per item, soonest stock-out first"""
+        matrix = self.matrix
+        required = matrix.consumption.sum(axis=1)
+        columns = zip(
+            matrix.items,
+            matrix.opening_balance[:, 0].tolist(),
+            matrix.incoming_stock.sum(axis=1).tolist(),
+            required.tolist(),
+            (required / max(self.horizon, 1)).tolist(),
+            self.shortfalls().tolist(),
+            matrix.closing_balance[:, -1].tolist(),
+            self.stockout_days().tolist()
+        )
+        rows = []
+        for item, balance, incoming, required, daily_use, shortfall, closing, days_left in columns:
+            rows.append({
+                'item_id': item.id,
+                'item_name': item.item_name,
+                'unit': item.unit,
+                'balance': balance,
+                'incoming_stock': incoming,
+                'required': required,
+                'daily_use': daily_use,
+                'shortfall': shortfall,
+                'closing_balance': closing,
+                'days_left': days_left if days_left >= 0 else None,
+                'stockout_date': self.today + timedelta(days=days_left) if days_left >= 0 else None
+            })
+        rows.sort(key=lambda row: (row['days_left'] is None, row['days_left'] or 0, row['item_name']))
+        return rows
+
+    def to_dict(self):
+        """JSON-ready forecast"""
+        return {
+            'as_of': self.today.isoformat(),
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat(),
+            'horizon': self.horizon,
+            'history_days': self.history_days,
+            'method': self.method,
+            'projected_head_count': self.head_counts.round(1).tolist(),
+            'items': [
+                dict(row, stockout_date=row['stockout_date'] and row['stockout_date'].isoformat())
+                for row in self.rows()
+            ]
+        }
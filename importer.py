@@ -0,0 +1,374 @@
+import csv
+import io
+import math
+from datetime import date, datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from models import db, RasanRecord, StockItem, StockInventory
+
+# Rows validated and inserted per transaction
+IMPORT_BATCH_SIZE = 5000
+
+# Errors reported back to the user; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Records accepted by one call of the JSON upsert API
+MAX_UPSERT_RECORDS = 5000
+
+HEAD_COUNT_FIELDS = ['kedi_m', 'kedi_f', 'tifin_m', 'tifin_f', 'medical_m', 'medical_f']
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y']
+
+
+class ImportResult:
+    """Counts and per-row errors of one import.
+
+    first_date and item_ids describe the rows committed so far, so an
+    import that stops part way can still refresh the ledger for them.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.error = None  # Why the import stopped early, if it did
+        self.first_date = None
+        self.item_ids = set()
+
+    def add_error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'error': self.error
+        }
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def iter_csv_rows(stream):
+    """Yield (row number, {column: value}) from a CSV upload, one line at a time"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    headers = [_normalize_header(h) for h in next(reader, [])]
+    for number, values in enumerate(reader, start=2):
+        if any(v.strip() for v in values):
+            yield number, dict(zip(headers, values))
+
+
+def iter_xlsx_rows(stream):
+    """Yield (row number, {column: value}) from the first sheet of an xlsx upload"""
+    # openpyxl is only needed for spreadsheet imports
+    from openpyxl import load_workbook
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = [_normalize_header(h) for h in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            if any(v not in (None, '') for v in values):
+                yield number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def read_upload(file):
+    """Row iterator for an uploaded CSV or xlsx file (werkzeug FileStorage)"""
+    name = (file.filename or '').lower()
+    if name.endswith('.csv'):
+        return iter_csv_rows(file.stream)
+    if name.endswith('.xlsx'):
+        return iter_xlsx_rows(file.stream)
+    raise ValueError('Upload a .csv or .xlsx file')
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or '').strip()
+    # ISO dates take the fast C path; register formats fall back to strptime
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS[1:]:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'invalid date {text!r}')
+
+
+def _parse_count(row, field):
+    value = row.get(field)
+    if value in (None, ''):
+        return 0
+    number = float(value)
+    # inf would overflow int() below; nan fails every comparison
+    if not math.isfinite(number) or number < 0 or number != int(number):
+        raise ValueError(f'{field} must be a whole number of at least 0')
+    return int(number)
+
+
+def parse_head_count(row):
+    """Validated RasanRecord values from one row"""
+    values = {'date': _parse_date(row.get('date'))}
+    for field in HEAD_COUNT_FIELDS:
+        values[field] = _parse_count(row, field)
+    return values
+
+
+class ReceiptParser:
+    """Validates stock movement rows against the stock items loaded once up front"""
+
+    def __init__(self):
+        items = StockItem.query.all()
+        self.item_ids = {item.id for item in items}
+        self.by_name = {item.item_name.strip().lower(): item.id for item in items}
+
+    def item_id(self, row):
+        raw_item = row.get('item') if row.get('item') not in (None, '') else row.get('stock_item_id')
+        key = str(raw_item or '').strip()
+        # Items may be given by name or by id
+        item_id = self.by_name.get(key.lower())
+        if item_id is None:
+            try:
+                item_id = int(float(key))
+            except ValueError:
+                pass
+        if item_id not in self.item_ids:
+            raise ValueError(f'unknown stock item {key!r}')
+        return item_id
+
+    def parse(self, row):
+        """Validated StockInventory values from one row"""
+        quantity = float(row.get('quantity'))
+        if not math.isfinite(quantity):
+            raise ValueError('quantity must be a finite number')
+        return {
+            'stock_item_id': self.item_id(row),
+            'quantity': quantity,
+            'date': _parse_date(row.get('date')),
+            'notes': str(row.get('notes') or '')
+        }
+
+
+def _parse_ref(row):
+    """Client reference of a stock movement (the API's ref, the import's ref column), or None"""
+    ref = row.get('ref')
+    ref = str(ref).strip()[:64] if ref is not None else ''
+    return ref or None
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_batch(model, values, result):
+    """Insert one validated batch with executemany in its own transaction"""
+    if not values:
+        return
+    # Core insert on the table: a plain executemany without ORM bookkeeping
+    db.session.execute(model.__table__.insert(), values)
+    db.session.commit()
+    result.imported += len(values)
+    first = min(v['date'] for v in values)
+    result.first_date = first if result.first_date is None else min(result.first_date, first)
+    result.item_ids.update(v['stock_item_id'] for v in values if 'stock_item_id' in v)
+
+
+def import_head_counts(rows, batch_size=None, result=None):
+    """Import RasanRecord rows (date plus head count columns); one date per record.
+
+    Batches are committed as they go; pass result to keep the counts of an
+    import that raises part way.
+    """
+    result = ImportResult() if result is None else result
+    seen = set()
+    for batch in _batches(rows, batch_size or IMPORT_BATCH_SIZE):
+        parsed = []
+        for number, row in batch:
+            try:
+                values = parse_head_count(row)
+            except (TypeError, ValueError) as e:
+                result.add_error(number, str(e))
+                continue
+            if values['date'] in seen:
+                result.add_error(number, f"duplicate date {values['date']} in file")
+                continue
+            seen.add(values['date'])
+            parsed.append((number, values))
+
+        # One lookup for every date in the batch
+        existing = set(db.session.scalars(select(RasanRecord.date).where(
+            RasanRecord.date.in_([values['date'] for _, values in parsed])
+        ))) if parsed else set()
+        valid = []
+        for number, values in parsed:
+            if values['date'] in existing:
+                result.add_error(number, f"a record for {values['date']} already exists")
+            else:
+                valid.append(values)
+        _insert_batch(RasanRecord, valid, result)
+    return result
+
+
+def import_stock_receipts(rows, batch_size=None, result=None):
+    """Import StockInventory rows (item id or name, quantity, date, notes, ref).
+
+    Receipts are told apart only by the optional ref column, as with the JSON
+    API: a row whose ref was imported before is reported as already imported,
+    so a file with refs can be re-run after fixing its errors. Rows without a
+    ref are always inserted; two deliveries alike in item, date and quantity
+    are both real.
+    """
+    result = ImportResult() if result is None else result
+    parser = ReceiptParser()
+    seen = set()
+
+    for batch in _batches(rows, batch_size or IMPORT_BATCH_SIZE):
+        parsed = []
+        for number, row in batch:
+            try:
+                values = parser.parse(row)
+                values['source_ref'] = _parse_ref(row)
+            except (TypeError, ValueError) as e:
+                result.add_error(number, str(e))
+                continue
+            if values['source_ref'] is not None:
+                if values['source_ref'] in seen:
+                    result.add_error(number, f"duplicate ref {values['source_ref']!r} in file")
+                    continue
+                seen.add(values['source_ref'])
+            parsed.append((number, values))
+
+        # One lookup for every ref in the batch
+        refs = [values['source_ref'] for _, values in parsed if values['source_ref'] is not None]
+        existing = set(db.session.scalars(select(StockInventory.source_ref).where(
+            StockInventory.source_ref.in_(refs)
+        ))) if refs else set()
+        valid = []
+        for number, values in parsed:
+            if values['source_ref'] in existing:
+                result.add_error(number, f"receipt {values['source_ref']!r} was already imported")
+            else:
+                valid.append(values)
+        _insert_batch(StockInventory, valid, result)
+    return result
+
+
+class UpsertResult:
+    """Per-record outcomes of one JSON upsert call"""
+
+    def __init__(self):
+        self.results = []
+        self.first_date = None
+        self.item_ids = set()
+
+    def record(self, index, status, **details):
+        self.results.append(dict(details, index=index, status=status))
+
+    def touch(self, day, item_id=None):
+        """Note a date (and item) whose ledger must be refreshed"""
+        self.first_date = day if self.first_date is None else min(self.first_date, day)
+        if item_id is not None:
+            self.item_ids.add(item_id)
+
+    def to_dict(self):
+        return {
+            'applied': sum(1 for r in self.results if r['status'] in ('inserted', 'updated')),
+            'failed': sum(1 for r in self.results if r['status'] == 'error'),
+            'results': sorted(self.results, key=lambda r: r['index'])
+        }
+
+
+def _record_fields(record):
+    if not isinstance(record, dict):
+        raise ValueError('record must be a JSON object')
+    return record
+
+
+def upsert_head_counts(records):
+    """Insert or update RasanRecord rows by date in one statement (caller commits)"""
+    result = UpsertResult()
+    valid = {}
+    for index, record in enumerate(records):
+        try:
+            values = parse_head_count(_record_fields(record))
+        except (TypeError, ValueError) as e:
+            result.record(index, 'error', error=str(e))
+            continue
+        if values['date'] in valid:
+            result.record(valid[values['date']][0], 'superseded', by=index)
+        valid[values['date']] = (index, values)
+    if not valid:
+        return result
+
+    # Only labels outcomes; the upsert itself is what makes concurrent posts safe
+    existing = set(db.session.scalars(select(RasanRecord.date).where(RasanRecord.date.in_(valid))))
+    statement = insert(RasanRecord)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['date'],
+        set_={field: statement.excluded[field] for field in HEAD_COUNT_FIELDS}
+    ), [values for _, values in valid.values()])
+    for day, (index, _) in valid.items():
+        result.record(index, 'updated' if day in existing else 'inserted')
+        result.touch(day)
+    return result
+
+
+def upsert_stock_movements(records):
+    """Insert stock movements, updating those whose ref was sent before (caller commits)"""
+    result = UpsertResult()
+    parser = ReceiptParser()
+    keyed, plain = {}, []
+    for index, record in enumerate(records):
+        try:
+            values = parser.parse(_record_fields(record))
+            values['source_ref'] = _parse_ref(record)
+        except (TypeError, ValueError) as e:
+            result.record(index, 'error', error=str(e))
+            continue
+        if values['source_ref'] is None:
+            plain.append((index, values))
+            continue
+        if values['source_ref'] in keyed:
+            result.record(keyed[values['source_ref']][0], 'superseded', by=index)
+        keyed[values['source_ref']] = (index, values)
+
+    if keyed:
+        # Rows being replaced also move the ledger of their old item and date
+        existing = {ref: (item_id, day) for ref, item_id, day in db.session.execute(select(
+            StockInventory.source_ref, StockInventory.stock_item_id, StockInventory.date
+        ).where(StockInventory.source_ref.in_(keyed)))}
+        statement = insert(StockInventory)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['source_ref'],
+            set_={field: statement.excluded[field] for field in ('stock_item_id', 'quantity', 'date', 'notes')}
+        ), [values for _, values in keyed.values()])
+        for ref, (index, values) in keyed.items():
+            if ref in existing:
+                result.touch(existing[ref][1], existing[ref][0])
+            result.record(index, 'updated' if ref in existing else 'inserted')
+            result.touch(values['date'], values['stock_item_id'])
+    if plain:
+        db.session.execute(StockInventory.__table__.insert(), [values for _, values in plain])
+        for index, values in plain:
+            result.record(index, 'inserted')
+            result.touch(values['date'], values['stock_item_id'])
+    return result
@@ -0,0 +1,180 @@
+import heapq
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# One JSON line per sampled request; route it like any other logger
+request_log = logging.getLogger('rasan.requests')
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Slowest statements kept per sampled request
+SLOWEST_STATEMENTS = 3
+
+
+class QueryBudgetExceeded(Exception):
+    """A view issued more SQL statements than its declared budget"""
+
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may issue per request"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return view(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+class RequestMetrics:
+    """Per-process request counters and latency histograms, rendered for Prometheus.
+
+    Every request is counted and timed; SQL time is only known for sampled
+    requests, so it is reported next to the number of sampled requests.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.latency_sum = defaultdict(float)
+        self.statements = defaultdict(int)
+        self.sampled = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+
+    def observe(self, endpoint, method, status, seconds, statements, sql_seconds=None):
+        bucket = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.latency[endpoint][bucket] += 1
+            self.latency_sum[endpoint] += seconds
+            self.statements[endpoint] += statements
+            if sql_seconds is not None:
+                self.sampled[endpoint] += 1
+                self.sql_seconds[endpoint] += sql_seconds
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                '# HELP rasan_requests_total Requests handled.',
+                '# TYPE rasan_requests_total counter',
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'rasan_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            lines += [
+                '# HELP rasan_request_duration_seconds Time spent in the view and its hooks.',
+                '# TYPE rasan_request_duration_seconds histogram',
+            ]
+            for endpoint, counts in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'rasan_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'rasan_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self.latency_sum[endpoint]:.6f}')
+                lines.append(f'rasan_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+            for name, help_text, kind, values in (
+                ('rasan_sql_statements_total', 'SQL statements run.', 'counter', self.statements),
+                ('rasan_sampled_requests_total', 'Requests timed in detail.', 'counter', self.sampled),
+                ('rasan_sql_duration_seconds_total', 'SQL time of sampled requests.', 'counter', self.sql_seconds),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def install_instrumentation(app, engines, metrics):
+    """Time every request, count its statements and check them against the view's budget.
+
+    A sampled share of requests (INSTRUMENTATION_SAMPLE_RATE, always in debug)
+    also times each statement and reports app and SQL time in a Server-Timing
+    header and one JSON line on the rasan.requests logger, with the slowest
+    statements. Statements slower than SLOW_QUERY_MS are logged as warnings.
+    Over-budget requests raise QueryBudgetExceeded when QUERY_BUDGET_STRICT
+    is set (tests and benchmarks/query_budget.py) and are logged otherwise.
+    Statements are counted on every engine given (one per facility).
+    """
+    if not request_log.handlers:
+        request_log.addHandler(logging.StreamHandler())
+        request_log.setLevel(logging.INFO)
+        request_log.propagate = False
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.sampled = app.debug or random.random() < app.config['INSTRUMENTATION_SAMPLE_RATE']
+        if g.sampled:
+            g.sql_seconds = 0.0
+            g.slowest = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        # Transaction control is not a query (see sqlite_profile.on_begin)
+        if has_request_context() and not statement.startswith('BEGIN'):
+            g.query_count = g.get('query_count', 0) + 1
+            if g.get('sampled'):
+                conn.info['statement_started'] = time.perf_counter()
+
+    def time_statement(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('statement_started', None)
+        if started is None or not has_request_context():
+            return
+        seconds = time.perf_counter() - started
+        g.sql_seconds += seconds
+        # Min-heap of the slowest statements seen so far
+        entry = (seconds, ' '.join(statement.split())[:200])
+        if len(g.slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(g.slowest, entry)
+        else:
+            heapq.heappushpop(g.slowest, entry)
+        if seconds * 1000 >= app.config['SLOW_QUERY_MS']:
+            app.logger.warning('slow query in %s: %.1f ms: %s', request.endpoint, seconds * 1000, entry[1])
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        event.listen(engine, 'after_cursor_execute', time_statement)
+
+    @app.after_request
+    def record_request(response):
+        endpoint = request.endpoint or 'unmatched'
+        count = g.get('query_count', 0)
+        started = g.get('request_started')
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            sql_seconds = g.sql_seconds if g.sampled else None
+            metrics.observe(endpoint, request.method, response.status_code, elapsed, count, sql_seconds)
+            if g.sampled:
+                response.headers['Server-Timing'] = (
+                    f'app;dur={elapsed * 1000:.1f}, db;dur={sql_seconds * 1000:.1f};desc="{count} queries"'
+                )
+                request_log.info(json.dumps({
+                    'endpoint': endpoint,
+                    'method': request.method,
+                    'path': request.full_path.rstrip('?'),
+                    'status': response.status_code,
+                    'ms': round(elapsed * 1000, 2),
+                    'queries': count,
+                    'sql_ms': round(sql_seconds * 1000, 2),
+                    'slowest': [{'ms': round(s * 1000, 2), 'sql': sql} for s, sql in sorted(g.slowest, reverse=True)]
+                }))
+
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None)
+        if app.debug or app.testing:
+            response.headers['X-Query-Count'] = str(count)
+        if limit is not None and count > limit:
+            message = f'{request.endpoint} ran {count} queries, budget {limit}'
+            if app.config.get('QUERY_BUDGET_STRICT'):
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
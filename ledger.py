@@ -0,0 +1,246 @@
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import func
+from models import db, StockItem, StockInventory, RasanRecord, DailyBalance
+from scale_index import WEEKDAY_COLUMNS, scale_indexes
+
+DAY_NAMES = [day.capitalize() for day in WEEKDAY_COLUMNS]
+
+
+class DailyLedger:
+    """Columnar day-by-day stock movement for one item over a date range"""
+
+    def __init__(self, item, start_date, end_date, opening_balance, incoming_stock, kedi_total, scale_value):
+        self.item = item
+        self.start_date = start_date
+        self.end_date = end_date
+        self.incoming_stock = incoming_stock
+        self.kedi_total = kedi_total
+        self.scale_value = scale_value
+
+        # Balances follow from a running sum of the daily net movement
+        self.consumption = kedi_total * scale_value
+        net_change = incoming_stock - self.consumption
+        self.closing_balance = float(opening_balance) + np.cumsum(net_change)
+        self.opening_balance = np.concatenate(([float(opening_balance)], self.closing_balance[:-1]))
+        self.total_stock = self.opening_balance + incoming_stock
+
+    def __len__(self):
+        return len(self.incoming_stock)
+
+    def dates(self):
+        """Return the report dates in order"""
+        return [self.start_date + timedelta(days=i) for i in range(len(self))]
+
+    def records(self):
+        """Yield one dict per day in the shape used by the templates and exporters"""
+        columns = zip(
+            self.opening_balance.tolist(),
+            self.incoming_stock.tolist(),
+            self.total_stock.tolist(),
+            self.kedi_total.tolist(),
+            self.scale_value.tolist(),
+            self.consumption.tolist(),
+            self.closing_balance.tolist()
+        )
+        first_weekday = self.start_date.weekday()
+        for i, (opening, incoming, total, kedi, scale, used, closing) in enumerate(columns):
+            yield {
+                'date': self.start_date + timedelta(days=i),
+                'day_name': DAY_NAMES[(first_weekday + i) % 7],
+                'opening_balance': opening,
+                'incoming_stock': incoming,
+                'total_stock': total,
+                'kedi_total': kedi,
+                'scale_value': scale,
+                'consumption': used,
+                'closing_balance': closing
+            }
+
+    def columns(self, decimals=6):
+        """One list per daily column, day i being start_date + i days, for JSON clients"""
+        return {
+            'opening_balance': self.opening_balance.round(decimals).tolist(),
+            'incoming_stock': self.incoming_stock.round(decimals).tolist(),
+            'total_stock': self.total_stock.round(decimals).tolist(),
+            'kedi_total': self.kedi_total.astype(int).tolist(),
+            'scale_value': self.scale_value.round(decimals).tolist(),
+            'consumption': self.consumption.round(decimals).tolist(),
+            'closing_balance': self.closing_balance.round(decimals).tolist()
+        }
+
+    def totals(self):
+        """Return the totals row for the whole range, or None for an empty range"""
+        if not len(self):
+            return None
+        return {
+            'opening_balance': float(self.opening_balance[0]),
+            'incoming_stock': float(self.incoming_stock.sum()),
+            'kedi_total': int(self.kedi_total.sum()),
+            'consumption': float(self.consumption.sum()),
+            'closing_balance': float(self.closing_balance[-1])
+        }
+
+
+class StockMatrix:
+    """Items x days stock movement for many items, computed in one vectorized pass"""
+
+    def __init__(self, items, start_date, end_date, opening_balances, incoming_stock, kedi_total, scale_value):
+        self.items = items
+        self.start_date = start_date
+        self.end_date = end_date
+        self.incoming_stock = incoming_stock
+        self.kedi_total = kedi_total
+        self.scale_value = scale_value
+
+        # Same running sum as DailyLedger, one row per item
+        self.consumption = scale_value * kedi_total
+        net_change = incoming_stock - self.consumption
+        self.closing_balance = opening_balances[:, None] + np.cumsum(net_change, axis=1)
+        self.opening_balance = np.concatenate((opening_balances[:, None], self.closing_balance[:, :-1]), axis=1)
+
+    def __len__(self):
+        return self.incoming_stock.shape[1]
+
+    def ledger(self, index):
+        """Return the DailyLedger for the item at the given row"""
+        return DailyLedger(
+            self.items[index],
+            self.start_date,
+            self.end_date,
+            self.opening_balance[index, 0] if len(self) else 0.0,
+            self.incoming_stock[index],
+            self.kedi_total,
+            self.scale_value[index]
+        )
+
+    def summaries(self):
+        """Yield one summary dict per item for the whole range"""
+        if not len(self):
+            return
+        lowest_day = self.closing_balance.argmin(axis=1)
+        columns = zip(
+            self.items,
+            self.opening_balance[:, 0].tolist(),
+            self.incoming_stock.sum(axis=1).tolist(),
+            self.consumption.sum(axis=1).tolist(),
+            self.closing_balance[:, -1].tolist(),
+            self.closing_balance.min(axis=1).tolist(),
+            lowest_day.tolist()
+        )
+        for item, opening, incoming, used, closing, lowest, lowest_index in columns:
+            yield {
+                'item': item,
+                'opening_balance': opening,
+                'incoming_stock': incoming,
+                'consumption': used,
+                'closing_balance': closing,
+                'lowest_balance': lowest,
+                'lowest_date': self.start_date + timedelta(days=lowest_index)
+            }
+
+
+def _day_offsets(dates, start_date):
+    """Convert a sequence of dates into offsets from start_date"""
+    start = start_date.toordinal()
+    return np.fromiter((d.toordinal() - start for d in dates), dtype=np.int64, count=len(dates))
+
+
+def _row_indexes(item_ids, rows):
+    """Map the item id of each row to its position in item_ids"""
+    position = {item_id: i for i, item_id in enumerate(item_ids)}
+    return np.fromiter((position[item_id] for item_id in rows), dtype=np.int64, count=len(rows))
+
+
+def load_incoming_matrix(item_ids, start_date, day_count):
+    """Incoming stock per item and day, grouped by (item, date) in one query"""
+    incoming = np.zeros((len(item_ids), day_count))
+    if not day_count or not item_ids:
+        return incoming
+    end_date = start_date + timedelta(days=day_count - 1)
+    rows = db.session.query(
+        StockInventory.stock_item_id,
+        StockInventory.date,
+        func.sum(StockInventory.quantity)
+    ).filter(
+        StockInventory.stock_item_id.in_(item_ids),
+        StockInventory.date.between(start_date, end_date)
+    ).group_by(StockInventory.stock_item_id, StockInventory.date).all()
+    if rows:
+        row_items, dates, quantities = zip(*rows)
+        incoming[_row_indexes(item_ids, row_items), _day_offsets(dates, start_date)] = quantities
+    return incoming
+
+
+def load_head_counts(start_date, day_count):
+    """Prisoners fed per day (KEDI - (Tifin + Medical)), zero where no record exists"""
+    head_counts = np.zeros(day_count, dtype=np.int64)
+    if not day_count:
+        return head_counts
+    end_date = start_date + timedelta(days=day_count - 1)
+    rows = db.session.query(
+        RasanRecord.date,
+        (RasanRecord.kedi_m + RasanRecord.kedi_f) -
+        (RasanRecord.tifin_m + RasanRecord.tifin_f + RasanRecord.medical_m + RasanRecord.medical_f)
+    ).filter(
+        RasanRecord.date.between(start_date, end_date)
+    ).all()
+    if rows:
+        dates, counts = zip(*rows)
+        head_counts[_day_offsets(dates, start_date)] = counts
+    return head_counts
+
+
+def load_scale_matrix(item_ids, start_date, day_count):
+    """Dense per-item, per-day ration matrix read from the cached scale indexes"""
+    scale_values = np.zeros((len(item_ids), day_count))
+    if not day_count or not item_ids:
+        return scale_values
+    indexes = scale_indexes(item_ids)
+    for row, item_id in enumerate(item_ids):
+        scale_values[row] = indexes[item_id].daily_array(start_date, day_count)
+    return scale_values
+
+
+def opening_balances(item_ids, start_date):
+    """Closing balance of each item's last materialized day before start_date"""
+    # Snapshots stop once nothing moves, so the latest earlier one is still current;
+    # one (item, date) index seek per item instead of a MAX() over the whole history
+    balances = np.zeros(len(item_ids))
+    if not item_ids:
+        return balances
+    closing = db.session.query(DailyBalance.closing_balance).filter(
+        DailyBalance.stock_item_id == StockItem.id,
+        DailyBalance.date < start_date
+    ).order_by(DailyBalance.date.desc()).limit(1).scalar_subquery()
+    rows = db.session.query(StockItem.id, closing).filter(
+        StockItem.id.in_(item_ids),
+        closing.isnot(None)
+    ).all()
+    if rows:
+        row_items, closing = zip(*rows)
+        balances[_row_indexes(item_ids, row_items)] = closing
+    return balances
+
+
+def build_stock_matrix(items, start_date, end_date, openings=None):
+    """Compute the daily stock movement of many items at once"""
+    day_count = max((end_date - start_date).days + 1, 0)
+    item_ids = [item.id for item in items]
+    if openings is None:
+        openings = opening_balances(item_ids, start_date)
+    return StockMatrix(
+        items,
+        start_date,
+        end_date,
+        np.asarray(openings, dtype=float),
+        load_incoming_matrix(item_ids, start_date, day_count),
+        load_head_counts(start_date, day_count),
+        load_scale_matrix(item_ids, start_date, day_count)
+    )
+
+
+def build_daily_ledger(item, start_date, end_date, opening=None):
+    """Compute the daily stock movement ledger for one item"""
+    openings = None if opening is None else [opening]
+    return build_stock_matrix([item], start_date, end_date, openings).ledger(0)
@@ -0,0 +1,64 @@
+from sqlalchemy import text
+
+
+def add_column(table, column, ddl):
+    """Migration step adding a column unless create_all() already made it"""
+    def step(connection):
+        columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info({table})'))}
+        if column not in columns:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return step
+
+
+# Versioned schema changes that db.create_all() cannot apply to an existing
+# database file. The applied version is stored in SQLite's PRAGMA user_version.
+# Every statement must be safe to run on a database that create_all() just built;
+# steps that need to inspect the schema first are callables taking the connection.
+MIGRATIONS = [
+    (1, 'Composite indexes for report query shapes', [
+        'CREATE INDEX IF NOT EXISTS ix_stock_inventory_item_date '
+        'ON stock_inventory (stock_item_id, date, quantity)',
+        'CREATE INDEX IF NOT EXISTS ix_scale_entry_item_range '
+        'ON scale_entry (stock_item_id, start_date, end_date)',
+        'CREATE INDEX IF NOT EXISTS ix_rasan_record_date_counts '
+        'ON rasan_record (date, kedi_m, kedi_f, tifin_m, tifin_f, medical_m, medical_f)',
+        'ANALYZE',
+    ]),
+    (2, 'Client references for idempotent stock movement upserts', [
+        add_column('stock_inventory', 'source_ref', 'VARCHAR(64)'),
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_stock_inventory_source_ref '
+        'ON stock_inventory (source_ref)',
+    ]),
+    (3, 'Date index for keyset pagination of the inventory list', [
+        'CREATE INDEX IF NOT EXISTS ix_stock_inventory_date ON stock_inventory (date)',
+    ]),
+]
+
+
+def schema_version(connection):
+    """Return the migration version recorded in the database"""
+    return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def upgrade(connection):
+    """Apply pending migrations in order; returns the list of versions applied"""
+    applied = []
+    current = schema_version(connection)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            if callable(statement):
+                statement(connection)
+            else:
+                connection.execute(text(statement))
+        # PRAGMA does not take bound parameters; version is a trusted int
+        connection.execute(text(f'PRAGMA user_version = {int(version)}'))
+        applied.append(version)
+    return applied
+
+
+def upgrade_database(db, engine=None):
+    """Bring the Flask-SQLAlchemy database (or another of its engines) up to the latest migration"""
+    with (engine or db.engine).begin() as connection:
+        return upgrade(connection)
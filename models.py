@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-db = SQLAlchemy()
+from facilities import FacilitySession
+
+# Sessions follow the current facility's database (see facilities.py)
+db = SQLAlchemy(session_options={'class_': FacilitySession})
 
 class RasanRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,6 +15,11 @@ class RasanRecord(db.Model):
     medical_m = db.Column(db.Integer, nullable=False, default=0)
     medical_f = db.Column(db.Integer, nullable=False, default=0)
 
+    # Covers the head-count range scan so reports never touch the table rows
+    __table_args__ = (
+        db.Index('ix_rasan_record_date_counts', 'date', 'kedi_m', 'kedi_f', 'tifin_m', 'tifin_f', 'medical_m', 'medical_f'),
+    )
+
     def __repr__(self):
         return f'<RasanRecord {self.date}>'
 
@@ -44,11 +52,20 @@ class StockInventory(db.Model):
     quantity = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
+    source_ref = db.Column(db.String(64))  # Client reference for idempotent API upserts
     
     stock_item = db.relationship('StockItem', backref='inventory')
+
+    # Covers the per-item date range and SUM(quantity) report queries
+    __table_args__ = (
+        db.Index('ix_stock_inventory_item_date', 'stock_item_id', 'date', 'quantity'),
+        db.Index('ux_stock_inventory_source_ref', 'source_ref', unique=True),
+        db.Index('ix_stock_inventory_date', 'date'),  # (date, rowid) order for the keyset list
+    )
     
     def __repr__(self):
-        return f'<StockInventory {self.stock_item.item_name} {self.quantity}{self.stock_item.unit}>'
+        # Ids only: a repr must not lazy-load the item
+        return f'<StockInventory {self.stock_item_id} {self.date} {self.quantity}>'
 class ScaleEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id'), nullable=False)
@@ -64,6 +81,60 @@ class ScaleEntry(db.Model):
     
     stock_item = db.relationship('StockItem', backref='scale_entries')
 
+    # Serves the per-item overlap checks in add_scale/edit_scale and the report range lookup
+    __table_args__ = (
+        db.Index('ix_scale_entry_item_range', 'stock_item_id', 'start_date', 'end_date'),
+    )
+
+
+    def __repr__(self):
+        return f'<ScaleEntry {self.stock_item_id} {self.start_date}-{self.end_date}>'
+
+class DailyBalance(db.Model):
+    # Materialized daily ledger per item, maintained by balances.py on every write
+    id = db.Column(db.Integer, primary_key=True)
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    opening_balance = db.Column(db.Float, nullable=False, default=0.0)
+    incoming_stock = db.Column(db.Float, nullable=False, default=0.0)
+    consumption = db.Column(db.Float, nullable=False, default=0.0)
+    closing_balance = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (db.UniqueConstraint('stock_item_id', 'date'),)
+
+    def __repr__(self):
+        return f'<DailyBalance {self.stock_item_id} {self.date} {self.closing_balance}>'
+
+
+class DataVersion(db.Model):
+    # Change counters bumped by the write routes (see data_versions.py)
+    scope = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DataVersion {self.scope} {self.version}>'
+
+
+class PeriodAggregate(db.Model):
+    # Per-item totals of a completed week, month or financial year (see rollups.py).
+    # Rows are never updated: a backdated write deletes the periods it touches.
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # week, month, fy
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_item.id'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)
+    opening_balance = db.Column(db.Float, nullable=False, default=0.0)
+    incoming_stock = db.Column(db.Float, nullable=False, default=0.0)
+    head_count = db.Column(db.Integer, nullable=False, default=0)  # Prisoner-days fed in the period
+    consumption = db.Column(db.Float, nullable=False, default=0.0)
+    closing_balance = db.Column(db.Float, nullable=False, default=0.0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('period', 'stock_item_id', 'period_start'),
+        db.Index('ix_period_aggregate_end', 'period_end'),
+    )
 
     def __repr__(self):
-        return f'<ScaleEntry {self.stock_item.item_name} {self.start_date}-{self.end_date}>'
\ No newline at end of file
+        return f'<PeriodAggregate {self.period} {self.stock_item_id} {self.period_start}>'
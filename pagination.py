@@ -0,0 +1,60 @@
+from datetime import date
+from sqlalchemy import tuple_
+from data_versions import get_versions
+
+
+class KeysetPage:
+    """One page of a list ordered newest first on (date, id), addressed by cursors.
+
+    A cursor is the (date, id) of the row next to the page boundary, so every
+    page is an index range scan, however deep it is; there is no OFFSET and
+    no COUNT(*) per view.
+    """
+
+    def __init__(self, query, date_column, id_column, per_page=10, after=None, before=None):
+        key = tuple_(date_column, id_column)
+        if before:
+            # Walking back: read the previous page oldest first, then flip it
+            rows = query.filter(key > tuple_(*before))\
+                        .order_by(date_column.asc(), id_column.asc())\
+                        .limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.items = rows[:per_page][::-1]
+            self.has_next = True
+        else:
+            if after:
+                query = query.filter(key < tuple_(*after))
+            rows = query.order_by(date_column.desc(), id_column.desc())\
+                        .limit(per_page + 1).all()
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+            self.has_prev = after is not None
+        self.per_page = per_page
+        self.total = None
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.items[0]) if self.has_prev and self.items else None
+
+
+def encode_cursor(row):
+    return f'{row.date.isoformat()}.{row.id}'
+
+
+def decode_cursor(value):
+    """Parse a 'YYYY-MM-DD.id' cursor; None when missing or malformed"""
+    try:
+        day, row_id = (value or '').split('.')
+        return date.fromisoformat(day), int(row_id)
+    except ValueError:
+        return None
+
+
+def cached_count(cache, table, filters, query):
+    """Row count of a filtered list, cached until the table's data version changes"""
+    version = get_versions([table])[table]
+    return cache.get_or_compute(('count', table, filters, version), query.count)
@@ -0,0 +1,145 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ReportCache:
+    """Size-bounded LRU cache for computed reports, optionally backed by a local SQLite file.
+
+    Keys must already contain the data version (see data_versions.report_version),
+    so entries never need explicit invalidation; stale ones simply age out.
+    Values are stored pickled, which bounds them by their real size and lets
+    several worker processes share the backing file. With namespace (a
+    callable, e.g. the current facility) every key is stored under its value.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, path=None, namespace=None):
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.path = path
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'file_hits': 0, 'misses': 0, 'evictions': 0, 'skipped': 0}
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS report_cache '
+                             '(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection to the backing file, committed and closed on exit"""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def accepts(self, size):
+        """Whether a value of size bytes is small enough to cache"""
+        return size <= self.max_entry_bytes
+
+    def _remember(self, key, blob):
+        """Insert into the in-memory LRU and evict from the cold end (caller holds the lock)"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats['evictions'] += 1
+
+    def _key(self, key):
+        return key if self.namespace is None else (self.namespace(), key)
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        key = self._key(key)
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memory_hits'] += 1
+                return pickle.loads(blob)
+
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value FROM report_cache WHERE key = ?', (repr(key),)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE report_cache SET accessed = ? WHERE key = ?', (time.time(), repr(key)))
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0])
+                    self._stats['hits'] += 1
+                    self._stats['file_hits'] += 1
+                return pickle.loads(row[0])
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Cache value under key unless it is too large; returns whether it was stored"""
+        key = self._key(key)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if not self.accepts(len(blob)):
+            with self._lock:
+                self._stats['skipped'] += 1
+            return False
+        with self._lock:
+            self._remember(key, blob)
+
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO report_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                             (repr(key), blob, len(blob), time.time()))
+                # Same bounds as memory: keep the most recently used entries that fit
+                conn.execute('''DELETE FROM report_cache WHERE key IN (
+                                    SELECT key FROM (
+                                        SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS running,
+                                               ROW_NUMBER() OVER (ORDER BY accessed DESC) AS rank
+                                        FROM report_cache)
+                                    WHERE running > ? OR rank > ?)''',
+                             (self.max_bytes, self.max_entries))
+        return True
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and caching it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """Drop every entry from memory and the backing file"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM report_cache')
+
+    def stats(self):
+        """Hit/miss counters for this process plus current size"""
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes,
+                         max_entries=self.max_entries, max_bytes=self.max_bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        if self.path:
+            with self._connect() as conn:
+                stats['file_entries'], stats['file_bytes'] = conn.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM report_cache').fetchone()
+        return stats
@@ -0,0 +1,134 @@
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from models import db, PeriodAggregate
+from ledger import build_stock_matrix
+
+# Rollup periods and their titles
+PERIODS = {'week': 'Weekly', 'month': 'Monthly', 'fy': 'Financial Year'}
+
+# The financial year starts on 1 April
+FY_START_MONTH = 4
+
+# Stored per item and period; the rest of a rollup row is (item, period) metadata
+AGGREGATE_FIELDS = ['opening_balance', 'incoming_stock', 'head_count', 'consumption', 'closing_balance']
+
+
+def period_start(day, period):
+    """First day of the week (Monday), month or financial year containing day"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    year = day.year if day.month >= FY_START_MONTH else day.year - 1
+    return date(year, FY_START_MONTH, 1)
+
+
+def next_period_start(start, period):
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start.replace(year=start.year + 1)
+
+
+def period_bounds(period, start_date, end_date):
+    """(start, end) of every whole period overlapping start_date..end_date, in order"""
+    bounds = []
+    start = period_start(start_date, period)
+    while start <= end_date:
+        following = next_period_start(start, period)
+        bounds.append((start, following - timedelta(days=1)))
+        start = following
+    return bounds
+
+
+def period_label(period, start):
+    if period == 'week':
+        return f'Week {start.isocalendar()[1]}, {start.strftime("%d-%m-%Y")}'
+    if period == 'month':
+        return start.strftime('%b %Y')
+    return f'FY {start.year}-{(start.year + 1) % 100:02d}'
+
+
+def compute_rollups(items, bounds):
+    """Rollup rows for consecutive periods, resampled from one items x days ledger"""
+    first_day, last_day = bounds[0][0], bounds[-1][1]
+    matrix = build_stock_matrix(items, first_day, last_day)
+    starts = np.array([(start - first_day).days for start, _ in bounds])
+    ends = np.array([(end - first_day).days for _, end in bounds])
+    columns = {
+        'opening_balance': matrix.opening_balance[:, starts],
+        'incoming_stock': np.add.reduceat(matrix.incoming_stock, starts, axis=1),
+        'consumption': np.add.reduceat(matrix.consumption, starts, axis=1),
+        'closing_balance': matrix.closing_balance[:, ends]
+    }
+    head_counts = np.add.reduceat(matrix.kedi_total, starts).tolist()
+    rows = []
+    for index, item in enumerate(items):
+        values = {key: column[index].tolist() for key, column in columns.items()}
+        for p, (start, end) in enumerate(bounds):
+            rows.append(dict(
+                {key: values[key][p] for key in values},
+                stock_item_id=item.id, period_start=start, period_end=end, head_count=int(head_counts[p])
+            ))
+    return rows
+
+
+def load_rollups(items, period, start_date, end_date, today):
+    """Rollup rows of the items for every period overlapping the range.
+
+    Completed periods come from PeriodAggregate; any period not stored for
+    every item, and the period still in progress, are computed from the
+    ledger in one pass and the completed ones stored for next time.
+    """
+    bounds = period_bounds(period, start_date, end_date)
+    if not bounds or not items:
+        return []
+    # Ids up front: storing commits, which expires the ORM items
+    item_ids = [item.id for item in items]
+    columns = ['stock_item_id', 'period_start', 'period_end'] + AGGREGATE_FIELDS
+    table = PeriodAggregate.__table__
+    query = select(*(table.c[name] for name in columns)).where(
+        table.c.period == period,
+        table.c.stock_item_id.in_(item_ids),
+        table.c.period_start.between(bounds[0][0], bounds[-1][0])
+    )
+    stored = {(row[0], row[1]): dict(zip(columns, row)) for row in db.session.execute(query)}
+
+    missing = [i for i, (start, end) in enumerate(bounds)
+               if end >= today or any((item_id, start) not in stored for item_id in item_ids)]
+    rows = dict(stored)
+    if missing:
+        computed = compute_rollups(items, bounds[missing[0]:missing[-1] + 1])
+        store_rollups(period, [row for row in computed
+                               if row['period_end'] < today and (row['stock_item_id'], row['period_start']) not in stored])
+        rows.update(((row['stock_item_id'], row['period_start']), row) for row in computed)
+    return [rows[(item_id, start)] for item_id in item_ids for start, _ in bounds]
+
+
+def store_rollups(period, rows):
+    """Persist aggregates of completed periods; skipped if the write lock is busy"""
+    if not rows:
+        return
+    now = datetime.utcnow()
+    try:
+        db.session.execute(insert(PeriodAggregate).on_conflict_do_nothing(), [
+            dict({key: row[key] for key in AGGREGATE_FIELDS}, period=period, stock_item_id=row['stock_item_id'],
+                 period_start=row['period_start'], period_end=row['period_end'], computed_at=now)
+            for row in rows
+        ])
+        db.session.commit()
+    except OperationalError:
+        # Another worker is writing; the periods are computed again next time
+        db.session.rollback()
+
+
+def invalidate_rollups(from_date, item_ids=None):
+    """Drop stored periods a write dated from_date can change (call before commit)"""
+    query = PeriodAggregate.query.filter(PeriodAggregate.period_end >= from_date)
+    if item_ids is not None:
+        query = query.filter(PeriodAggregate.stock_item_id.in_(item_ids))
+    query.delete(synchronize_session=False)
@@ -0,0 +1,141 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from itertools import chain
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, ScaleEntry
+from data_versions import get_versions
+from facilities import current_facility
+
+# Scale columns in the order returned by date.weekday()
+WEEKDAY_COLUMNS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Per-item indexes, cached until the scale_entry data version moves on
+# (another worker process may have written scales since they were built).
+# Item ids are only unique within a facility database, hence one cache each.
+_caches = {}
+
+
+def _cache():
+    """{'version': ..., 'indexes': {item_id: ScaleIndex}} of the current facility"""
+    return _caches.setdefault(current_facility(), {'version': None, 'indexes': {}})
+
+
+def _scale_changes(session):
+    return any(isinstance(obj, ScaleEntry) for obj in chain(session.new, session.dirty, session.deleted))
+
+
+# Sessions remember flushing scale changes until the transaction ends
+@event.listens_for(Session, 'after_flush')
+def _note_scale_flush(session, flush_context):
+    if _scale_changes(session):
+        session.info['scale_entry_flushed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_scale_flush(session):
+    session.info.pop('scale_entry_flushed', None)
+
+
+def _uncommitted_scales():
+    """True while db.session holds scale changes that may yet be rolled back"""
+    session = db.session()
+    return session.info.get('scale_entry_flushed', False) or _scale_changes(session)
+
+
+class ScaleIndex:
+    """Sorted, non-overlapping scale intervals for one item, searched by bisection"""
+
+    def __init__(self, entries):
+        self.starts = []
+        self.ends = []
+        weeks = []
+        for entry in sorted(entries, key=lambda e: (e.start_date, e.id)):
+            start, end = entry.start_date.toordinal(), entry.end_date.toordinal()
+            # add_scale/edit_scale reject overlaps; clip any older ones so the earliest entry wins
+            if self.ends and start <= self.ends[-1]:
+                start = self.ends[-1] + 1
+            if start > end:
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            weeks.append([getattr(entry, day) or 0.0 for day in WEEKDAY_COLUMNS])
+        self.weeks = np.array(weeks, dtype=float).reshape(-1, 7)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, day):
+        """Ration for a single day, 0.0 when no entry covers it"""
+        ordinal = day.toordinal()
+        i = bisect_right(self.starts, ordinal) - 1
+        if i < 0 or self.ends[i] < ordinal:
+            return 0.0
+        return float(self.weeks[i, day.weekday()])
+
+    def span(self, start_date, end_date):
+        """Positions [lo, hi) of the intervals overlapping the date range"""
+        # Intervals don't overlap, so the ends are sorted as well
+        lo = bisect_left(self.ends, start_date.toordinal())
+        hi = bisect_right(self.starts, end_date.toordinal())
+        return lo, max(lo, hi)
+
+    def daily_array(self, start_date, day_count):
+        """Dense per-day ration array for day_count days from start_date"""
+        values = np.zeros(day_count)
+        if not day_count:
+            return values
+        lo, hi = self.span(start_date, start_date + timedelta(days=day_count - 1))
+        first = start_date.toordinal()
+        weekdays = (start_date.weekday() + np.arange(day_count)) % 7
+        for i in range(lo, hi):
+            a = max(self.starts[i] - first, 0)
+            b = min(self.ends[i] - first, day_count - 1) + 1
+            values[a:b] = self.weeks[i, weekdays[a:b]]
+        return values
+
+
+def scale_indexes(item_ids):
+    """Return {item_id: ScaleIndex}, loading uncached items in one query.
+
+    Inside a transaction that writes scales, indexes are built from its own
+    rows and neither read from nor stored in the cache: the rows, and the
+    version they would be cached under, disappear if the commit fails.
+    """
+    if _uncommitted_scales():
+        return {item_id: ScaleIndex(entries) for item_id, entries in _load_entries(item_ids).items()}
+    version = get_versions(['scale_entry'])['scale_entry']
+    cache = _cache()
+    if version != cache['version']:
+        cache['indexes'] = {}
+        cache['version'] = version
+    cached = cache['indexes']
+    indexes = {item_id: cached.get(item_id) for item_id in item_ids}
+    missing = [item_id for item_id, index in indexes.items() if index is None]
+    if missing:
+        for item_id, entries in _load_entries(missing).items():
+            indexes[item_id] = cached[item_id] = ScaleIndex(entries)
+    return indexes
+
+
+def _load_entries(item_ids):
+    """{item_id: [ScaleEntry]} in one query"""
+    entries = {item_id: [] for item_id in item_ids}
+    for entry in ScaleEntry.query.filter(ScaleEntry.stock_item_id.in_(entries)):
+        entries[entry.stock_item_id].append(entry)
+    return entries
+
+
+def get_scale_index(item_id):
+    """Return the cached ScaleIndex for one item"""
+    return scale_indexes([item_id])[item_id]
+
+
+def invalidate_scale_index(item_id=None):
+    """Drop the cached index for one item, or for all items"""
+    if item_id is None:
+        _cache()['indexes'].clear()
+    else:
+        _cache()['indexes'].pop(item_id, None)
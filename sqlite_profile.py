@@ -0,0 +1,87 @@
+import os
+from functools import wraps
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+# Connection profiles. 'production' lets report reads run alongside clerks'
+# writes (WAL) and makes writers wait for the lock instead of failing;
+# 'default' leaves SQLite and the pool as they come.
+PROFILES = ('production', 'default')
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def sqlite_pragmas(profile):
+    """PRAGMAs run on every new connection for the profile"""
+    if profile != 'production':
+        return {}
+    return {
+        'journal_mode': 'WAL',  # readers never block the writer and vice versa
+        'synchronous': 'NORMAL',  # durable at checkpoints; safe with WAL
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 10000),  # wait for the write lock
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),  # negative = KiB per connection
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(profile, uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the profile"""
+    if profile != 'production' or not uri.startswith('sqlite') or ':memory:' in uri:
+        return {}
+    # One pooled connection per worker thread; SQLite itself serializes writers
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'connect_args': {'check_same_thread': False},
+    }
+
+
+def apply_profile(engine, profile):
+    """Install the profile's connect-time PRAGMAs and transaction handling on engine"""
+    if engine.dialect.name != 'sqlite' or profile != 'production':
+        return
+    pragmas = sqlite_pragmas(profile)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # SQLAlchemy emits BEGIN itself (see on_begin), so pysqlite must not
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        # Write transactions take the lock at BEGIN, waiting up to busy_timeout.
+        # A deferred transaction that reads first can instead fail with
+        # "database is locked" when another writer commits in between.
+        mode = connection.get_execution_options().get('sqlite_begin')
+        if mode is None:
+            # Set by write_transaction for every transaction of the request
+            mode = g.get('sqlite_begin', 'DEFERRED') if has_app_context() else 'DEFERRED'
+        connection.exec_driver_sql(f'BEGIN {mode}')
+
+
+def write_transaction(db, methods=('POST', 'PUT', 'PATCH', 'DELETE')):
+    """Decorator for views that write: their transactions start with BEGIN IMMEDIATE.
+
+    That holds for every transaction the request opens, not only the first:
+    imports commit batch by batch and refresh the ledger in a transaction
+    of its own. Only requests whose method is in methods take the write
+    lock; a GET that renders a form must not make other writers wait.
+    Views that write on GET (the delete links) list it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                g.sqlite_begin = 'IMMEDIATE'
+                db.session.connection()  # Takes the lock before the view's first read
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+from datetime import date
+import pytest
+
+# The app reads its configuration from the environment on first import
+_workdir = tempfile.mkdtemp(prefix='rasan-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'rasan.db')
+os.environ['ETAG_SALT'] = 'tests'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from balances import refresh_all_daily_balances
+from models import db, DailyBalance, StockItem, ScaleEntry
+from scale_index import invalidate_scale_index
+
+
+@pytest.fixture
+def app():
+    app_module.app.config['TESTING'] = True
+    yield app_module.app
+    # Every test starts from empty tables and caches
+    with app_module.app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        invalidate_scale_index()
+    app_module.report_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def items(app):
+    """Rice and Dal, each with a 2024 ration scale; returns their ids"""
+    with app.app_context():
+        rows = [StockItem(item_name='Rice', unit='kg'), StockItem(item_name='Dal', unit='kg')]
+        db.session.add_all(rows)
+        db.session.flush()
+        for ration, item in ((0.4, rows[0]), (0.1, rows[1])):
+            db.session.add(ScaleEntry(stock_item_id=item.id, start_date=date(2024, 1, 1), end_date=date(2024, 12, 31),
+                                      monday=ration, tuesday=ration, wednesday=ration, thursday=ration,
+                                      friday=ration, saturday=ration, sunday=ration))
+        db.session.commit()
+        return [item.id for item in rows]
+
+
+def head_count_form(day, kedi_m=100):
+    return {'date': day, 'kedi_m': str(kedi_m), 'kedi_f': '0', 'tifin_m': '0', 'tifin_f': '0',
+            'medical_m': '0', 'medical_f': '0'}
+
+
+def balances():
+    """Materialized balances as {(item, day): (opening, incoming, consumption, closing)}"""
+    return {(row.stock_item_id, row.date): (row.opening_balance, row.incoming_stock, row.consumption, row.closing_balance)
+            for row in DailyBalance.query}
+
+
+def full_recompute():
+    """Balances rebuilt from scratch, for comparison with the incremental ones"""
+    DailyBalance.query.delete()
+    refresh_all_daily_balances(date(2000, 1, 1))
+    db.session.commit()
+    return balances()
+
+
+def assert_same(incremental, full):
+    assert incremental.keys() == full.keys()
+    for key, values in full.items():
+        assert incremental[key] == pytest.approx(values), key
@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+from conftest import assert_same, balances, full_recompute, head_count_form
+from models import db, RasanRecord, ScaleEntry, StockInventory
+
+
+def test_incremental_balances_match_full_recompute_after_back_dated_edits(app, client, items):
+    rice, dal = items
+    for offset in range(20):
+        client.post('/kedi/add', data=head_count_form((date(2024, 1, 5) + timedelta(days=offset)).isoformat()))
+    client.post('/stock_inventory/add', data={'stock_item': rice, 'quantity': '500', 'date': '2024-01-10'})
+    client.post('/stock_inventory/add', data={'stock_item': dal, 'quantity': '80', 'date': '2024-01-12'})
+    # Back-dated: a receipt and a head count before everything else
+    client.post('/stock_inventory/add', data={'stock_item': rice, 'quantity': '120', 'date': '2024-01-02'})
+    client.post('/kedi/add', data=head_count_form('2024-01-01', kedi_m=40))
+    with app.app_context():
+        receipt = StockInventory.query.filter_by(stock_item_id=dal).one()
+        record = RasanRecord.query.filter_by(date=date(2024, 1, 8)).one()
+        last = RasanRecord.query.filter_by(date=date(2024, 1, 20)).one()
+        scale = ScaleEntry.query.filter_by(stock_item_id=rice).one()
+        receipt_id, record_id, last_id, scale_id = receipt.id, record.id, last.id, scale.id
+    client.post(f'/kedi/edit/{record_id}', data=head_count_form('2024-01-08', kedi_m=250))
+    client.get(f'/kedi/delete/{last_id}')
+    client.post(f'/scale/edit/{scale_id}', data={'stock_item': rice, 'start_date': '2024-01-06', 'end_date': '2024-12-31',
+                                                 'monday': '0.5', 'tuesday': '0.5', 'wednesday': '0.5', 'thursday': '0.5',
+                                                 'friday': '0.5', 'saturday': '0.5', 'sunday': '0.5'})
+    # Move a receipt to an earlier day and to the other item
+    client.post(f'/stock_inventory/edit/{receipt_id}', data={'stock_item': rice, 'quantity': '90', 'date': '2024-01-03'})
+    with app.app_context():
+        incremental = balances()
+        assert incremental
+        assert_same(incremental, full_recompute())
+        # The edits above did land
+        assert db.session.get(StockInventory, receipt_id).stock_item_id == rice
+        assert db.session.get(ScaleEntry, scale_id).start_date == date(2024, 1, 6)
@@ -0,0 +1,34 @@
+from datetime import date
+from openpyxl import load_workbook
+import export
+from export import AllItemsReportExporter
+from models import db, StockItem
+
+
+def add_items(app, count):
+    with app.app_context():
+        db.session.add_all(StockItem(item_name=f'Item {n:03}', unit='kg') for n in range(count))
+        db.session.commit()
+
+
+def test_all_items_excel_puts_every_item_on_one_sheet(app):
+    # More items than a process may hold temp files open for, one per sheet
+    add_items(app, 300)
+    with app.app_context():
+        output = AllItemsReportExporter(date(2024, 1, 1), date(2024, 1, 7)).export_excel()
+    workbook = load_workbook(output, read_only=True)
+    assert workbook.sheetnames == ['Summary', 'Daily Stock']
+    sections = [row[0] for row in workbook['Daily Stock'].iter_rows(values_only=True) if row[0] and '(kg)' in str(row[0])]
+    assert sections == [f'Item {n:03} (kg)' for n in range(300)]
+
+
+def test_all_items_excel_continues_past_the_row_limit(app, monkeypatch):
+    # Each week-long section takes 11 rows; three fit under 40 after the title lines
+    monkeypatch.setattr(export, 'EXCEL_MAX_ROWS', 40)
+    add_items(app, 7)
+    with app.app_context():
+        output = AllItemsReportExporter(date(2024, 1, 1), date(2024, 1, 7)).export_excel()
+    workbook = load_workbook(output, read_only=True)
+    assert workbook.sheetnames == ['Summary', 'Daily Stock', 'Daily Stock (2)', 'Daily Stock (3)']
+    for name in workbook.sheetnames[1:]:
+        assert workbook[name].max_row <= 40
@@ -0,0 +1,94 @@
+import threading
+import time
+from datetime import date
+from export_jobs import ExportJobQueue
+from models import db, StockItem
+
+
+def wait_for(queue, job_id):
+    for _ in range(100):
+        job = queue.get(job_id)
+        if not job.pending:
+            return job
+        time.sleep(0.05)
+    raise AssertionError('export job did not finish')
+
+
+def test_job_state_is_shared_between_worker_processes(app, tmp_path):
+    with app.app_context():
+        db.session.add(StockItem(item_name='Rice', unit='kg'))
+        db.session.commit()
+    # Two queues on one directory stand for two worker processes
+    worker_a = ExportJobQueue(app, str(tmp_path))
+    worker_b = ExportJobQueue(app, str(tmp_path))
+    with app.app_context():
+        job = worker_a.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+        done = wait_for(worker_b, job.id)
+        assert done.status == 'done'
+        assert done.filename == job.filename
+        with open(done.path, encoding='utf-8') as f:
+            assert 'Rice' in f.read()
+        assert worker_b.get('not-a-job-id') is None
+
+
+def test_cleanup_expires_jobs_finished_by_other_workers(app, tmp_path):
+    with app.app_context():
+        db.session.add(StockItem(item_name='Rice', unit='kg'))
+        db.session.commit()
+    worker_a = ExportJobQueue(app, str(tmp_path))
+    worker_b = ExportJobQueue(app, str(tmp_path))
+    with app.app_context():
+        job = worker_a.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+        wait_for(worker_a, job.id)
+        assert worker_b.cleanup(max_age=3600) == 0
+        assert worker_b.cleanup(max_age=-1) == 2
+        assert list(tmp_path.iterdir()) == []
+        assert worker_a.get(job.id) is not None  # Still known in memory until its own cleanup
+        worker_a.cleanup(max_age=-1)
+        assert worker_a.get(job.id) is None
+
+
+def test_identical_pending_jobs_are_shared_between_worker_processes(app, tmp_path, monkeypatch):
+    with app.app_context():
+        db.session.add(StockItem(item_name='Rice', unit='kg'))
+        db.session.commit()
+    worker_a = ExportJobQueue(app, str(tmp_path))
+    worker_b = ExportJobQueue(app, str(tmp_path))
+    release = threading.Event()
+    export = worker_a._export
+
+    def held_export(job, path):
+        release.wait(5)
+        return export(job, path)
+    monkeypatch.setattr(worker_a, '_export', held_export)
+    with app.app_context():
+        job = worker_a.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+        assert worker_b.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv').id == job.id
+        other = worker_b.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'ndjson')
+        assert other.id != job.id
+        release.set()
+        assert wait_for(worker_b, job.id).status == 'done'
+        wait_for(worker_b, other.id)
+        # Finished jobs release their claim; the next identical export is a new job
+        fresh = worker_b.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+        assert fresh.id != job.id
+        wait_for(worker_b, fresh.id)
+
+
+def test_claims_naming_finished_or_missing_jobs_are_taken_over(app, tmp_path):
+    with app.app_context():
+        db.session.add(StockItem(item_name='Rice', unit='kg'))
+        db.session.commit()
+    worker_a = ExportJobQueue(app, str(tmp_path))
+    worker_b = ExportJobQueue(app, str(tmp_path))
+    with app.app_context():
+        job = worker_a.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+        wait_for(worker_a, job.id)
+        # As if worker_a had died before releasing the claim, or its state had expired
+        claim = worker_a._claim_path(job.key)
+        for holder_id in (job.id, '0' * 32):
+            with open(claim, 'w', encoding='utf-8') as f:
+                f.write(holder_id)
+            fresh = worker_b.submit(None, date(2024, 1, 1), date(2024, 1, 31), 'csv')
+            assert fresh.id != job.id
+            assert wait_for(worker_b, fresh.id).status == 'done'
@@ -0,0 +1,21 @@
+import pytest
+from facilities import check_facility_names, parse_facilities
+
+
+def test_parse_facilities(tmp_path):
+    facilities = parse_facilities('central, north=sqlite:////data/north.db', str(tmp_path))
+    assert list(facilities) == ['central', 'north']
+    assert facilities['central'] == 'sqlite:///' + str(tmp_path / 'central.db')
+    for spec in ('a,a', 'Bad Name', '/x'):
+        with pytest.raises(ValueError):
+            parse_facilities(spec, str(tmp_path))
+
+
+@pytest.mark.parametrize('name', ['kedi', 'api', 'static', 'stock_items', 'export_jobs', 'district'])
+def test_route_segments_are_not_facility_names(app, name):
+    with pytest.raises(ValueError, match='taken by a route'):
+        check_facility_names(['central', name], app.url_map)
+
+
+def test_other_names_are_accepted(app):
+    check_facility_names(['central', 'north-jail'], app.url_map)
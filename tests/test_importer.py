@@ -0,0 +1,125 @@
+import io
+import sqlite3
+import threading
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import event
+import importer
+from conftest import assert_same, balances, full_recompute, head_count_form
+from data_versions import get_versions
+from importer import import_stock_receipts
+from models import db, DailyBalance, RasanRecord, StockInventory
+
+
+def head_count_csv(days, bad_row=None, bad_value='inf'):
+    lines = ['date,kedi_m,kedi_f']
+    for offset in range(days):
+        kedi_m = bad_value if offset + 2 == bad_row else '100'
+        lines.append(f'{date(2024, 1, 1) + timedelta(days=offset)},{kedi_m},5')
+    return '\n'.join(lines).encode()
+
+
+def upload(client, url, data, name='upload.csv'):
+    return client.post(url, data={'file': (io.BytesIO(data), name)}, headers={'Accept': 'application/json'})
+
+
+def test_non_finite_counts_are_rejected_per_row(app, client, items):
+    result = upload(client, '/kedi/import', head_count_csv(300, bad_row=120)).get_json()
+    assert (result['imported'], result['failed'], result['error']) == (299, 1, None)
+    assert result['errors'][0]['row'] == 120
+
+    result = upload(client, '/stock_inventory/import',
+                    b'item,quantity,date\nRice,nan,2024-01-01\nRice,inf,2024-01-02\nRice,5,2024-01-03\n').get_json()
+    assert (result['imported'], result['failed']) == (1, 2)
+    assert all('finite' in error['error'] for error in result['errors'])
+
+
+def test_failed_import_keeps_ledger_in_step_with_stored_batches(app, client, items):
+    client.post('/kedi/add', data=head_count_form('2023-12-31'))
+    with app.app_context():
+        version = get_versions(['rasan_record', 'ledger'])
+    client.get('/kedi')  # Shows the flash message; tagged pages come after it
+    etag = client.get('/kedi').headers['ETag']
+
+    # Undecodable bytes near the end: the first batch of 5000 rows is stored before the error
+    data = head_count_csv(6000)
+    cut = data.index(b'\n', len(data) - 3000)
+    result = upload(client, '/kedi/import', data[:cut] + b'\n\xff,1,1' + data[cut:]).get_json()
+    assert result['imported'] == 5000
+    assert 'decode' in result['error']
+
+    with app.app_context():
+        assert RasanRecord.query.count() == 5001
+        after = get_versions(['rasan_record', 'ledger'])
+        assert all(after[scope] > version[scope] for scope in version)
+        incremental = balances()
+        # Consumption on the imported days reached the balances
+        assert incremental[(items[0], date(2024, 12, 31))][2] > 0
+        assert_same(incremental, full_recompute())
+    client.get('/kedi')
+    assert client.get('/kedi', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_failed_import_before_any_batch_changes_nothing(app, client, items):
+    result = upload(client, '/kedi/import', b'\xff' + head_count_csv(10)).get_json()
+    assert result['imported'] == 0 and result['error']
+    with app.app_context():
+        assert RasanRecord.query.count() == 0 and DailyBalance.query.count() == 0
+        assert get_versions(['ledger'])['ledger'] == 0
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 100])
+def test_receipt_duplicates_do_not_depend_on_batches(app, items, batch_size):
+    rows = [(number, dict(row, item='Rice', date='2024-01-01')) for number, row in enumerate([
+        {'quantity': '5'},
+        {'quantity': '5'},  # A second delivery like the first is kept
+        {'quantity': '7', 'ref': 'GRN-1'},
+        {'quantity': '7', 'ref': 'GRN-1'},
+        {'quantity': '9', 'ref': 'GRN-2'},
+    ], start=2)]
+    with app.app_context():
+        first = import_stock_receipts(rows, batch_size=batch_size)
+        assert (first.imported, first.failed) == (4, 1)
+        assert first.errors == [{'row': 5, 'error': "duplicate ref 'GRN-1' in file"}]
+        # Re-running the file repeats only the rows without a ref
+        again = import_stock_receipts(rows, batch_size=batch_size)
+        assert (again.imported, again.failed) == (2, 3)
+        assert StockInventory.query.count() == 6
+
+
+def test_import_survives_a_write_between_batches(app, client, items, monkeypatch):
+    monkeypatch.setattr(importer, 'IMPORT_BATCH_SIZE', 10)
+    with app.app_context():
+        engine = db.engine
+    inserts = []
+    writers = []
+
+    def clerk_write():
+        # Another process saving a head count; waits for the lock like any writer
+        connection = sqlite3.connect(engine.url.database, timeout=10, isolation_level=None)
+        connection.execute("INSERT INTO rasan_record (date, kedi_m, kedi_f, tifin_m, tifin_f, medical_m, medical_f) "
+                           "VALUES ('2023-06-01', 1, 0, 0, 0, 0, 0)")
+        connection.close()
+
+    # Between the second batch's duplicate check and its insert, another connection commits
+    def before_insert(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO rasan_record'):
+            inserts.append(statement)
+            if len(inserts) == 2:
+                writer = threading.Thread(target=clerk_write)
+                writer.start()
+                writer.join(timeout=0.5)  # Blocked by the import's write lock, as it should be
+                writers.append(writer)
+
+    event.listen(engine, 'before_cursor_execute', before_insert)
+    try:
+        result = upload(client, '/kedi/import', head_count_csv(35)).get_json()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_insert)
+        for writer in writers:
+            writer.join()
+
+    assert (result['imported'], result['failed'], result['error']) == (35, 0, None)
+    with app.app_context():
+        assert RasanRecord.query.count() == 36
+        assert_same(balances(), full_recompute())
@@ -0,0 +1,38 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+OPERATOR_URLS = ['/metrics', '/report_cache/stats']
+
+
+@pytest.mark.parametrize('url', OPERATOR_URLS)
+def test_local_requests_are_answered(client, url):
+    assert client.get(url).status_code == 200
+
+
+@pytest.mark.parametrize('url', OPERATOR_URLS)
+def test_remote_requests_are_refused(client, url):
+    assert client.get(url, environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code == 404
+
+
+@pytest.mark.parametrize('url', OPERATOR_URLS)
+def test_requests_forwarded_by_an_untrusted_proxy_are_refused(client, url):
+    # nginx on the same host connects from loopback
+    assert client.get(url, headers={'X-Forwarded-For': '203.0.113.9'}).status_code == 404
+    assert client.get(url, headers={'X-Real-IP': '203.0.113.9'}).status_code == 404
+
+
+def test_trusted_proxy_passes_on_the_client_address(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRUSTED_PROXIES', 1)
+    monkeypatch.setattr(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1))
+    client = app.test_client()
+    assert client.get('/metrics', headers={'X-Forwarded-For': '127.0.0.1'}).status_code == 200
+    assert client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.9'}).status_code == 404
+
+
+@pytest.mark.parametrize('url', OPERATOR_URLS)
+def test_metrics_token_is_required_when_set(app, client, monkeypatch, url):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret')
+    remote = {'REMOTE_ADDR': '203.0.113.9'}
+    assert client.get(url).status_code == 404
+    assert client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    assert client.get(url, headers={'Authorization': 'Bearer s3cret'}, environ_base=remote).status_code == 200
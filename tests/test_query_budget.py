@@ -0,0 +1,69 @@
+from datetime import timedelta
+import pytest
+from balances import backfill_daily_balances
+from benchmarks.synthetic import populate
+from models import db
+
+ITEMS = 30
+YEARS = 1
+
+# Every view with a @query_budget and the requests that exercise it; enough
+# items and days that a per-row query would blow any budget
+BUDGET_REQUESTS = [
+    ('index', '/'),
+    ('kedi', '/kedi'),
+    ('kedi', '/kedi?start_date={mid}&end_date={last}'),
+    ('kedi', '/kedi?after={mid}.1000000'),
+    ('stock_items', '/stock_items'),
+    ('stock_inventory', '/stock_inventory'),
+    ('stock_inventory', '/stock_inventory?item_id=2&start_date={mid}'),
+    ('stock_inventory', '/stock_inventory?after={mid}.1000000'),
+    ('stock_inventory_by_item', '/stock_inventory/item/2'),
+    ('scale_list', '/scale'),
+    ('daily_stock_movement', '/daily_stock_movement'),
+    ('daily_stock_movement', '/daily_stock_movement?item_id=2&start_date={month}&end_date={last}'),
+    ('daily_stock_movement', '/daily_stock_movement?item_id=2&start_date={mid}&end_date={last}'),
+    ('daily_stock_movement', '/daily_stock_movement?item_id=all&start_date={mid}&end_date={last}'),
+    ('api_daily_stock_movement', '/api/daily_stock_movement?item_id=2&start_date={mid}&end_date={last}'),
+    ('api_daily_stock_movement', '/api/daily_stock_movement?item_id=all&start_date={mid}&end_date={last}'),
+    ('forecast', '/forecast'),
+    ('forecast', '/forecast?method=trend&horizon=180'),
+    ('api_forecast', '/api/forecast'),
+    ('planner', '/planner'),
+    ('planner', '/planner?horizon=90&head_count=500'),
+    ('api_planner', '/api/planner?horizon=90'),
+    ('rollups', '/rollups?period=month&start_date={mid}&end_date={last}'),
+    ('rollups', '/rollups?period=week&start_date={mid}&end_date={last}'),
+]
+
+
+@pytest.fixture
+def seeded(app, monkeypatch):
+    """Synthetic ledger with balances, and over-budget requests raising; returns the URL dates"""
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_STRICT', True)
+    with app.app_context():
+        first_day, last_day = populate(db.session.connection(), ITEMS, YEARS)
+        db.session.commit()
+        backfill_daily_balances()
+    mid = first_day + (last_day - first_day) / 2
+    return {'mid': mid.isoformat(), 'last': last_day.isoformat(),
+            'month': (last_day - timedelta(days=29)).isoformat()}
+
+
+def test_every_budgeted_view_is_checked(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted == {endpoint for endpoint, _ in BUDGET_REQUESTS}
+
+
+@pytest.mark.parametrize('endpoint, template', BUDGET_REQUESTS)
+def test_view_stays_within_its_query_budget(app, client, seeded, endpoint, template):
+    budget = app.view_functions[endpoint].query_budget
+    url = template.format(**seeded)
+    # Cold caches first, then warm ones as for most page views
+    for attempt in ('cold', 'warm'):
+        response = client.get(url)
+        assert response.status_code == 200, (url, attempt)
+        assert int(response.headers['X-Query-Count']) <= budget, (url, attempt)
+    revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['X-Query-Count'] == '1'
@@ -0,0 +1,35 @@
+from datetime import date
+from data_versions import bump_versions
+from models import db, ScaleEntry
+from scale_index import get_scale_index
+
+
+def scale(item_id, start, end, ration):
+    return ScaleEntry(stock_item_id=item_id, start_date=start, end_date=end, monday=ration, tuesday=ration,
+                      wednesday=ration, thursday=ration, friday=ration, saturday=ration, sunday=ration)
+
+
+def test_rolled_back_scale_writes_are_not_cached(app, items):
+    rice, _ = items
+    with app.app_context():
+        assert get_scale_index(rice).lookup(date(2025, 3, 1)) == 0.0
+        # A scale write whose commit never happens, read through autoflush
+        db.session.add(scale(rice, date(2025, 1, 1), date(2025, 12, 31), 0.3))
+        # The ledger refresh reads the index before the version is bumped
+        assert get_scale_index(rice).lookup(date(2025, 3, 1)) == 0.3
+        bump_versions('scale_entry', [rice])
+        db.session.rollback()
+        assert get_scale_index(rice).lookup(date(2025, 3, 1)) == 0.0
+
+
+def test_committed_scale_writes_reach_the_cache(app, items):
+    rice, _ = items
+    with app.app_context():
+        index = get_scale_index(rice)
+        assert get_scale_index(rice) is index
+        db.session.add(scale(rice, date(2025, 1, 1), date(2025, 12, 31), 0.3))
+        bump_versions('scale_entry', [rice])
+        db.session.commit()
+        index = get_scale_index(rice)
+        assert index.lookup(date(2025, 3, 1)) == 0.3
+        assert get_scale_index(rice) is index
@@ -0,0 +1,86 @@
+from datetime import date
+from conftest import assert_same, balances, full_recompute
+from models import RasanRecord, StockInventory
+
+
+def statuses(response):
+    assert response.status_code == 200, response.data
+    return [(result['index'], result['status']) for result in response.get_json()['results']]
+
+
+def test_head_count_upsert_outcomes(app, client, items):
+    first = client.post('/api/head_counts', json=[
+        {'date': '2024-01-01', 'kedi_m': 100},
+        {'date': '2024-01-02', 'kedi_m': 120},
+    ])
+    assert statuses(first) == [(0, 'inserted'), (1, 'inserted')]
+
+    second = client.post('/api/head_counts', json={'records': [
+        {'date': '2024-01-02', 'kedi_m': 130},
+        {'date': '2024-01-03', 'kedi_m': 90},
+        {'date': '2024-01-02', 'kedi_m': 140},  # Later record for the same date wins
+        {'date': 'yesterday', 'kedi_m': 1},
+        {'date': '2024-01-04', 'kedi_m': -1},
+        'not a record',
+    ]})
+    assert statuses(second) == [(0, 'superseded'), (1, 'inserted'), (2, 'updated'),
+                                (3, 'error'), (4, 'error'), (5, 'error')]
+    body = second.get_json()
+    assert (body['applied'], body['failed']) == (2, 3)
+    assert body['results'][0]['by'] == 2
+
+    with app.app_context():
+        assert {record.date: record.kedi_m for record in RasanRecord.query} == {
+            date(2024, 1, 1): 100, date(2024, 1, 2): 140, date(2024, 1, 3): 90}
+        assert_same(balances(), full_recompute())
+
+
+def test_stock_movement_upsert_outcomes(app, client, items):
+    rice, dal = items
+    first = client.post('/api/stock_movements', json=[
+        {'item': 'Rice', 'quantity': 50, 'date': '2024-01-05', 'ref': 'GRN-1'},
+        {'item': dal, 'quantity': 20, 'date': '2024-01-05'},
+    ])
+    assert statuses(first) == [(0, 'inserted'), (1, 'inserted')]
+
+    # The ref moves to another item and an earlier day; both items are rebalanced
+    second = client.post('/api/stock_movements', json=[
+        {'item': 'Rice', 'quantity': 60, 'date': '2024-01-04', 'ref': 'GRN-1'},
+        {'item': 'Dal', 'quantity': 30, 'date': '2024-01-02', 'ref': 'GRN-1'},
+        {'item': dal, 'quantity': 20, 'date': '2024-01-05'},  # No ref: always a new movement
+        {'item': 'Wheat', 'quantity': 1, 'date': '2024-01-05'},
+        {'item': 'Rice', 'quantity': 'lots', 'date': '2024-01-05'},
+    ])
+    assert statuses(second) == [(0, 'superseded'), (1, 'updated'), (2, 'inserted'), (3, 'error'), (4, 'error')]
+
+    with app.app_context():
+        movements = sorted((row.stock_item_id, row.date, row.quantity, row.source_ref) for row in StockInventory.query)
+        assert movements == [(dal, date(2024, 1, 2), 30, 'GRN-1'), (dal, date(2024, 1, 5), 20, None),
+                             (dal, date(2024, 1, 5), 20, None)]
+        incremental = balances()
+        assert_same(incremental, full_recompute())
+        assert not any(key[0] == rice and values[1] for key, values in incremental.items())
+
+
+def test_bad_payloads_are_refused(app, client):
+    assert client.post('/api/head_counts', json={'date': '2024-01-01'}).status_code == 400
+    assert client.post('/api/stock_movements', data='not json').status_code == 400
+
+
+def test_non_finite_numbers_are_record_errors(app, client, items):
+    # 1e400 parses to inf; NaN would bind as NULL
+    response = client.post('/api/head_counts', data='[{"date": "2024-01-01", "kedi_m": 1e400}, '
+                           '{"date": "2024-01-02", "kedi_m": NaN}, {"date": "2024-01-03", "kedi_m": 80}]',
+                           content_type='application/json')
+    assert statuses(response) == [(0, 'error'), (1, 'error'), (2, 'inserted')]
+
+    response = client.post('/api/stock_movements', json=[
+        {'item': 'Rice', 'quantity': 'nan', 'date': '2024-01-01'},
+        {'item': 'Rice', 'quantity': '-inf', 'date': '2024-01-01', 'ref': 'GRN-9'},
+        {'item': 'Rice', 'quantity': 25, 'date': '2024-01-01'},
+    ])
+    assert statuses(response) == [(0, 'error'), (1, 'error'), (2, 'inserted')]
+
+    with app.app_context():
+        assert [record.date for record in RasanRecord.query] == [date(2024, 1, 3)]
+        assert [row.quantity for row in StockInventory.query] == [25]
@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+from flask import template_rendered
+from conftest import head_count_form
+from models import db, RasanRecord
+
+
+def try_write(app):
+    """Take the write lock from another connection without waiting; the error, or None"""
+    with app.app_context():
+        path = db.engine.url.database
+    connection = sqlite3.connect(path, timeout=0, isolation_level=None)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('ROLLBACK')
+        return None
+    except sqlite3.OperationalError as e:
+        return str(e)
+    finally:
+        connection.close()
+
+
+def test_form_pages_do_not_hold_the_write_lock(app, client, items):
+    outcomes = []
+
+    # While each form renders, another writer must get the lock at once
+    def on_render(sender, template, context, **extra):
+        outcomes.append((template.name, try_write(app)))
+
+    urls = ['/kedi/add', '/stock_inventory/add', '/scale/add', '/kedi/import', '/stock_inventory/import']
+    with template_rendered.connected_to(on_render, app):
+        for url in urls:
+            assert client.get(url).status_code == 200
+    assert len(outcomes) == len(urls)
+    assert [error for _, error in outcomes] == [None] * len(urls), outcomes
+
+
+def test_concurrent_posts_both_succeed(app, items):
+    barrier = threading.Barrier(2)
+    statuses = {}
+
+    def post(day):
+        client = app.test_client()
+        barrier.wait()
+        statuses[day] = client.post('/kedi/add', data=head_count_form(day)).status_code
+
+    threads = [threading.Thread(target=post, args=(day,)) for day in ('2024-02-01', '2024-02-02')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == {'2024-02-01': 302, '2024-02-02': 302}
+    with app.app_context():
+        assert RasanRecord.query.count() == 2